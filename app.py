@@ -1,182 +1,561 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import pandas as pd
+import numpy as np
 import os
 import sys
 import time
+import fcntl
+import threading
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.inference import load_model, load_inference_data, recommend_for_user
-from src.cold_start_handler import ColdStartHandler
+from src.inference import load_serving_model, load_inference_data, recommend_for_user, recommend_for_users
+from src.cold_start_handler import ColdStartHandler, extract_region_from_zipcode
+from src.materialize import MaterializedTopK, MATERIALIZED_DIR, materialize_all, artifact_version, DATA_INPUTS
+from src.response_cache import ResponseCache
+from src.movie_catalog import MovieCatalog, encode_json
+from src.arena import load_serving_arena
+from src.embeddings import load_retriever
+from src.item_neighbors import ItemNeighbors
+from src.ingest import OnlineStats, RatingsTailer, parse_rating, append_ratings
+from src.model_registry import activate_version, current_version, list_versions, load_manifest
 
 app = Flask(__name__)
 CORS(app)
 
-MODEL = None
-FEATURE_COLS = None
-RATINGS = None
+SERVING_MODEL = None
+RATINGS_INDEX = None
+FEATURE_STORE = None
 MOVIES = None
 USER_STATS = None
 ITEM_STATS = None
 USER_GENRE_PREFS = None
 USER_ID_SET = None
 COLD_START_HANDLER = None
+CATALOG = None
+RETRIEVER = None
+ITEM_NEIGHBORS = None
+MAX_SIMILAR = 100
+ONLINE_STATS = None
+RATINGS_TAILER = None
+MAX_INGEST_RATINGS = 10000
+# Bumped for a user on each ingested rating: their cache keys change and the
+# materialized list (computed before the rating) is bypassed
+USER_GENERATION = {}
+MATERIALIZED = None
+DATA_VERSION = None
+MAX_BATCH_USERS = 10000
+MATERIALIZE_REFRESH_SECONDS = 60
+MODEL_WATCH_SECONDS = 10
+MODEL_LOCK = threading.Lock()
+# When set, /admin endpoints require it in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+RESPONSE_CACHE = ResponseCache()
+# Responses are cached at this depth so any smaller top_k reuses the entry
+RESPONSE_CACHE_DEPTH = 50
 
 def init_app():
-    global MODEL, FEATURE_COLS, RATINGS, MOVIES, USER_STATS, ITEM_STATS
-    global USER_GENRE_PREFS, USER_ID_SET, COLD_START_HANDLER
+    global SERVING_MODEL, RETRIEVER, ITEM_NEIGHBORS, MATERIALIZED, DATA_VERSION, RATINGS_TAILER
     try:
-        MODEL, FEATURE_COLS = load_model("ranker_model.pkl")
-        RATINGS, MOVIES, USER_STATS, ITEM_STATS, USER_GENRE_PREFS = load_inference_data()
-        USER_ID_SET = set(USER_STATS['UserID'].unique())
-        COLD_START_HANDLER = ColdStartHandler()
-        print("✅ SERVICE READY")
+        DATA_VERSION = artifact_version(DATA_INPUTS)
+        SERVING_MODEL = load_serving_model()
+        use_serving_data(load_serving_data(DATA_VERSION))
+        RETRIEVER = load_retriever()
+        ITEM_NEIGHBORS = ItemNeighbors.load()
+        # Replay ratings ingested since the tables were built, then follow the log
+        RATINGS_TAILER = RatingsTailer(apply_ingested)
+        RATINGS_TAILER.poll()
+        # A table built from older artifacts would disagree with the model just loaded
+        MATERIALIZED = MaterializedTopK.load()
+        if MATERIALIZED is not None and MATERIALIZED.version != artifact_version():
+            MATERIALIZED = None
+        threading.Thread(target=refresh_materialized, daemon=True).start()
+        threading.Thread(target=watch_model_registry, daemon=True).start()
+        threading.Thread(target=RATINGS_TAILER.run, daemon=True).start()
+        print(f"✅ SERVICE READY (model {SERVING_MODEL.version})")
     except Exception:
         import traceback
         traceback.print_exc()
         sys.exit(1)
 
+def load_serving_data(data_version):
+    """Every table served from the processed data artifacts, loaded together"""
+    _, movies, user_stats, item_stats, user_genre_prefs = load_inference_data(with_ratings=False)
+    # The ratings index and feature tables are memory-mapped from the shared arena,
+    # so every worker process serves from the same physical pages
+    ratings_index, feature_store = load_serving_arena(data_version)
+    catalog = MovieCatalog(movies, item_stats)
+    return {
+        "movies": movies, "user_stats": user_stats, "item_stats": item_stats,
+        "user_genre_prefs": user_genre_prefs, "ratings_index": ratings_index,
+        "feature_store": feature_store, "catalog": catalog,
+        "user_id_set": set(user_stats["UserID"].unique()),
+        "cold_start_handler": ColdStartHandler(movies=movies, item_stats=item_stats, catalog=catalog),
+        "online_stats": OnlineStats(feature_store, ratings_index, catalog)
+    }
+
+def use_serving_data(data):
+    """Switch to load_serving_data() output; ratings ingested so far are in its tables"""
+    global MOVIES, USER_STATS, ITEM_STATS, USER_GENRE_PREFS, RATINGS_INDEX, FEATURE_STORE
+    global CATALOG, USER_ID_SET, COLD_START_HANDLER, ONLINE_STATS, USER_GENERATION
+    MOVIES, USER_STATS, ITEM_STATS = data["movies"], data["user_stats"], data["item_stats"]
+    USER_GENRE_PREFS = data["user_genre_prefs"]
+    RATINGS_INDEX, FEATURE_STORE = data["ratings_index"], data["feature_store"]
+    CATALOG, USER_ID_SET = data["catalog"], data["user_id_set"]
+    COLD_START_HANDLER, ONLINE_STATS = data["cold_start_handler"], data["online_stats"]
+    USER_GENERATION = {}
+
+def refresh_materialized():
+    """Rebuild the materialized top-K whenever the model/data artifacts change.
+
+    Runs in a daemon thread; requests keep being served from the previous
+    table (or online) until the new one is swapped in. New data artifacts
+    also replace every table loaded from them, so the online path and the
+    materialized one never serve from different data.
+    """
+    while True:
+        try:
+            version = artifact_version()
+            data_version = artifact_version(DATA_INPUTS)
+            if MATERIALIZED is None or MATERIALIZED.version != version:
+                table = MaterializedTopK.load()
+                if table is None or table.version != version:
+                    table = materialize_exclusive(version)
+                if table is None or table.version != version:
+                    # Another worker process is materializing; pick its table up next round
+                    time.sleep(MATERIALIZE_REFRESH_SECONDS)
+                    continue
+                # The version covers the candidate indexes, so online scoring switches with the table
+                retriever, item_neighbors = load_retriever(), ItemNeighbors.load()
+                if data_version == DATA_VERSION:
+                    use_materialized(table, data_version, retriever, item_neighbors)
+                else:
+                    data = load_serving_data(data_version)
+                    # The new tables already hold the log up to their saved offset; replay the rest
+                    RATINGS_TAILER.restart(
+                        lambda: use_materialized(table, data_version, retriever, item_neighbors, data)
+                    )
+                    RATINGS_TAILER.poll()
+                print(f"✅ Materialized top-{table.k} ready (version {table.version})")
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        time.sleep(MATERIALIZE_REFRESH_SECONDS)
+
+def use_materialized(table, data_version, retriever, item_neighbors, data=None):
+    """Serve table, with the candidate indexes and (when data is given) the tables of its version"""
+    global MATERIALIZED, DATA_VERSION, RETRIEVER, ITEM_NEIGHBORS
+    if data is not None:
+        use_serving_data(data)
+    RETRIEVER, ITEM_NEIGHBORS = retriever, item_neighbors
+    MATERIALIZED = table
+    # New cache keys, so responses from the previous tables are not reused
+    DATA_VERSION = data_version
+
+def materialize_exclusive(version):
+    """Materialize version unless another worker process already is; returns the table or None"""
+    os.makedirs(MATERIALIZED_DIR, exist_ok=True)
+    with open(os.path.join(MATERIALIZED_DIR, ".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        table = MaterializedTopK.load()
+        if table is None or table.version != version:
+            print(f"⏳ Materializing recommendations for version {version}...")
+            materialize_all()
+            table = MaterializedTopK.load()
+        return table
+
+def reload_model(version=None):
+    """Activate version (default: re-read the registry) and swap it in atomically.
+
+    Requests already running keep the ServingModel they started with; new
+    requests see the new one. The materialized table of the previous model
+    stops being served until refresh_materialized() rebuilds it.
+    """
+    global SERVING_MODEL, MATERIALIZED
+    with MODEL_LOCK:
+        if version is not None:
+            activate_version(version)
+        serving = load_serving_model()
+        if serving.version != SERVING_MODEL.version:
+            if MATERIALIZED is not None and MATERIALIZED.version != artifact_version():
+                MATERIALIZED = None
+            SERVING_MODEL = serving
+            print(f"✅ Serving model version {serving.version}")
+        return SERVING_MODEL
+
+def watch_model_registry():
+    """Hot-reload the model when the registry's active version changes (daemon thread)"""
+    while True:
+        time.sleep(MODEL_WATCH_SECONDS)
+        try:
+            active = current_version()
+            if active is not None and active != SERVING_MODEL.version:
+                reload_model()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+def apply_ingested(events):
+    """RatingsTailer callback: update the serving tables and retire the affected users' responses"""
+    for user_id in ONLINE_STATS.apply(events):
+        USER_GENERATION[user_id] = USER_GENERATION.get(user_id, 0) + 1
+
+def user_cache_key(user_id, serving):
+    return ("user", user_id, serving.version, DATA_VERSION, USER_GENERATION.get(user_id, 0))
+
 def recommend_existing_user(user_id, top_k=10):
+    """(cache entry, error): entry is (depth, movie_ids, scores) with depth >= top_k"""
     try:
         if user_id not in USER_ID_SET:
             return None, "User not found"
 
-        recs_df = recommend_for_user(
-            user_id,
-            MODEL,
-            FEATURE_COLS,
-            RATINGS,
-            MOVIES,
-            USER_STATS,
-            ITEM_STATS,
-            USER_GENRE_PREFS,
-            top_k=top_k
+        depth = max(top_k, RESPONSE_CACHE_DEPTH)
+        serving = SERVING_MODEL
+        cached = RESPONSE_CACHE.get_or_compute(
+            user_cache_key(user_id, serving),
+            lambda: compute_existing_user(user_id, depth, serving),
+            accept=lambda entry: entry[0] >= top_k
         )
-
-        if recs_df is None or recs_df.empty:
+        if cached is None:
             return None, "No recommendations available"
 
-        results = []
-        for _, row in recs_df.iterrows():
-            ry = row["Release_Year"] if "Release_Year" in row.index else None
-            release_year = int(ry) if pd.notna(ry) else "N/A"
-
-            movie_info = MOVIES[MOVIES["MovieID"] == row["MovieID"]]
-            genres = "Movie"
-            if not movie_info.empty:
-                genre_cols = [c for c in MOVIES.columns if c not in ["MovieID", "Title", "Release_Year"]]
-                active = [g for g in genre_cols if movie_info[g].iloc[0] == 1]
-                if active:
-                    genres = "|".join(active)
-
-            avg_rating = (
-                round(float(row["item_avg_rating"]), 2)
-                if "item_avg_rating" in row.index and pd.notna(row["item_avg_rating"])
-                else 0.0
-            )
-
-            num_ratings = (
-                int(row["item_rating_count"])
-                if "item_rating_count" in row.index and pd.notna(row["item_rating_count"])
-                else 0
-            )
-
-            results.append({
-                "movie_id": int(row["MovieID"]),
-                "title": row["Title"],
-                "release_year": release_year,
-                "genres": genres,
-                "score": round(float(row["score"]), 4),
-                "avg_rating": avg_rating,
-                "num_ratings": num_ratings
-            })
-
-        return results, None
+        return cached, None
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         return None, str(e)
 
+def split_by_user(user_ids, movie_ids, scores):
+    """{user_id: (movie_ids, scores)} from long arrays where each user's rows are contiguous"""
+    user_ids, movie_ids, scores = np.asarray(user_ids), np.asarray(movie_ids), np.asarray(scores)
+    if len(user_ids) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    ends = np.r_[starts[1:], len(user_ids)]
+    return {
+        int(user_ids[start]): (movie_ids[start:end], scores[start:end])
+        for start, end in zip(starts, ends)
+    }
+
+def compute_users(user_ids, top_k, serving):
+    """{user_id: (movie_ids, scores)} top_k for known user_ids in one scoring pass.
+
+    Users with a materialized list (and no ratings ingested since) are served
+    from it, the rest are scored online with a single model call; users
+    without recommendations are absent.
+    """
+    materialized = MATERIALIZED
+    ranked = {}
+    if materialized is not None and user_ids:
+        fresh = [u for u in user_ids if u not in USER_GENERATION]
+        covered, rows = materialized.lookup(fresh, top_k)
+        ranked.update(split_by_user(rows["UserID"], rows["MovieID"], rows["score"]))
+        online = [u for u in user_ids if u in USER_GENERATION] + [u for u, c in zip(fresh, covered) if not c]
+    else:
+        online = user_ids
+
+    if online:
+        recs_df = recommend_for_users(
+            online,
+            serving.model,
+            serving.feature_cols,
+            None,
+            MOVIES,
+            USER_STATS,
+            ITEM_STATS,
+            USER_GENRE_PREFS,
+            top_k=top_k,
+            ratings_index=RATINGS_INDEX,
+            feature_store=FEATURE_STORE,
+            scorer=serving.scorer,
+            retriever=RETRIEVER,
+            item_neighbors=ITEM_NEIGHBORS
+        )
+        ranked.update(split_by_user(recs_df["UserID"], recs_df["MovieID"], recs_df["score"]))
+    return ranked
+
+def compute_existing_user(user_id, depth, serving):
+    """(depth, movie_ids, scores) of the top-depth recommendations, or None when there are none"""
+    materialized = MATERIALIZED
+    if materialized is not None and user_id not in USER_GENERATION:
+        covered, rows = materialized.lookup([user_id], depth)
+        if covered[0]:
+            return depth, rows["MovieID"], rows["score"]
+
+    recs_df = recommend_for_user(
+        user_id,
+        serving.model,
+        serving.feature_cols,
+        None,
+        MOVIES,
+        USER_STATS,
+        ITEM_STATS,
+        USER_GENRE_PREFS,
+        top_k=depth,
+        ratings_index=RATINGS_INDEX,
+        feature_store=FEATURE_STORE,
+        scorer=serving.scorer,
+        retriever=RETRIEVER,
+        item_neighbors=ITEM_NEIGHBORS
+    )
+
+    if recs_df is None or recs_df.empty:
+        return None
+
+    return depth, recs_df["MovieID"].to_numpy(), recs_df["score"].to_numpy()
+
+def is_int(value):
+    # JSON true/false arrive as bools, which Python also counts as ints
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def valid_top_k(top_k):
+    """True for a positive integer top_k"""
+    return is_int(top_k) and top_k >= 1
+
+def recommendations_json(entry, top_k):
+    """JSON text of the first top_k recommendations of a (depth, movie_ids, scores) cache entry"""
+    _, movie_ids, scores = entry
+    return CATALOG.to_json(movie_ids[:top_k], None if scores is None else scores[:top_k])
+
+def json_response(status, payload, **encoded):
+    return app.response_class(encode_json(payload, **encoded), status=status, mimetype="application/json")
+
+def health_payload():
+    return {
+        "status": "healthy",
+        "model_loaded": SERVING_MODEL is not None,
+        "materialized_version": MATERIALIZED.version if MATERIALIZED is not None else None,
+        "model_version": SERVING_MODEL.version if SERVING_MODEL is not None else None,
+        "data_version": DATA_VERSION,
+        "cache": RESPONSE_CACHE.stats(),
+        "ratings_ingested": RATINGS_TAILER.applied if RATINGS_TAILER is not None else 0,
+        "num_users": len(USER_ID_SET)
+    }
+
 @app.route("/health", methods=["GET"])
 def health():
+    return jsonify(health_payload()), 200
+
+def admin_authorized():
+    return ADMIN_TOKEN is None or request.headers.get("X-Admin-Token") == ADMIN_TOKEN
+
+@app.route("/admin/models", methods=["GET"])
+def admin_models():
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    fields = ["version", "model_class", "metrics", "data_hash", "created_at"]
+    registered = [{k: load_manifest(version).get(k) for k in fields} for version in list_versions()]
     return jsonify({
-        "status": "healthy",
-        "model_loaded": MODEL is not None,
-        "num_users": len(USER_ID_SET)
+        "serving": SERVING_MODEL.version,
+        "active": current_version(),
+        "registered": registered
     }), 200
 
+@app.route("/admin/models/reload", methods=["POST"])
+def admin_reload_model():
+    """Hot-swap to {"version": ...}, or to the registry's active version when omitted"""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    version = (request.get_json(silent=True) or {}).get("version")
+    try:
+        serving = reload_model(version)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"model_version": serving.version}), 200
+
 @app.route("/recommend", methods=["POST"])
 def recommend():
     start = time.time()
     data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     user_id = data.get("user_id")
     top_k = data.get("top_k", 10)
 
     if user_id is None:
         return jsonify({"error": "Missing user_id"}), 400
+    if not is_int(user_id):
+        return jsonify({"error": "user_id must be an integer"}), 400
+    if not valid_top_k(top_k):
+        return jsonify({"error": "top_k must be a positive integer"}), 400
 
-    recs, error = recommend_existing_user(user_id, top_k)
+    entry, error = recommend_existing_user(user_id, top_k)
     if error:
         return jsonify({"error": error}), 404
 
-    return jsonify({
+    recs = recommendations_json(entry, top_k)
+    return json_response(200, {
         "user_id": user_id,
-        "recommendations": recs,
+        "latency_ms": round((time.time() - start) * 1000, 2)
+    }, recommendations=recs)
+
+@app.route("/recommend/batch", methods=["POST"])
+def recommend_batch():
+    start = time.time()
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    user_ids = data.get("user_ids")
+    top_k = data.get("top_k", 10)
+
+    if not user_ids or not isinstance(user_ids, list):
+        return jsonify({"error": "Missing user_ids"}), 400
+    if len(user_ids) > MAX_BATCH_USERS:
+        return jsonify({"error": f"At most {MAX_BATCH_USERS} user_ids per request"}), 400
+    if not valid_top_k(top_k):
+        return jsonify({"error": "top_k must be a positive integer"}), 400
+
+    # Non-integer entries (possibly unhashable lists or objects) are reported as not found
+    known = [u for u in dict.fromkeys(u for u in user_ids if is_int(u)) if u in USER_ID_SET]
+    known_set = set(known)
+    not_found = [u for u in user_ids if not is_int(u) or u not in known_set]
+
+    try:
+        ranked = compute_users(known, top_k, SERVING_MODEL)
+        recommendations = encode_json({}, **{
+            str(user_id): CATALOG.to_json(movie_ids, scores) for user_id, (movie_ids, scores) in ranked.items()
+        })
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+    elapsed = time.time() - start
+    return json_response(200, {
+        "not_found": not_found,
+        "num_users": len(known),
+        "latency_ms": round(elapsed * 1000, 2),
+        "users_per_second": round(len(known) / elapsed, 1) if elapsed > 0 else None
+    }, recommendations=recommendations)
+
+@app.route("/ratings", methods=["POST"])
+def ingest_ratings():
+    """Record new ratings: {"ratings": [{"user_id", "movie_id", "rating", "timestamp"}, ...]} or one rating.
+
+    They are appended to the ratings log, applied to this worker's serving
+    tables before the response, and picked up by every other worker's tailer.
+    """
+    start = time.time()
+    data = request.get_json(silent=True)
+    events = data.get("ratings", [data]) if isinstance(data, dict) else None
+    if not events or not isinstance(events, list):
+        return jsonify({"error": "Missing ratings"}), 400
+    if len(events) > MAX_INGEST_RATINGS:
+        return jsonify({"error": f"At most {MAX_INGEST_RATINGS} ratings per request"}), 400
+
+    try:
+        events = [parse_rating(event) for event in events]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    unknown = sorted({movie_id for _, movie_id, _, _ in events if movie_id not in CATALOG})
+    if unknown:
+        return jsonify({"error": "Unknown movie_id", "movie_ids": unknown[:100]}), 400
+    unknown = sorted({user_id for user_id, _, _, _ in events if user_id not in USER_ID_SET})
+    if unknown:
+        return jsonify({"error": "Unknown user_id", "user_ids": unknown[:100]}), 400
+
+    append_ratings(events)
+    RATINGS_TAILER.poll()
+    return jsonify({
+        "accepted": len(events),
         "latency_ms": round((time.time() - start) * 1000, 2)
     }), 200
 
+@app.route("/similar/<int:movie_id>", methods=["GET"])
+def similar(movie_id):
+    """Movies most co-rated with movie_id ("more like this"), from the precomputed neighbor index"""
+    start = time.time()
+    try:
+        top_k = min(int(request.args.get("top_k", 10)), MAX_SIMILAR)
+    except ValueError:
+        return jsonify({"error": "Invalid top_k"}), 400
+    if top_k < 1:
+        return jsonify({"error": "top_k must be at least 1"}), 400
+
+    item_neighbors = ITEM_NEIGHBORS
+    if item_neighbors is None:
+        return jsonify({"error": "Item neighbors not built"}), 503
+    if movie_id not in item_neighbors:
+        return jsonify({"error": "Movie not found"}), 404
+
+    movie_ids, similarities = item_neighbors.neighbors(movie_id, top_k)
+    recs = CATALOG.to_json(movie_ids, similarities)
+    return json_response(200, {
+        "movie_id": movie_id,
+        "latency_ms": round((time.time() - start) * 1000, 3)
+    }, similar=recs)
+
 @app.route("/recommend/new-user", methods=["POST"])
 def recommend_new_user():
     start = time.time()
     data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     demo = data.get("demographics")
     top_k = data.get("top_k", 10)
 
     if not demo:
         return jsonify({"error": "Missing demographics"}), 400
+    if not valid_top_k(top_k):
+        return jsonify({"error": "top_k must be a positive integer"}), 400
 
     try:
-        recs_df = COLD_START_HANDLER.recommend(user_demographics=demo, top_k=top_k)
-        if recs_df is None or recs_df.empty:
+        demo = normalize_demographics(demo)
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({"error": "Invalid demographics"}), 400
+
+    try:
+        cached = recommend_new_user_cached(demo, top_k)
+        if cached is None:
             return jsonify({"error": "No recommendations generated"}), 500
 
-        results = []
-        for _, row in recs_df.iterrows():
-            ry = row["Release_Year"] if "Release_Year" in row.index else None
-            release_year = int(ry) if pd.notna(ry) else "N/A"
-
-            avg_rating = (
-                round(float(row["item_avg_rating"]), 2)
-                if "item_avg_rating" in row.index and pd.notna(row["item_avg_rating"])
-                else 0.0
-            )
-
-            num_ratings = (
-                int(row["item_rating_count"])
-                if "item_rating_count" in row.index and pd.notna(row["item_rating_count"])
-                else 0
-            )
-
-            results.append({
-                "title": row["Title"],
-                "release_year": release_year,
-                "genres": str(row["Genres"]) if "Genres" in row.index else "Movie",
-                "avg_rating": avg_rating,
-                "num_ratings": num_ratings
-            })
-
-        return jsonify({
-            "recommendations": results,
+        recs = recommendations_json(cached, top_k)
+        return json_response(200, {
             "latency_ms": round((time.time() - start) * 1000, 2)
-        }), 200
+        }, recommendations=recs)
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def recommend_new_user_cached(demo, top_k):
+    """Cached (depth, movie_ids, None) for normalized demographics, or None"""
+    # Only the region of a zipcode matters; the regional blend depends on top_k
+    region = extract_region_from_zipcode(demo["zipcode"]) if demo["zipcode"] else None
+    depth = top_k if region else max(top_k, RESPONSE_CACHE_DEPTH)
+    key = ("new-user", demo["gender"], demo["age"], demo["occupation"], region,
+           top_k if region else None, DATA_VERSION)
+    return RESPONSE_CACHE.get_or_compute(
+        key,
+        lambda: compute_new_user(demo, depth),
+        accept=lambda entry: entry[0] >= top_k
+    )
+
+def normalize_demographics(demo):
+    zipcode = demo.get("zipcode")
+    return {
+        "gender": str(demo.get("gender", "M")).upper(),
+        "age": int(demo.get("age", 25)),
+        "occupation": int(demo.get("occupation", 0)),
+        "zipcode": str(zipcode).strip() if zipcode else None
+    }
+
+def compute_new_user(demo, depth):
+    """(depth, movie_ids, None) of the cold-start recommendations, or None when there are none"""
+    movie_ids = COLD_START_HANDLER.recommend_ids(user_demographics=demo, top_k=depth)
+    if not movie_ids:
+        return None
+    return depth, np.array(movie_ids, dtype=np.int64), None
+
 if __name__ == "__main__":
     init_app()
     app.run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,163 @@
+# ASGI variant of the API, e.g. `uvicorn asgi:app --host 0.0.0.0 --port 5000`
+#
+# Concurrent POST /recommend calls are queued into a MicroBatcher and scored
+# together: one feature matrix and one model call per batch, run in a worker
+# thread. GET /metrics (and /health) report batch sizes and queue waits. All
+# other endpoints are served by the Flask app, so their behaviour is identical.
+
+import os
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+import app as service
+from src.micro_batcher import MicroBatcher
+
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", 64))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", 5))
+# Threads for the endpoints delegated to Flask (scoring batches have their own thread)
+WSGI_THREADS = 8
+
+def score_users(items):
+    """MicroBatcher callback: [(user_id, depth, serving)] -> [(depth, movie_ids, scores) or None]"""
+    results = {}
+    by_model = {}
+    for user_id, depth, serving in items:
+        by_model.setdefault(serving.version, (serving, {}))[1][user_id] = depth
+    for serving, depths in by_model.values():
+        depth = max(depths.values())
+        ranked = service.compute_users(list(depths), depth, serving)
+        for user_id in depths:
+            entry = (depth, *ranked[user_id]) if user_id in ranked else None
+            if entry is not None:
+                service.RESPONSE_CACHE.put(service.user_cache_key(user_id, serving), entry)
+            results[serving.version, user_id] = entry
+    return [results[serving.version, user_id] for user_id, _, serving in items]
+
+BATCHER = MicroBatcher(score_users, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+WSGI_EXECUTOR = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+# ----------------------------
+# Endpoints
+# ----------------------------
+async def recommend(body):
+    start = time.time()
+    data = json.loads(body or b"{}") or {}
+    if not isinstance(data, dict):
+        return 400, {"error": "Request body must be a JSON object"}
+    user_id = data.get("user_id")
+    top_k = data.get("top_k", 10)
+
+    if user_id is None:
+        return 400, {"error": "Missing user_id"}
+    if not service.is_int(user_id):
+        return 400, {"error": "user_id must be an integer"}
+    if not service.valid_top_k(top_k):
+        return 400, {"error": "top_k must be a positive integer"}
+
+    try:
+        if user_id not in service.USER_ID_SET:
+            return 404, {"error": "User not found"}
+        serving = service.SERVING_MODEL
+        entry = service.RESPONSE_CACHE.get(
+            service.user_cache_key(user_id, serving), accept=lambda e: e[0] >= top_k
+        )
+        if entry is None:
+            entry = await BATCHER.submit((user_id, max(top_k, service.RESPONSE_CACHE_DEPTH), serving))
+        if entry is None:
+            return 404, {"error": "No recommendations available"}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return 404, {"error": str(e)}
+
+    recs = service.recommendations_json(entry, top_k)
+    return 200, service.encode_json({
+        "user_id": user_id,
+        "latency_ms": round((time.time() - start) * 1000, 2)
+    }, recommendations=recs)
+
+async def call_flask(scope, body):
+    """Run one request through the Flask app in a worker thread"""
+    headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+    environ = EnvironBuilder(
+        path=scope["path"], method=scope["method"], headers=headers,
+        query_string=scope.get("query_string", b"").decode("latin-1"), data=body
+    ).get_environ()
+
+    def run():
+        app_iter, status, response_headers = run_wsgi_app(service.app, environ)
+        try:
+            return status, response_headers, b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    loop = asyncio.get_running_loop()
+    status, response_headers, payload = await loop.run_in_executor(WSGI_EXECUTOR, run)
+    return int(status.split()[0]), list(response_headers.items()), payload
+
+# ----------------------------
+# ASGI plumbing
+# ----------------------------
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+async def send_response(send, status, headers, payload):
+    await send({
+        "type": "http.response.start", "status": status,
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+async def send_json(send, status, payload):
+    """payload: a JSON-serializable object, or JSON text that is already encoded"""
+    body = (payload if isinstance(payload, str) else json.dumps(payload)).encode()
+    await send_response(send, status, [("content-type", "application/json")], body)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, service.init_app)
+            except BaseException as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    route = (scope["method"], scope["path"])
+    body = await read_body(receive)
+    if route == ("POST", "/recommend"):
+        try:
+            status, payload = await recommend(body)
+        except ValueError:
+            status, payload = 400, {"error": "Invalid JSON"}
+        await send_json(send, status, payload)
+    elif route == ("GET", "/metrics"):
+        metrics = {"microbatch": BATCHER.stats(), "cache": service.RESPONSE_CACHE.stats()}
+        await send_json(send, 200, metrics)
+    elif route == ("GET", "/health"):
+        await send_json(send, 200, dict(service.health_payload(), microbatch=BATCHER.stats()))
+    else:
+        await send_response(send, *await call_flask(scope, body))
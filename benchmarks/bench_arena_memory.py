@@ -0,0 +1,74 @@
+# benchmarks/bench_arena_memory.py
+#
+# Memory of N serving processes holding the ratings index + feature store,
+# private copies vs the shared memory-mapped arena (Linux: reads /proc PSS).
+# Usage: python benchmarks/bench_arena_memory.py [--workers 4]
+
+import os
+import sys
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference import load_inference_data, load_feature_store
+from ratings_index import RatingsIndex
+from arena import load_serving_arena
+
+def memory_mb():
+    """(RSS, PSS) of this process in MB; PSS splits shared pages between their users"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return values["Rss"], values["Pss"]
+
+def touch(ratings_index, feature_store):
+    # Fault every page in, as a worker does once it has served enough traffic
+    arrays = list(ratings_index.to_arrays().values()) + list(feature_store.to_arrays()[0].values())
+    return sum(float(a.sum()) for a in arrays)
+
+def worker(mode, ready, done, results):
+    if mode == "arena":
+        ratings_index, feature_store = load_serving_arena()
+    else:
+        ratings_index = RatingsIndex.from_ratings(load_inference_data()[0])
+        feature_store = load_feature_store()
+    touch(ratings_index, feature_store)
+    ready.wait()
+    results.put(memory_mb())
+    done.wait()
+
+def measure(mode, n_workers):
+    context = multiprocessing.get_context("spawn")
+    ready, done, results = context.Barrier(n_workers + 1), context.Event(), context.Queue()
+    procs = [context.Process(target=worker, args=(mode, ready, done, results)) for _ in range(n_workers)]
+    for p in procs:
+        p.start()
+    ready.wait()
+    # All workers are alive while they report, so PSS reflects the sharing
+    stats = [results.get() for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    return sum(r for r, _ in stats), sum(p for _, p in stats)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    load_serving_arena()  # build it up front if needed
+    print("="*70)
+    print(f"SERVING MEMORY: {args.workers} worker processes")
+    print("="*70)
+    for mode in ("private", "arena"):
+        rss, pss = measure(mode, args.workers)
+        print(f"{mode:>8}: total RSS {rss:8.1f} MB   total PSS {pss:8.1f} MB   "
+              f"({pss / args.workers:6.1f} MB PSS per worker)")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# benchmarks/bench_batch_recommend.py
+#
+# Throughput of per-user recommend_for_user calls vs one recommend_for_users batch.
+# Usage: python benchmarks/bench_batch_recommend.py [--users 1000] [--top-k 10]
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference import (
+    load_model, load_inference_data, load_feature_store, recommend_for_user, recommend_for_users
+)
+from ratings_index import RatingsIndex
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    model, feature_cols = load_model("ranker_model.pkl")
+    ratings, movies, user_stats, item_stats, user_genre_prefs = load_inference_data()
+    ratings_index = RatingsIndex.from_ratings(ratings)
+    feature_store = load_feature_store()
+    user_ids = ratings_index.user_ids[:args.users].tolist()
+    data = (ratings, movies, user_stats, item_stats, user_genre_prefs)
+    serving = {"ratings_index": ratings_index, "feature_store": feature_store}
+
+    print("="*70)
+    print(f"BATCH RECOMMENDATION BENCHMARK: {len(user_ids):,} users, top_k={args.top_k}")
+    print("="*70)
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        recommend_for_user(user_id, model, feature_cols, *data, top_k=args.top_k, **serving)
+    t_loop = time.perf_counter() - start
+    print(f"recommend_for_user loop : {t_loop:8.3f}s  {len(user_ids) / t_loop:10.1f} users/s")
+
+    start = time.perf_counter()
+    recommend_for_users(user_ids, model, feature_cols, *data, top_k=args.top_k, **serving)
+    t_batch = time.perf_counter() - start
+    print(f"recommend_for_users     : {t_batch:8.3f}s  {len(user_ids) / t_batch:10.1f} users/s"
+          f"  ({t_loop / t_batch:.1f}x)")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_dat_reader.py
+#
+# Compare the pandas python-engine loader against src/dat_reader.py.
+# Usage: python benchmarks/bench_dat_reader.py [data/raw/ratings.dat] [--threads N]
+
+import os
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dat_reader import read_dat, iter_dat, RATINGS_SCHEMA
+
+def time_call(fn, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default="data/raw/ratings.dat")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size_mb = os.path.getsize(args.path) / 1e6
+    print("="*70)
+    print(f"DAT READER BENCHMARK: {args.path} ({size_mb:.1f} MB)")
+    print("="*70)
+
+    t_python, ref = time_call(lambda: pd.read_csv(
+        args.path, sep="::", engine="python", header=None, encoding="latin-1"
+    ), args.repeat)
+    ref.columns = list(RATINGS_SCHEMA)
+    print(f"pandas python engine : {t_python:8.3f}s  "
+          f"{ref.memory_usage(deep=True).sum() / 1e6:8.1f} MB")
+
+    runs = [("dat_reader 1 thread", 1)]
+    if args.threads > 1:
+        runs.append((f"dat_reader {args.threads} threads", args.threads))
+    for label, n_threads in runs:
+        t_fast, df = time_call(lambda: read_dat(args.path, RATINGS_SCHEMA, n_threads=n_threads), args.repeat)
+        assert (df.values == ref.values).all(), "dat_reader output differs from pandas"
+        print(f"{label:21s}: {t_fast:8.3f}s  "
+              f"{df.memory_usage(deep=True).sum() / 1e6:8.1f} MB  ({t_python / t_fast:.1f}x)")
+
+    start = time.perf_counter()
+    n_rows = sum(len(chunk) for chunk in iter_dat(args.path, RATINGS_SCHEMA, chunk_bytes=1 << 20))
+    print(f"streaming 1 MB chunks: {time.perf_counter() - start:8.3f}s  {n_rows:,} rows")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
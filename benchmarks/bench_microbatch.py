@@ -0,0 +1,81 @@
+# benchmarks/bench_microbatch.py
+#
+# Throughput and latency of POST /recommend on the ASGI service under
+# concurrent load, with and without micro-batching. Requests are driven
+# in-process (no HTTP), the response cache is disabled and top_k exceeds the
+# materialized depth, so every request is scored online.
+# Usage: python benchmarks/bench_microbatch.py [--clients 64] [--requests 2000]
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import asgi
+from src.micro_batcher import MicroBatcher
+from src.response_cache import ResponseCache
+
+async def post_recommend(user_id, top_k):
+    body = json.dumps({"user_id": user_id, "top_k": top_k}).encode()
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/recommend", "headers": [], "query_string": b""}
+    await asgi.app(scope, receive, send)
+    return sent[0]["status"]
+
+async def run_load(user_ids, n_requests, n_clients, top_k):
+    latencies = []
+    next_request = iter(range(n_requests))
+
+    async def client():
+        for i in next_request:
+            start = time.perf_counter()
+            status = await post_recommend(int(user_ids[i % len(user_ids)]), top_k)
+            assert status == 200, status
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(n_clients)))
+    return time.perf_counter() - start, np.array(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    asgi.service.init_app()
+    asgi.service.RESPONSE_CACHE = ResponseCache(maxsize=0)
+    materialized = asgi.service.MATERIALIZED
+    top_k = (materialized.k if materialized is not None else asgi.service.RESPONSE_CACHE_DEPTH) + 1
+    user_ids = np.random.default_rng(0).permutation(sorted(asgi.service.USER_ID_SET))
+
+    print("="*70)
+    print(f"MICRO-BATCHING BENCHMARK: {args.requests:,} requests, {args.clients} concurrent clients")
+    print("="*70)
+    for max_size in (1, 16, 64):
+        asgi.BATCHER = MicroBatcher(asgi.score_users, max_size, args.max_wait_ms)
+        elapsed, ms = asyncio.run(run_load(user_ids, args.requests, args.clients, top_k))
+        stats = asgi.BATCHER.stats()
+        print(f"max batch {max_size:>3}: {args.requests / elapsed:8.1f} req/s   "
+              f"p50 {np.percentile(ms, 50):7.1f} ms   p99 {np.percentile(ms, 99):7.1f} ms   "
+              f"mean batch {stats['mean_batch_size']}")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_response.py
+#
+# Cost of turning a ranked list into the /recommend response body: the former
+# per-row DataFrame formatting vs MovieCatalog records + json and pre-encoded to_json().
+# Usage: python benchmarks/bench_response.py [--top-k 10,50] [--repeat 200]
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference import load_inference_data, recommendations_frame
+from movie_catalog import MovieCatalog
+
+def rowwise_records(recs_df, movies):
+    """Reference: the formatting the API did before the catalog (iterrows + a MOVIES filter per row)"""
+    results = []
+    for _, row in recs_df.iterrows():
+        release_year = int(row["Release_Year"]) if pd.notna(row["Release_Year"]) else "N/A"
+        movie_info = movies[movies["MovieID"] == row["MovieID"]]
+        genres = "Movie"
+        if not movie_info.empty:
+            genre_cols = [c for c in movies.columns if c not in ["MovieID", "Title", "Release_Year"]]
+            active = [g for g in genre_cols if movie_info[g].iloc[0] == 1]
+            if active:
+                genres = "|".join(active)
+        results.append({
+            "movie_id": int(row["MovieID"]),
+            "title": row["Title"],
+            "release_year": release_year,
+            "genres": genres,
+            "score": round(float(row["score"]), 4),
+            "avg_rating": round(float(row["item_avg_rating"]), 2) if pd.notna(row["item_avg_rating"]) else 0.0,
+            "num_ratings": int(row["item_rating_count"]) if pd.notna(row["item_rating_count"]) else 0
+        })
+    return results
+
+def best_ms(fn, repeat):
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", default="10,50")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    _, movies, _, item_stats, _ = load_inference_data(with_ratings=False)
+    catalog = MovieCatalog(movies, item_stats)
+    stats = item_stats.set_index("MovieID")
+    rng = np.random.default_rng(0)
+
+    print("="*70)
+    print("RESPONSE BUILDING: ms per ranked list (best of repeats)")
+    print("="*70)
+    for k in (int(v) for v in args.top_k.split(",")):
+        movie_ids = rng.choice(movies["MovieID"].to_numpy(), size=k, replace=False)
+        scores = np.sort(rng.random(k).astype(np.float32))[::-1]
+        recs_df = recommendations_frame(
+            np.ones(k, dtype=np.int64), movie_ids, scores,
+            stats.loc[movie_ids, "item_avg_rating"].to_numpy(),
+            stats.loc[movie_ids, "item_rating_count"].to_numpy(), movies
+        )
+        assert json.loads(catalog.to_json(movie_ids, scores)) == rowwise_records(recs_df, movies)
+
+        rowwise = best_ms(lambda: json.dumps(rowwise_records(recs_df, movies)), max(args.repeat // 20, 3))
+        records = best_ms(lambda: json.dumps(catalog.records(movie_ids, scores)), args.repeat)
+        encoded = best_ms(lambda: catalog.to_json(movie_ids, scores), args.repeat)
+        print(f"top_k {k:>4}: row-wise {rowwise:9.3f}   catalog records {records:7.3f}   "
+              f"pre-encoded {encoded:7.3f}   ({rowwise / encoded:,.0f}x)")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
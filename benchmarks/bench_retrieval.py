@@ -0,0 +1,84 @@
+# benchmarks/bench_retrieval.py
+#
+# Recall and latency of the IVF embedding retrieval vs exact inner-product
+# search over all item vectors, for unseen top-N per user. --items pads the
+# catalog with perturbed copies of the real item vectors to show how both
+# scale with catalog size.
+# Usage: python benchmarks/bench_retrieval.py [--n 100] [--users 500] [--probes 2,4,8,16] [--items 200000]
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference import load_inference_data
+from ratings_index import RatingsIndex
+from embeddings import IVFIndex, load_retriever, build_embeddings
+
+def exact_search(ids, vectors, query, k, exclude):
+    scores = vectors @ query
+    scores[exclude(ids)] = -np.inf
+    top = np.argpartition(-scores, k - 1)[:k]
+    return ids[top[np.argsort(-scores[top], kind="stable")]]
+
+def timed(fn, queries):
+    """(results, median µs per query)"""
+    results, times = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        times.append(time.perf_counter() - start)
+    return results, np.median(times) * 1e6
+
+def report(label, ids, vectors, queries, excludes, n, probes):
+    index = IVFIndex.build(ids, vectors)
+    exact, exact_us = timed(lambda q: exact_search(ids, vectors, q[0], n, q[1]), zip(queries, excludes))
+    print(f"{label}: {len(ids):,} items, {len(index.centroids)} lists")
+    print(f"  exact          recall 1.000   {exact_us:8.1f} µs/query")
+    for n_probe in probes:
+        found, ivf_us = timed(
+            lambda q: index.search(q[0], n, q[1], n_probe=n_probe)[0], zip(queries, excludes)
+        )
+        recall = np.mean([len(np.intersect1d(a, b)) / len(b) for a, b in zip(found, exact)])
+        print(f"  ivf nprobe {n_probe:>3} recall {recall:.3f}   {ivf_us:8.1f} µs/query   "
+              f"({exact_us / ivf_us:.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--probes", default="2,4,8,16")
+    parser.add_argument("--items", type=int, default=0, help="also run on a padded catalog of this size")
+    args = parser.parse_args()
+    probes = [int(p) for p in args.probes.split(",")]
+
+    retriever = load_retriever()
+    if retriever is None:
+        build_embeddings()
+        retriever = load_retriever()
+    ratings_index = RatingsIndex.from_ratings(load_inference_data()[0])
+    rng = np.random.default_rng(0)
+    users = rng.choice(retriever.user_ids, size=min(args.users, len(retriever.user_ids)), replace=False)
+    queries = [retriever.user_vector(u) for u in users]
+    excludes = [lambda movie_ids, u=u: ratings_index.seen_mask(u, movie_ids) for u in users]
+    ids, vectors = retriever.index.ids, retriever.index.vectors
+
+    print("="*70)
+    print(f"EMBEDDING RETRIEVAL: unseen top-{args.n} for {len(users)} users")
+    print("="*70)
+    report("catalog", ids, vectors, queries, excludes, args.n, probes)
+
+    if args.items > len(ids):
+        copies = rng.integers(0, len(ids), args.items - len(ids))
+        noise = rng.normal(0, vectors.std() * 0.3, (len(copies), vectors.shape[1])).astype(np.float32)
+        padded_ids = np.concatenate([ids, np.arange(len(copies)) + int(ids.max()) + 1])
+        padded = np.concatenate([vectors, vectors[copies] + noise])
+        report("padded catalog", padded_ids, padded, queries, excludes, args.n, probes)
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
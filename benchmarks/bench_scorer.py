@@ -0,0 +1,81 @@
+# benchmarks/bench_scorer.py
+#
+# Latency of the ranker scoring paths across batch sizes, on real feature rows.
+# Usage: python benchmarks/bench_scorer.py [--sizes 1,16,64,250,1000,10000,100000] [--repeat 50]
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import xgboost as xgb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from inference import load_model, load_inference_data, load_feature_store, generate_candidates_for_users
+from ratings_index import RatingsIndex
+from scorer import RankerScorer
+
+def best_ms(fn, X, repeat):
+    fn(X)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(X)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,16,64,250,1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    model, feature_cols = load_model("ranker_model.pkl")
+    ratings, movies, user_stats, item_stats, user_genre_prefs = load_inference_data()
+    ratings_index = RatingsIndex.from_ratings(ratings)
+    feature_store = load_feature_store()
+    scorer = RankerScorer(model)
+    booster = scorer.booster
+
+    # Real candidate rows, repeated up to the largest batch size
+    user_ids = ratings_index.user_ids[:500].tolist()
+    candidates = generate_candidates_for_users(
+        user_ids, ratings, movies, item_stats, user_genre_prefs, ratings_index=ratings_index
+    )
+    offsets = np.concatenate([[0], np.cumsum([len(c) for c in candidates])])
+    movie_ids = np.array([m for c in candidates for m in c], dtype=np.int64)
+    X_all = feature_store.build_matrix_batch(user_ids, movie_ids, offsets, feature_cols).astype(np.float32)
+    X_all = np.tile(X_all, (-(-max(sizes) // len(X_all)), 1))
+
+    paths = {
+        "sklearn predict": lambda X: model.predict(X),
+        "DMatrix predict": lambda X: booster.predict(xgb.DMatrix(X)),
+        "inplace_predict": scorer.predict_inplace,
+        "flat (numba)": scorer.predict_flat if scorer.flat is not None else None,
+        "RankerScorer": scorer,
+    }
+
+    print("="*70)
+    print(f"RANKER SCORER BENCHMARK (flat path {'on' if scorer.flat is not None else 'off'}, "
+          f"small batch <= {scorer.small_batch_rows} rows)")
+    print("="*70)
+    print(f"{'rows':>8}  " + "  ".join(f"{name:>16}" for name in paths))
+    for n in sizes:
+        X = np.ascontiguousarray(X_all[:n])
+        reference = scorer.predict_inplace(X)
+        cells = []
+        for name, fn in paths.items():
+            if fn is None:
+                cells.append(f"{'-':>16}")
+                continue
+            assert np.array_equal(np.asarray(fn(X), dtype=np.float32), reference), f"{name} differs at {n} rows"
+            cells.append(f"{best_ms(fn, X, args.repeat):13.3f} ms")
+        print(f"{n:>8}  " + "  ".join(cells))
+    print("All paths return identical scores")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,40 @@
 import os
+import ast
 import sys
+import json
 import time
+import cProfile
+import inspect
+import hashlib
+import traceback
+import multiprocessing
 import importlib.util
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+import artifacts
+import profiler
 
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+SRC_DIR = "src"
+PROCESSED_DIR = "data/processed"
+FEATURE_DIR = "data/features"
+MODEL_DIR = "models"
+# Input/output digests of the last successful run of every stage
+CACHE_PATH = "data/pipeline_cache.json"
+# Per-stage resource report of the last run
+PROFILE_PATH = os.path.join(LOG_DIR, "pipeline_profile.json")
+N_WORKERS = os.cpu_count() or 1
+# Flags that change what every stage writes
+GLOBAL_FLAGS = ("--export-csv",)
+# Command-line options that take a value, and flags that only change how the DAG runs
+VALUE_OPTIONS = ("--from", "--jobs")
+RUN_FLAGS = ("--force", "--profile")
+
 def load_module(module_name, file_path):
     spec = importlib.util.spec_from_file_location(module_name, file_path)
     module = importlib.util.module_from_spec(spec)
@@ -31,116 +59,406 @@ def stage_0_data_check():
         "data/raw/ratings.dat"
     ])
 
-def stage_1_preprocessing():
-    print("\n[STAGE 1] Preprocessing...")
-    try:
-        load_module("preprocessing", "src/preprocessing.py").main()
-        return verify_files([
-            "data/processed/ratings_processed.csv",
-            "data/processed/user_stats.csv"
-        ])
-    except Exception as e:
-        print(f"  ❌ Error: {e}")
-        return False
+def processed(*names):
+    return [artifacts.artifact_path(PROCESSED_DIR, name) for name in names]
 
-def stage_2_candidates():
-    print("\n[STAGE 2] Candidate Generation...")
-    try:
-        load_module("candidate_gen", "src/candidate_generation.py").main()
-        return verify_files(["data/candidates/user_movie_candidates.csv"])
-    except Exception as e:
-        print(f"  ❌ Error: {e}")
-        return False
+# ----------------------------
+# Stage bodies
+# ----------------------------
+def run_preprocessing():
+    load_module("preprocessing", "src/preprocessing.py").main()
 
-def stage_3_features():
-    print("\n[STAGE 3] Feature Engineering...")
-    try:
-        load_module("feat_eng", "src/feature_engineering.py").main()
-        return verify_files(["data/features/training_data.csv"])
-    except Exception as e:
-        print(f"  ❌ Error: {e}")
-        return False
+def run_embeddings():
+    load_module("embeddings", "src/embeddings.py").main()
 
-def stage_4_training():
-    print("\n[STAGE 4] Model Training...")
-    try:
-        load_module("ranking", "src/ranking_model.py").main()
-        
-        print("\n  Building cold-start profiles...")
-        load_module("cold_start", "src/cold_start_handler.py").ColdStartHandler()
-        
-        return verify_files([
-            "models/ranker_model.pkl",
-            "models/feature_names.csv"
-        ])
-    except Exception as e:
-        print(f"  ❌ Error: {e}")
-        return False
+def run_item_neighbors():
+    load_module("item_neighbors", "src/item_neighbors.py").main()
 
-def stage_5_inference():
-    print("\n[STAGE 5] Validation...")
-    try:
-        # Load inference module
-        inf = load_module("inference", "src/inference.py")
-        
-        print("  Testing existing user recommendations...")
-        model, feature_cols = inf.load_model("ranker_model.pkl")
-        ratings, movies, user_stats, item_stats, user_genre_prefs = inf.load_inference_data()
-        
-        recs = inf.recommend_for_user(
-            1, model, feature_cols, ratings, movies,
-            user_stats, item_stats, user_genre_prefs, top_k=3
-        )
-        
-        if recs is not None:
-            print(f"    ✓ User 1: {len(recs)} recommendations generated")
-        
-        # Test cold-start
-        print("  Testing new user recommendations...")
-        cs = load_module("cold_start", "src/cold_start_handler.py")
-        handler = cs.ColdStartHandler()
-        
-        recs_cold = handler.recommend(
-            user_demographics={'gender': 'F', 'age': 25, 'occupation': 4},
-            top_k=3
-        )
-        
-        if recs_cold is not None:
-            print(f"    ✓ New user: {len(recs_cold)} recommendations generated")
-        
-        return True
-    except Exception as e:
-        print(f"  ❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+def run_candidates():
+    load_module("candidate_gen", "src/candidate_generation.py").main()
+
+def run_features():
+    load_module("feat_eng", "src/feature_engineering.py").main(streaming="--stream-features" in sys.argv)
+
+def run_training():
+    load_module("ranking", "src/ranking_model.py").main(warm_start="--warm-start" in sys.argv)
+
+def run_cold_start():
+    print("Building cold-start profiles...")
+    load_module("cold_start", "src/cold_start_handler.py").save_cold_start_profiles()
+
+def run_materialize():
+    load_module("materialize", "src/materialize.py").main()
+
+def run_arena():
+    load_module("arena", "src/arena.py").main()
+
+def run_validation():
+    inf = load_module("inference", "src/inference.py")
+
+    print("  Testing existing user recommendations...")
+    model, feature_cols = inf.load_model("ranker_model.pkl")
+    ratings, movies, user_stats, item_stats, user_genre_prefs = inf.load_inference_data()
+
+    recs = inf.recommend_for_user(
+        1, model, feature_cols, ratings, movies,
+        user_stats, item_stats, user_genre_prefs, top_k=3
+    )
+
+    if recs is not None:
+        print(f"    ✓ User 1: {len(recs)} recommendations generated")
+
+    # Test cold-start
+    print("  Testing new user recommendations...")
+    cs = load_module("cold_start", "src/cold_start_handler.py")
+    handler = cs.ColdStartHandler()
+
+    recs_cold = handler.recommend(
+        user_demographics={'gender': 'F', 'age': 25, 'occupation': 4},
+        top_k=3
+    )
+
+    if recs_cold is not None:
+        print(f"    ✓ New user: {len(recs_cold)} recommendations generated")
+
+# ----------------------------
+# Stage graph
+# ----------------------------
+class Stage:
+    """One pipeline step: run() reads inputs and writes outputs.
+
+    A stage depends on every stage whose outputs it lists as inputs. Its
+    cache key hashes the source of its run function, the contents of its
+    inputs, of its source module and the src/ modules it imports, and the
+    flags it reads; when the key and the outputs are unchanged since its
+    last run it is skipped. cache=False stages always run.
+    """
+
+    def __init__(self, name, run, module, inputs=(), outputs=(), flags=(), cache=True):
+        self.name = name
+        self.run = run
+        self.module = module
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.flags = tuple(flags) + GLOBAL_FLAGS
+        self.cache = cache
+        self.deps = []
+
+RAW_INPUTS = ["data/raw/users.dat", "data/raw/movies.dat", "data/raw/ratings.dat", "data/ingest/ratings.jsonl"]
+PROCESSED_TABLES = processed(
+    "users_processed", "movies_processed", "ratings_processed", "user_stats", "item_stats",
+    "user_genre_preferences", "user_features", "item_features"
+)
+EMBEDDINGS = os.path.join(MODEL_DIR, "mf_embeddings.npz")
+RANKER_OUTPUTS = [
+    os.path.join(MODEL_DIR, "ranker_model.pkl"),
+    os.path.join(MODEL_DIR, "feature_names.csv"),
+    os.path.join(MODEL_DIR, "registry", "current.json")
+]
+
+STAGES = [
+    Stage("preprocessing", run_preprocessing, "src/preprocessing.py",
+          inputs=RAW_INPUTS,
+          outputs=PROCESSED_TABLES + [os.path.join(PROCESSED_DIR, "ingested_offset.json")]),
+    Stage("embeddings", run_embeddings, "src/embeddings.py",
+          inputs=processed("ratings_processed"),
+          outputs=[EMBEDDINGS]),
+    Stage("item_neighbors", run_item_neighbors, "src/item_neighbors.py",
+          inputs=processed("ratings_processed"),
+          outputs=processed("item_neighbors")),
+    Stage("candidates", run_candidates, "src/candidate_generation.py",
+          inputs=processed("ratings_processed", "movies_processed", "users_processed", "item_neighbors")
+          + [EMBEDDINGS],
+          outputs=[artifacts.artifact_path("data/candidates", "user_movie_candidates")]),
+    # The whole features directory: training_data is a single table or a shard directory
+    Stage("features", run_features, "src/feature_engineering.py",
+          inputs=processed("ratings_processed", "movies_processed", "user_stats", "item_stats",
+                           "user_genre_preferences"),
+          outputs=[FEATURE_DIR], flags=("--stream-features",)),
+    Stage("training", run_training, "src/ranking_model.py",
+          inputs=[FEATURE_DIR] + processed("ratings_processed"),
+          outputs=RANKER_OUTPUTS, flags=("--warm-start",)),
+    Stage("cold_start", run_cold_start, "src/cold_start_handler.py",
+          inputs=processed("ratings_processed", "users_processed"),
+          outputs=processed("cold_start_profiles")),
+    Stage("materialize", run_materialize, "src/materialize.py",
+          inputs=RANKER_OUTPUTS + [EMBEDDINGS] + PROCESSED_TABLES + processed("item_neighbors"),
+          outputs=["data/materialized/manifest.json"]),
+    Stage("arena", run_arena, "src/arena.py",
+          inputs=PROCESSED_TABLES + processed("item_neighbors"),
+          outputs=["data/arena/manifest.json"]),
+    Stage("validation", run_validation, "src/inference.py",
+          inputs=RANKER_OUTPUTS + PROCESSED_TABLES + processed("cold_start_profiles"),
+          cache=False),
+]
+STAGE_BY_NAME = {stage.name: stage for stage in STAGES}
+
+def link_stages(stages):
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    for stage in stages:
+        stage.deps = sorted({producers[p] for p in stage.inputs if p in producers} - {stage.name})
+
+def downstream(stages, name):
+    """name and every stage that transitively depends on it"""
+    selected = {name}
+    for stage in stages:
+        # STAGES is in topological order, so one pass suffices
+        if selected.intersection(stage.deps):
+            selected.add(stage.name)
+    return selected
+
+link_stages(STAGES)
+
+# ----------------------------
+# Content hashing
+# ----------------------------
+class ContentHashes:
+    """SHA-1 of file contents, memoized by (size, mtime) across runs in the cache file"""
+
+    def __init__(self, known=None):
+        self.known = known or {}
+        self.used = {}
+
+    def file(self, path):
+        stat = os.stat(path)
+        entry = self.used.get(path) or self.known.get(path)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            digest = hashlib.sha1()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            entry = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self.used[path] = entry
+        return entry[2]
+
+    def path(self, path):
+        """Digest of a file, of a directory's files (by relative path), or None when missing"""
+        if os.path.isfile(path):
+            return self.file(path)
+        if not os.path.isdir(path):
+            return None
+        digest = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(f"{os.path.relpath(file_path, path)}:{self.file(file_path)};".encode())
+        return digest.hexdigest()
+
+def module_files(path, found=None):
+    """path and every src/ module it imports, transitively"""
+    found = set() if found is None else found
+    found.add(path)
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            candidate = os.path.join(SRC_DIR, name.split(".")[0] + ".py")
+            if os.path.exists(candidate) and candidate not in found:
+                module_files(candidate, found)
+    return found
+
+def stage_key(stage, hashes):
+    digest = hashlib.sha1(stage.name.encode())
+    # The stage body lives in this file, which is not one of the stage's modules
+    digest.update(f"run {inspect.getsource(stage.run)};".encode())
+    for path in sorted(module_files(stage.module)):
+        digest.update(f"code {path}:{hashes.file(path)};".encode())
+    for path in stage.inputs:
+        digest.update(f"input {path}:{hashes.path(path)};".encode())
+    for flag in stage.flags:
+        digest.update(f"flag {flag}:{flag in sys.argv};".encode())
+    return digest.hexdigest()
+
+def output_digests(stage, hashes):
+    return {path: hashes.path(path) for path in stage.outputs}
+
+def load_cache(path=CACHE_PATH):
+    if not os.path.exists(path):
+        return {"files": {}, "stages": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_cache(cache, path=CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+# ----------------------------
+# Execution
+# ----------------------------
+def stage_log(name):
+    return os.path.join(LOG_DIR, f"stage_{name}.log")
+
+def stage_cprofile(name):
+    return os.path.join(LOG_DIR, f"stage_{name}.prof")
+
+def run_stage(name):
+    """Pool worker: run one stage with its output captured in its log; (success, resource report).
+
+    The report holds the stage's profiler.step() totals, the peak RSS of
+    the worker processes it started and its recorded sub-steps. With
+    --profile the stage also runs under cProfile, dumped next to its log.
+    """
+    stage = STAGE_BY_NAME[name]
+    if "--export-csv" in sys.argv:
+        artifacts.EXPORT_CSV = True
+    profile = cProfile.Profile() if "--profile" in sys.argv else None
+    ok = False
+    with open(stage_log(name), "w") as log:
+        # At the descriptor level, so native libraries' output lands in the log too
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            with profiler.step(name):
+                if profile is not None:
+                    profile.runcall(stage.run)
+                else:
+                    stage.run()
+            ok = verify_files(stage.outputs)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+    *steps, total = profiler.STEPS
+    report = {k: v for k, v in total.items() if k != "name"}
+    # A stage's rows are those of its largest step (typically the ratings it reads)
+    rows = max((s["rows"] for s in steps if s["rows"]), default=None)
+    report.update(
+        rows=rows,
+        rows_per_second=round(rows / total["wall_seconds"]) if rows and total["wall_seconds"] > 0 else None,
+        children_peak_rss_mb=profiler.children_peak_rss_mb(),
+        steps=steps
+    )
+    if profile is not None:
+        profile.dump_stats(stage_cprofile(name))
+        report["cprofile"] = stage_cprofile(name)
+    return ok, report
+
+def save_profile_report(stages, started_at, total_seconds, n_workers, path=PROFILE_PATH):
+    with open(path + ".tmp", "w") as f:
+        json.dump({
+            "started_at": started_at,
+            "total_seconds": round(total_seconds, 3),
+            "jobs": n_workers,
+            "stages": stages
+        }, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def run_dag(stages, forced=(), n_workers=N_WORKERS):
+    """Run the stages in dependency order, independent ones concurrently; returns the failed stage or None.
+
+    Every stage runs in a fresh process. A ready stage is skipped when its
+    key and outputs match its last successful run, unless it is in forced.
+    The resource usage of every stage is written to PROFILE_PATH.
+    """
+    cache = load_cache()
+    hashes = ContentHashes(cache["files"])
+    report, started_at, start = {}, datetime.now().isoformat(timespec="seconds"), time.time()
+    pending = list(stages)
+    done, running, failed = set(), {}, None
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(n_workers, mp_context=context, max_tasks_per_child=1) as pool:
+        while pending or running:
+            progress = failed is None
+            while progress:
+                progress = False
+                for stage in [s for s in pending if all(d in done for d in s.deps)]:
+                    pending.remove(stage)
+                    key = stage_key(stage, hashes)
+                    last = cache["stages"].get(stage.name)
+                    if (stage.cache and stage.name not in forced and last is not None and last["key"] == key
+                            and last["outputs"] == output_digests(stage, hashes)):
+                        print(f"\n[{stage.name}] ⏭️  up to date (cached)")
+                        report[stage.name] = {"status": "cached"}
+                        done.add(stage.name)
+                        progress = True
+                        continue
+                    print(f"\n[{stage.name}] started")
+                    running[pool.submit(run_stage, stage.name)] = (stage, key)
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                ok, usage = future.result()
+                report[stage.name] = {"status": "ok" if ok else "failed", **usage}
+                print(f"\n[{stage.name}] {'finished' if ok else 'FAILED'} "
+                      f"({usage['wall_seconds']:.1f}s, CPU {usage['cpu_seconds']:.1f}s, "
+                      f"peak RSS {max(usage['peak_rss_mb'], usage['children_peak_rss_mb']):,.0f} MB, "
+                      f"log: {stage_log(stage.name)})")
+                with open(stage_log(stage.name)) as f:
+                    print(f.read().rstrip())
+                if ok:
+                    done.add(stage.name)
+                    cache["stages"][stage.name] = {"key": key, "outputs": output_digests(stage, hashes)}
+                else:
+                    cache["stages"].pop(stage.name, None)
+                    failed = failed or stage.name
+                # Only files this run looked at are remembered
+                cache["files"] = hashes.used
+                save_cache(cache)
+    save_profile_report(report, started_at, time.time() - start, n_workers)
+    return failed
+
+def unknown_arguments(args):
+    known = set(RUN_FLAGS) | {flag for stage in STAGES for flag in stage.flags}
+    unknown, args = [], iter(args)
+    for arg in args:
+        if arg in VALUE_OPTIONS:
+            next(args, None)
+        elif arg not in known:
+            unknown.append(arg)
+    return unknown
+
+def option(name, default=None):
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
 
 def main():
     print("="*70)
     print("MOVIEMATCH AI - TRAINING PIPELINE")
     print("="*70)
-    
+
+    unknown = unknown_arguments(sys.argv[1:])
+    if unknown:
+        flags = sorted(set(RUN_FLAGS) | {flag for stage in STAGES for flag in stage.flags})
+        print(f"❌ Unknown arguments: {' '.join(unknown)}")
+        print(f"   Options: --from <stage>, --jobs <n>, {', '.join(flags)}")
+        sys.exit(2)
+    start_from = option("--from")
+    if start_from is not None and start_from not in STAGE_BY_NAME:
+        print(f"❌ Unknown stage {start_from!r}; stages: {', '.join(STAGE_BY_NAME)}")
+        sys.exit(2)
+    forced = set(STAGE_BY_NAME) if "--force" in sys.argv else set()
+    if start_from is not None:
+        forced |= downstream(STAGES, start_from)
+
     start_time = time.time()
-    
-    stages = [
-        stage_0_data_check,
-        stage_1_preprocessing,
-        stage_2_candidates,
-        stage_3_features,
-        stage_4_training,
-        stage_5_inference
-    ]
-    
-    for i, stage_fn in enumerate(stages, 1):
-        stage_start = time.time()
-        if not stage_fn():
-            print(f"\n❌ Pipeline failed at stage {i}: {stage_fn.__name__}")
-            sys.exit(1)
-        stage_duration = time.time() - stage_start
-        print(f"  ⏱️  Stage completed in {stage_duration:.1f}s")
-    
+
+    if not stage_0_data_check():
+        print("\n❌ Pipeline failed at stage 0: data check")
+        sys.exit(1)
+
+    failed = run_dag(STAGES, forced, int(option("--jobs", N_WORKERS)))
+    if failed is not None:
+        print(f"\n❌ Pipeline failed at stage: {failed}")
+        sys.exit(1)
+
     total_duration = time.time() - start_time
-    
+
     print("\n"+"="*70)
     print(f"✅ SUCCESS: Pipeline completed in {total_duration:.1f}s")
     print("\nNext steps:")
@@ -149,4 +467,4 @@ def main():
     print("="*70)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,121 @@
+# src/arena.py
+
+import os
+import json
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+from inference import load_inference_data, load_feature_store
+from materialize import DATA_INPUTS, artifact_version
+from ratings_index import RatingsIndex
+from feature_store import FeatureStore
+from profiler import step
+
+ARENA_DIR = "data/arena"
+MANIFEST_NAME = "manifest.json"
+
+# ----------------------------
+# Read-only array arena
+# ----------------------------
+def save_arena(arrays, meta, version, directory=ARENA_DIR):
+    """Write each array as <version>/<i>.npy and atomically point the manifest at them.
+
+    Every serving process maps the same files read-only, so the pages live
+    once in the OS page cache however many workers there are.
+    """
+    os.makedirs(directory, exist_ok=True)
+    version_dir = os.path.join(directory, version)
+    tmp_dir = f"{version_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    files = {}
+    for i, (name, values) in enumerate(arrays.items()):
+        files[name] = f"{i:03d}.npy"
+        np.save(os.path.join(tmp_dir, files[name]), np.ascontiguousarray(values))
+    try:
+        os.rename(tmp_dir, version_dir)
+    except OSError:
+        # Another worker published the same version first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    manifest = {
+        "version": version,
+        "arrays": files,
+        "meta": meta,
+        "created_at": datetime.now().isoformat(timespec="seconds")
+    }
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(f"{manifest_path}.tmp{os.getpid()}", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.tmp{os.getpid()}", manifest_path)
+
+    # Processes still mapping an older version keep their pages after the unlink
+    for old in os.listdir(directory):
+        if old not in (version, MANIFEST_NAME) and ".tmp" not in old:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version_dir
+
+def load_arena(directory=ARENA_DIR):
+    """(arrays memory-mapped read-only, meta, version), or None when no arena exists"""
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    version_dir = os.path.join(directory, manifest["version"])
+    arrays = {
+        name: np.load(os.path.join(version_dir, file_name), mmap_mode="r")
+        for name, file_name in manifest["arrays"].items()
+    }
+    return arrays, manifest["meta"], manifest["version"]
+
+# ----------------------------
+# Serving tables
+# ----------------------------
+def build_serving_arena(version=None, directory=ARENA_DIR):
+    """Build the ratings index and feature store once and save them as an arena"""
+    version = version or artifact_version(DATA_INPUTS)
+    ratings = load_inference_data()[0]
+    with step("ratings_index", rows=len(ratings)):
+        arrays = {f"ratings_index:{k}": v for k, v in RatingsIndex.from_ratings(ratings).to_arrays().items()}
+    del ratings
+    with step("feature_store"):
+        store_arrays, store_meta = load_feature_store().to_arrays()
+    arrays.update({f"feature_store:{k}": v for k, v in store_arrays.items()})
+    save_arena(arrays, {"feature_store": store_meta}, version, directory)
+    return version
+
+def _section(arrays, prefix):
+    return {k[len(prefix):]: v for k, v in arrays.items() if k.startswith(prefix)}
+
+def load_serving_arena(version=None, directory=ARENA_DIR):
+    """(RatingsIndex, FeatureStore) backed by the arena's memory-mapped arrays.
+
+    The arena is (re)built first when it is missing or was built from other
+    data artifacts than version (default: the current ones).
+    """
+    version = version or artifact_version(DATA_INPUTS)
+    arena = load_arena(directory)
+    if arena is None or arena[2] != version:
+        build_serving_arena(version, directory)
+        arena = load_arena(directory)
+    arrays, meta, _ = arena
+    return (
+        RatingsIndex.from_arrays(_section(arrays, "ratings_index:")),
+        FeatureStore.from_arrays(_section(arrays, "feature_store:"), meta["feature_store"])
+    )
+
+def main():
+    print("="*70)
+    print("BUILDING SERVING ARENA")
+    print("="*70)
+    version = build_serving_arena()
+    arrays = load_arena()[0]
+    size_mb = sum(a.nbytes for a in arrays.values()) / 1e6
+    print(f"  ✓ {len(arrays)} arrays, {size_mb:,.1f} MB (version {version})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# src/artifacts.py
+
+import os
+import sys
+import shutil
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+ARTIFACT_EXT = ".arrow"
+EXPORT_CSV = False
+SHARD_PREFIX = "part-"
+CSV_CHUNK_ROWS = 65536
+
+COMPACT_DTYPES = {
+    "UserID": np.int32,
+    "MovieID": np.int32,
+    "Rating": np.int8,
+    "Relevance": np.int8,
+    "Age": np.int8,
+    "Occupation": np.int8,
+}
+
+# ----------------------------
+# Dtype compaction
+# ----------------------------
+def compact_dtypes(df):
+    """Downcast IDs/ratings/demographics to their compact types and 0/1 flags to uint8"""
+    df = df.copy()
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(series.cat.categories.dtype)
+        target = COMPACT_DTYPES.get(col)
+        if target is not None and series.notna().all():
+            if np.issubdtype(target, np.integer) and (series % 1 != 0).any():
+                target = np.float32
+            df[col] = series.astype(target)
+        elif pd.api.types.is_integer_dtype(series) and len(series) and series.min() >= 0 and series.max() <= 1:
+            df[col] = series.astype(np.uint8)
+        else:
+            df[col] = series
+    return df
+
+# ----------------------------
+# Read / write
+# ----------------------------
+def artifact_path(directory, name):
+    return os.path.join(directory, name + ARTIFACT_EXT)
+
+def save_table(df, directory, name, export_csv=None):
+    """Write df as an uncompressed Arrow IPC file (memory-mappable), optionally also as CSV"""
+    os.makedirs(directory, exist_ok=True)
+    df = compact_dtypes(df.reset_index(drop=True))
+    path = artifact_path(directory, name)
+    tmp_path = path + ".tmp"
+    feather.write_feather(df, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    if EXPORT_CSV if export_csv is None else export_csv:
+        df.to_csv(os.path.join(directory, name + ".csv"), index=False)
+    return path
+
+class TableWriter:
+    """Persists artifacts on a background thread while the caller keeps computing.
+
+    save() / save_shard() queue a write and return at once (blocking only
+    while max_pending writes are already queued, which bounds the frames
+    held in memory); queued frames must not be modified afterwards. Writes
+    run in order, and after a failure the remaining ones are skipped, so
+    call() can queue a step that must only follow successful writes (e.g.
+    recording a checkpoint). wait() / leaving the with block blocks until
+    everything is on disk and re-raises the first error.
+    """
+
+    def __init__(self, max_pending=4):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="table-writer")
+        self._pending = deque()
+        self._failed = False
+
+    def _run(self, fn, args):
+        if self._failed:
+            return
+        try:
+            fn(*args)
+        except BaseException:
+            self._failed = True
+            raise
+
+    def call(self, fn, *args):
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(self._run, fn, args))
+
+    def save(self, df, directory, name, export_csv=None):
+        self.call(save_table, df, directory, name, export_csv)
+
+    def save_shard(self, df, directory, name, index):
+        self.call(save_shard, df, directory, name, index)
+
+    def wait(self):
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_table(directory, name, columns=None):
+    """Memory-map an Arrow artifact and return the projected columns as a DataFrame.
+
+    A sharded artifact (<name>/part-*.arrow) is read as the concatenation of
+    its shards. Falls back to <name>.csv for artifacts written by older
+    pipeline runs.
+    """
+    path = artifact_path(directory, name)
+    if not os.path.exists(path):
+        shards = list_shards(directory, name)
+        if shards:
+            tables = [feather.read_table(p, columns=columns, memory_map=True) for p in shards]
+            # Shards are compacted independently, so e.g. a 0/1 column may be uint8 in one only
+            table = pa.concat_tables(tables, promote_options="permissive")
+            return table.to_pandas(split_blocks=True)
+        return pd.read_csv(os.path.join(directory, name + ".csv"), usecols=columns)
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+def iter_table_batches(directory, name, columns=None):
+    """Stream an artifact as DataFrames, one Arrow record batch (or CSV chunk) at a time"""
+    path = artifact_path(directory, name)
+    if not os.path.exists(path):
+        yield from pd.read_csv(os.path.join(directory, name + ".csv"), usecols=columns,
+                               chunksize=CSV_CHUNK_ROWS)
+        return
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(columns)
+            yield batch.to_pandas()
+
+# ----------------------------
+# Sharded artifacts
+# ----------------------------
+def shard_dir(directory, name):
+    return os.path.join(directory, name)
+
+def list_shards(directory, name):
+    path = shard_dir(directory, name)
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        os.path.join(path, f) for f in os.listdir(path)
+        if f.startswith(SHARD_PREFIX) and f.endswith(ARTIFACT_EXT)
+    )
+
+def iter_table_shards(directory, name, columns=None):
+    """DataFrame per shard of a sharded artifact; a plain artifact is a single shard"""
+    shards = list_shards(directory, name)
+    if os.path.exists(artifact_path(directory, name)) or not shards:
+        yield load_table(directory, name, columns)
+        return
+    for path in shards:
+        yield feather.read_table(path, columns=columns, memory_map=True).to_pandas(split_blocks=True)
+
+def save_shard(df, directory, name, index):
+    """Write shard <index> of a sharded artifact as <name>/part-<index>.arrow"""
+    return save_table(df, shard_dir(directory, name), f"{SHARD_PREFIX}{index:05d}", export_csv=False)
+
+def remove_table(directory, name):
+    """Delete an artifact in either layout, so a rewrite never leaves a stale copy behind"""
+    path = artifact_path(directory, name)
+    if os.path.exists(path):
+        os.remove(path)
+    if os.path.isdir(shard_dir(directory, name)):
+        shutil.rmtree(shard_dir(directory, name))
+
+def table_files(directory, name):
+    """Files backing an artifact: the .arrow file, its shards, or the CSV fallback"""
+    path = artifact_path(directory, name)
+    if os.path.exists(path):
+        return [path]
+    return list_shards(directory, name) or [os.path.join(directory, name + ".csv")]
+
+def fingerprint(paths):
+    """Short hash of the size and mtime of the given files (missing files are skipped)"""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+def export_table_csv(directory, name):
+    """Export an Arrow artifact to <name>.csv next to it"""
+    out = os.path.join(directory, name + ".csv")
+    load_table(directory, name).to_csv(out, index=False)
+    return out
+
+def main():
+    directories = sys.argv[1:] or ["data/processed", "data/features", "data/candidates"]
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(ARTIFACT_EXT):
+                print(f"  ✓ {export_table_csv(directory, file_name[:-len(ARTIFACT_EXT)])}")
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,31 @@
 import pandas as pd
+import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+
+from artifacts import save_table, load_table
+from ratings_index import RatingsIndex
+from embeddings import load_retriever
+from item_neighbors import ItemNeighbors, recent_liked
+from profiler import step
 
 PROCESSED_DIR = "data/processed"
 CANDIDATE_DIR = "data/candidates"
 N_POPULAR = 100
 N_GENRE = 150
+N_EMBEDDING = 100
+N_NEIGHBOR = 100
+# Users x movies scored per block (16 MB of float64 scores); blocks shrink as the catalog grows
+BLOCK_CELLS = 2_000_000
+N_WORKERS = os.cpu_count() or 1
 
 def load_data():
-    ratings = pd.read_csv(os.path.join(PROCESSED_DIR, "ratings_processed.csv"))
-    movies = pd.read_csv(os.path.join(PROCESSED_DIR, "movies_processed.csv"))
-    users = pd.read_csv(os.path.join(PROCESSED_DIR, "users_processed.csv"))
+    ratings = load_table(
+        PROCESSED_DIR, "ratings_processed", columns=["UserID", "MovieID", "Rating", "Timestamp"]
+    )
+    movies = load_table(PROCESSED_DIR, "movies_processed")
+    users = load_table(PROCESSED_DIR, "users_processed", columns=["UserID"])
     return ratings, movies, users
 
 def get_popular_movies(ratings):
@@ -25,53 +41,182 @@ def get_genre_columns(movies):
     base_cols = {"MovieID", "Title", "Release_Year"}
     return [c for c in movies.columns if c not in base_cols]
 
-def build_genre_candidates(ratings, movies):
+def _genre_top_n(genre_matrix, user_rows, offsets, movie_cols, liked, n, block_cells):
+    """Top-n unseen movie columns for users offsets[i]:offsets[i + 1] of the CSR arrays.
+
+    Users are processed in blocks of about block_cells / n_movies users:
+    profile = genre rows summed over the liked movies (a sparse product),
+    scores = profiles @ genre_matrix.T, seen movies masked to -inf, and
+    np.partition finds each row's n-th best score. Only the scores block is
+    dense, so memory stays near block_cells whatever the catalog size. Ties
+    are broken by movie position, so the result is deterministic. It can
+    differ from the old per-user loop only in which of several movies tied
+    at the cut-off score are kept (about 1% of pairs on the sample data).
+    """
+    n_movies = genre_matrix.shape[0]
+    block_users = max(1, block_cells // max(n_movies, 1))
+    out_users, out_cols = [], []
+    for b0 in range(0, len(user_rows), block_users):
+        rows = user_rows[b0:b0 + block_users]
+        start, end = offsets[b0], offsets[b0 + len(rows)]
+        local = np.repeat(np.arange(len(rows)), np.diff(offsets[b0:b0 + len(rows) + 1]))
+        cols = movie_cols[start:end]
+        known = cols >= 0
+
+        # Genre counts over liked movies (unknown MovieIDs are skipped). Dividing by the
+        # liked count would not change a user's ranking, and the integer sums stay exact
+        take = liked[start:end] & known
+        has_profile = np.bincount(local[take], minlength=len(rows)) > 0
+        liked_matrix = sparse.csr_matrix(
+            (np.ones(take.sum()), (local[take], cols[take])), shape=(len(rows), n_movies)
+        )
+        profiles = liked_matrix @ genre_matrix
+
+        scores = profiles @ genre_matrix.T
+        scores[local[known], cols[known]] = -np.inf
+
+        k = min(n, scores.shape[1])
+        kth = np.partition(scores, scores.shape[1] - k, axis=1)[:, scores.shape[1] - k][:, None]
+        above = scores > kth
+        at_kth = (scores == kth) & np.isfinite(scores)
+        fill = k - above.sum(axis=1, keepdims=True)
+        keep = above | (at_kth & (np.cumsum(at_kth, axis=1) <= fill))
+        keep &= has_profile[:, None]
+
+        r, c = np.nonzero(keep)
+        order = np.lexsort((c, -scores[r, c], r))
+        out_users.append(rows[r[order]])
+        out_cols.append(c[order].astype(np.int32))
+
+    if not out_users:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    return np.concatenate(out_users).astype(np.int32), np.concatenate(out_cols)
+
+def build_genre_candidates(ratings, movies, n=N_GENRE, block_cells=BLOCK_CELLS, n_workers=1):
+    """Top-n genre-similar unseen movies for every user with at least one liked (>= 4) rating.
+
+    Returns compact int32 (UserID, MovieID) arrays, grouped by user and best
+    first. With n_workers > 1 user ranges are sharded across a process pool.
+    """
     genre_cols = get_genre_columns(movies)
-    ratings_genre = ratings.merge(movies[["MovieID"] + genre_cols], on="MovieID", how="left")
-    
-    candidates = []
-    for user_id, group in ratings_genre.groupby("UserID"):
-        liked = group[group["Rating"] >= 4]
-        if liked.empty:
+    genre_matrix = movies[genre_cols].to_numpy(np.float64)
+    movie_ids = movies["MovieID"].to_numpy()
+    movie_pos = np.full(int(movie_ids.max(initial=0)) + 1, -1, dtype=np.int32)
+    movie_pos[movie_ids] = np.arange(len(movie_ids), dtype=np.int32)
+
+    # User-sorted (CSR) view of the ratings
+    users = ratings["UserID"].to_numpy()
+    order = np.argsort(users, kind="stable")
+    user_ids, counts = np.unique(users[order], return_counts=True)
+    offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    rated = ratings["MovieID"].to_numpy()[order]
+    in_range = (rated >= 0) & (rated < len(movie_pos))
+    movie_cols = np.where(in_range, movie_pos[np.where(in_range, rated, 0)], -1)
+    liked = ratings["Rating"].to_numpy()[order] >= 4
+
+    shards = np.array_split(np.arange(len(user_ids)), max(n_workers, 1))
+    tasks = []
+    for shard in shards:
+        if len(shard) == 0:
             continue
-        
-        genre_profile = liked[genre_cols].mean()
-        movies["genre_score"] = movies[genre_cols].dot(genre_profile)
-        user_seen = set(group["MovieID"])
-        
-        top_movies = (
-            movies[~movies["MovieID"].isin(user_seen)]
-            .sort_values("genre_score", ascending=False)
-            .head(N_GENRE)["MovieID"]
-            .tolist()
+        lo, hi = shard[0], shard[-1] + 1
+        tasks.append((
+            genre_matrix, user_ids[lo:hi], offsets[lo:hi + 1] - offsets[lo],
+            movie_cols[offsets[lo]:offsets[hi]], liked[offsets[lo]:offsets[hi]], n, block_cells
+        ))
+
+    if n_workers <= 1:
+        results = [_genre_top_n(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers) as pool:
+            results = list(pool.map(_genre_top_n, *zip(*tasks)))
+
+    if not results:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    out_users = np.concatenate([r[0] for r in results])
+    out_movies = movie_ids[np.concatenate([r[1] for r in results])].astype(np.int32)
+    return out_users, out_movies
+
+def build_embedding_candidates(ratings_index, user_ids, retriever, n=N_EMBEDDING):
+    """Top-n unseen movies per user from the MF embedding index, as int32 (UserID, MovieID) arrays"""
+    candidates = [retriever.candidates(user_id, n, ratings_index) for user_id in user_ids.tolist()]
+    counts = [len(c) for c in candidates]
+    out_movies = np.fromiter((m for c in candidates for m in c), dtype=np.int32, count=sum(counts))
+    return np.repeat(user_ids, counts).astype(np.int32), out_movies
+
+def build_neighbor_candidates(ratings_index, user_ids, item_neighbors, n=N_NEIGHBOR):
+    """Top-n unseen neighbors of each user's recent liked movies, as int32 (UserID, MovieID) arrays"""
+    candidates = [
+        item_neighbors.expand(
+            recent_liked(ratings_index, user_id), n,
+            lambda movie_ids, user_id=user_id: ratings_index.seen_mask(user_id, movie_ids)
         )
-        
-        for mid in top_movies:
-            candidates.append((user_id, mid, "genre_similarity"))
-    
-    return pd.DataFrame(candidates, columns=["UserID", "MovieID", "candidate_source"])
+        for user_id in user_ids.tolist()
+    ]
+    counts = [len(c) for c in candidates]
+    out_movies = np.fromiter((m for c in candidates for m in c), dtype=np.int32, count=sum(counts))
+    return np.repeat(user_ids, counts).astype(np.int32), out_movies
 
 def main():
     os.makedirs(CANDIDATE_DIR, exist_ok=True)
     
     print("Loading data...")
-    ratings, movies, users = load_data()
+    with step("load") as record:
+        ratings, movies, users = load_data()
+        record["rows"] = len(ratings)
     
     print("Generating popularity candidates...")
-    popular_movies = get_popular_movies(ratings)
-    pop_candidates = pd.DataFrame(
-        [(u, m, "popularity") for u in users["UserID"] for m in popular_movies],
-        columns=["UserID", "MovieID", "candidate_source"]
-    )
+    with step("popularity", rows=len(ratings)):
+        popular_movies = np.asarray(get_popular_movies(ratings), dtype=np.int32)
+        user_ids = users["UserID"].to_numpy(np.int32)
+        pop_candidates = pd.DataFrame({
+            "UserID": np.repeat(user_ids, len(popular_movies)),
+            "MovieID": np.tile(popular_movies, len(user_ids)),
+            "candidate_source": "popularity"
+        })
     
     print("Generating genre-based candidates...")
-    genre_candidates = build_genre_candidates(ratings, movies)
+    with step("genre", rows=len(ratings)):
+        genre_users, genre_movies = build_genre_candidates(ratings, movies, n_workers=N_WORKERS)
+    genre_candidates = pd.DataFrame({
+        "UserID": genre_users,
+        "MovieID": genre_movies,
+        "candidate_source": "genre_similarity"
+    })
+    
+    sources = [pop_candidates, genre_candidates]
+    ratings_index = RatingsIndex.from_ratings(ratings)
+    retriever = load_retriever()
+    if retriever is not None:
+        print("Generating embedding (ANN) candidates...")
+        with step("embedding", rows=len(user_ids)):
+            emb_users, emb_movies = build_embedding_candidates(ratings_index, user_ids, retriever)
+        sources.append(pd.DataFrame({
+            "UserID": emb_users,
+            "MovieID": emb_movies,
+            "candidate_source": "embedding"
+        }))
+    
+    item_neighbors = ItemNeighbors.load()
+    if item_neighbors is not None:
+        print("Generating item-neighbor candidates...")
+        with step("item_neighbors", rows=len(user_ids)):
+            nb_users, nb_movies = build_neighbor_candidates(ratings_index, user_ids, item_neighbors)
+        sources.append(pd.DataFrame({
+            "UserID": nb_users,
+            "MovieID": nb_movies,
+            "candidate_source": "item_neighbors"
+        }))
     
     print("Combining candidates...")
-    candidates = pd.concat([pop_candidates, genre_candidates])
-    candidates = candidates.drop_duplicates(subset=["UserID", "MovieID"]).reset_index(drop=True)
+    with step("combine", rows=sum(len(s) for s in sources)):
+        candidates = pd.concat(sources)
+        candidates = candidates.drop_duplicates(subset=["UserID", "MovieID"]).reset_index(drop=True)
+        candidates["candidate_source"] = candidates["candidate_source"].astype("category")
     
-    candidates.to_csv(os.path.join(CANDIDATE_DIR, "user_movie_candidates.csv"), index=False)
+    with step("save", rows=len(candidates)):
+        save_table(candidates, CANDIDATE_DIR, "user_movie_candidates")
     print(f"Candidate generation completed!")
     print(f"Total candidates: {len(candidates):,}")
 
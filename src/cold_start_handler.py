@@ -1,8 +1,30 @@
 import pandas as pd
 import numpy as np
 import os
+from collections import Counter
+
+from artifacts import load_table, save_table, artifact_path
+from movie_catalog import MovieCatalog
+from profiler import step
 
 PROCESSED_DIR = "data/processed"
+PROFILES_NAME = "cold_start_profiles"
+# Artifacts the profiles are built from; a newer one makes the persisted profiles stale
+PROFILE_SOURCES = ["ratings_processed", "users_processed"]
+
+DEMOGRAPHIC_TOP_N = 50
+DEMOGRAPHIC_MIN_COUNT = 5
+FALLBACK_TOP_N = 100
+REGIONAL_TOP_N = 100
+REGIONAL_MIN_COUNT = 10
+LIKED_RATING = 4
+
+REGION_MAP = {
+    '0': 'Northeast', '1': 'Northeast',
+    '2': 'South', '3': 'South', '6': 'South', '7': 'South',
+    '4': 'Midwest', '5': 'Midwest',
+    '8': 'West', '9': 'West'
+}
 
 def extract_region_from_zipcode(zipcode):
     if pd.isna(zipcode) or zipcode == '':
@@ -10,107 +32,148 @@ def extract_region_from_zipcode(zipcode):
     zipcode = str(zipcode).strip()
     if len(zipcode) < 1:
         return 'Other'
-    region_map = {
-        '0': 'Northeast', '1': 'Northeast',
-        '2': 'South', '3': 'South', '6': 'South', '7': 'South',
-        '4': 'Midwest', '5': 'Midwest',
-        '8': 'West', '9': 'West'
+    return REGION_MAP.get(zipcode[0], 'Other')
+
+def zipcode_regions(zipcodes):
+    """Vectorized extract_region_from_zipcode over a Series"""
+    first = zipcodes.astype("string").str.strip().str[:1]
+    return first.map(REGION_MAP).fillna('Other').astype(object)
+
+# ----------------------------
+# Offline profile build
+# ----------------------------
+def _top_movies(liked, keys, min_count, n):
+    """Top-n movies per keys group by avg_rating * log1p(count), ties in MovieID order.
+
+    A group left without movies keeps one MovieID -1 row, so it still
+    counts as an existing (empty) profile.
+    """
+    stats = liked.groupby(keys + ['MovieID'])['Rating'].agg(['mean', 'count']).reset_index()
+    groups = stats[keys].drop_duplicates()
+    stats = stats[stats['count'] >= min_count]
+    stats['score'] = stats['mean'] * np.log1p(stats['count'])
+    stats = stats.sort_values(keys + ['score'], ascending=[True] * len(keys) + [False], kind='stable')
+    top = stats[stats.groupby(keys).cumcount() < n][keys + ['MovieID']]
+    empty = groups.merge(top[keys].drop_duplicates(), on=keys, how='left', indicator=True)
+    empty = empty.loc[empty['_merge'] == 'left_only', keys].assign(MovieID=-1)
+    return pd.concat([top, empty], ignore_index=True).sort_values(keys, kind='stable')
+
+def _fallback_movies(demographic):
+    # (gender, age) profiles: most frequent movies over that pair's occupation profiles
+    rows = []
+    for (gender, age), group in demographic.groupby(['Gender', 'Age'], sort=True):
+        counts = Counter(m for m in group['MovieID'].tolist() if m >= 0)
+        rows.extend((gender, age, m) for m, _ in counts.most_common(FALLBACK_TOP_N))
+    return pd.DataFrame(rows, columns=['Gender', 'Age', 'MovieID'])
+
+def build_cold_start_profiles(ratings, users):
+    """All cold-start profiles as one long table, ranked within each profile.
+
+    profile is "demographic" (Gender, Age, Occupation), "gender_age" (the
+    fallback when the exact triple has no profile) or "region". Unused key
+    columns hold -1 / "".
+    """
+    users = users.set_index('UserID')
+    liked = ratings.loc[ratings['Rating'] >= LIKED_RATING, ['UserID', 'MovieID', 'Rating']]
+    demo = users.reindex(liked['UserID'].to_numpy())
+    liked = liked.assign(
+        Gender=demo['Gender'].to_numpy(), Age=demo['Age'].to_numpy(),
+        Occupation=demo['Occupation'].to_numpy(), Region=zipcode_regions(demo['ZipCode']).to_numpy()
+    )
+
+    demographic = _top_movies(
+        liked, ['Gender', 'Age', 'Occupation'], DEMOGRAPHIC_MIN_COUNT, DEMOGRAPHIC_TOP_N
+    )
+    fallback = _fallback_movies(demographic)
+    regional = _top_movies(liked, ['Region'], REGIONAL_MIN_COUNT, REGIONAL_TOP_N)
+
+    profiles = pd.concat([
+        demographic.assign(profile='demographic', Region=''),
+        fallback.assign(profile='gender_age', Occupation=-1, Region=''),
+        regional.assign(profile='region', Gender='', Age=-1, Occupation=-1),
+    ], ignore_index=True)
+    return profiles[['profile', 'Gender', 'Age', 'Occupation', 'Region', 'MovieID']]
+
+def profiles_are_fresh(directory=PROCESSED_DIR):
+    path = artifact_path(directory, PROFILES_NAME)
+    if not os.path.exists(path):
+        return False
+    sources = [artifact_path(directory, name) for name in PROFILE_SOURCES]
+    return all(os.path.getmtime(path) >= os.path.getmtime(s) for s in sources if os.path.exists(s))
+
+def save_cold_start_profiles(directory=PROCESSED_DIR):
+    """Build the profiles from the processed ratings/users and persist them"""
+    ratings = load_table(directory, "ratings_processed", columns=["UserID", "MovieID", "Rating"])
+    users = load_table(
+        directory, "users_processed", columns=["UserID", "Gender", "Age", "Occupation", "ZipCode"]
+    )
+    with step("profiles", rows=len(ratings)):
+        profiles = build_cold_start_profiles(ratings, users)
+    save_table(profiles, directory, PROFILES_NAME)
+    return profiles
+
+# ----------------------------
+# Serving
+# ----------------------------
+def _profile_index(profiles, kind, keys):
+    # {key tuple: [MovieID, ...]} for one profile kind, keeping the stored rank order
+    part = profiles[profiles['profile'] == kind]
+    return {
+        tuple(key): [m for m in group['MovieID'].tolist() if m >= 0]
+        for key, group in part.groupby(keys, sort=False)
     }
-    return region_map.get(zipcode[0], 'Other')
 
 class ColdStartHandler:
-    def __init__(self):
-        self.load_data()
-        self.build_demographic_profiles()
-        self.build_regional_profiles()
-    
-    def load_data(self):
-        self.ratings = pd.read_csv(os.path.join(PROCESSED_DIR, "ratings_processed.csv"))
-        self.movies = pd.read_csv(os.path.join(PROCESSED_DIR, "movies_processed.csv"))
-        self.users = pd.read_csv(os.path.join(PROCESSED_DIR, "users_processed.csv"))
-        self.item_stats = pd.read_csv(os.path.join(PROCESSED_DIR, "item_stats.csv"))
-    
-    def build_demographic_profiles(self):
-        ratings_with_demo = self.ratings.merge(
-            self.users[['UserID', 'Gender', 'Age', 'Occupation']],
-            on='UserID', how='left'
+    """Demographic / regional recommendations for users without ratings.
+
+    Profiles come from the persisted cold_start_profiles artifact (rebuilt
+    when it is older than the ratings or users) and are held as dicts keyed
+    by (gender, age, occupation), (gender, age) and region, so a request is
+    a few dict lookups and list merges. movies / item_stats frames already
+    loaded by the caller are reused instead of being read again.
+    """
+
+    def __init__(self, directory=PROCESSED_DIR, movies=None, item_stats=None, catalog=None):
+        self.directory = directory
+        self.load_data(movies, item_stats, catalog)
+        self.load_profiles()
+
+    def load_data(self, movies=None, item_stats=None, catalog=None):
+        stats_cols = ["MovieID", "item_avg_rating", "item_rating_count"]
+        self.movies = load_table(self.directory, "movies_processed") if movies is None else movies
+        self.item_stats = (
+            load_table(self.directory, "item_stats", columns=stats_cols) if item_stats is None
+            else item_stats[stats_cols]
         )
-        demographic_groups = ratings_with_demo[
-            ratings_with_demo['Rating'] >= 4
-        ].groupby(['Gender', 'Age', 'Occupation'])
-        profiles = []
-        for (gender, age, occupation), group in demographic_groups:
-            top_movies = group.groupby('MovieID').agg(
-                avg_rating=('Rating', 'mean'),
-                rating_count=('Rating', 'count')
-            ).reset_index()
-            top_movies = top_movies[top_movies['rating_count'] >= 5]
-            top_movies['score'] = top_movies['avg_rating'] * np.log1p(top_movies['rating_count'])
-            top_movies = top_movies.nlargest(50, 'score')
-            profiles.append({
-                'gender': gender,
-                'age': age,
-                'occupation': occupation,
-                'top_movies': top_movies['MovieID'].tolist()
-            })
-        self.demographic_profiles = pd.DataFrame(profiles)
-    
-    def build_regional_profiles(self):
-        self.users['region'] = self.users['ZipCode'].apply(extract_region_from_zipcode)
-        ratings_with_region = self.ratings.merge(
-            self.users[['UserID', 'region']], on='UserID', how='left'
+        self.popular_movies = (
+            self.item_stats.sort_values('item_rating_count', ascending=False)['MovieID'].tolist()
         )
-        regional_groups = ratings_with_region[
-            ratings_with_region['Rating'] >= 4
-        ].groupby('region')
-        profiles = []
-        for region, group in regional_groups:
-            top_movies = group.groupby('MovieID').agg(
-                avg_rating=('Rating', 'mean'),
-                rating_count=('Rating', 'count')
-            ).reset_index()
-            top_movies = top_movies[top_movies['rating_count'] >= 10]
-            top_movies['score'] = top_movies['avg_rating'] * np.log1p(top_movies['rating_count'])
-            top_movies = top_movies.nlargest(100, 'score')
-            profiles.append({
-                'region': region,
-                'n_users': group['UserID'].nunique(),
-                'top_movies': top_movies['MovieID'].tolist()
-            })
-        self.regional_profiles = pd.DataFrame(profiles)
-    
+        self.catalog = MovieCatalog(self.movies, self.item_stats) if catalog is None else catalog
+
+    def load_profiles(self):
+        if profiles_are_fresh(self.directory):
+            profiles = load_table(self.directory, PROFILES_NAME)
+        else:
+            profiles = save_cold_start_profiles(self.directory)
+        profiles['Age'] = profiles['Age'].astype(int)
+        profiles['Occupation'] = profiles['Occupation'].astype(int)
+        self.demographic_profiles = _profile_index(profiles, 'demographic', ['Gender', 'Age', 'Occupation'])
+        self.gender_age_profiles = _profile_index(profiles, 'gender_age', ['Gender', 'Age'])
+        self.regional_profiles = {
+            region: movies for (region,), movies in _profile_index(profiles, 'region', ['Region']).items()
+        }
+
     def get_cold_start_user_recommendations(self, user_demographics, top_k=10):
         gender = user_demographics.get('gender', 'M')
         age = user_demographics.get('age', 25)
         occupation = user_demographics.get('occupation', 0)
         zipcode = user_demographics.get('zipcode', None)
-        matching_profile = self.demographic_profiles[
-            (self.demographic_profiles['gender'] == gender) &
-            (self.demographic_profiles['age'] == age) &
-            (self.demographic_profiles['occupation'] == occupation)
-        ]
-        demographic_movies = []
-        if not matching_profile.empty:
-            demographic_movies = matching_profile.iloc[0]['top_movies']
-        else:
-            matching_profile = self.demographic_profiles[
-                (self.demographic_profiles['gender'] == gender) &
-                (self.demographic_profiles['age'] == age)
-            ]
-            if not matching_profile.empty:
-                all_movies = []
-                for _, row in matching_profile.iterrows():
-                    all_movies.extend(row['top_movies'])
-                from collections import Counter
-                demographic_movies = [m for m, _ in Counter(all_movies).most_common(100)]
+        demographic_movies = self.demographic_profiles.get((gender, age, occupation))
+        if demographic_movies is None:
+            demographic_movies = self.gender_age_profiles.get((gender, age), [])
         regional_movies = []
         if zipcode:
-            region = extract_region_from_zipcode(zipcode)
-            matching_region = self.regional_profiles[
-                self.regional_profiles['region'] == region
-            ]
-            if not matching_region.empty:
-                regional_movies = matching_region.iloc[0]['top_movies']
+            regional_movies = self.regional_profiles.get(extract_region_from_zipcode(zipcode), [])
         if regional_movies:
             demo_count = int(top_k * 0.6)
             regional_count = top_k - demo_count
@@ -131,37 +194,34 @@ class ColdStartHandler:
         if not movies:
             movies = self.get_popular_movies(top_k)
         return movies[:top_k]
-    
+
     def get_popular_movies(self, top_k=10):
-        return (
-            self.item_stats.sort_values('item_rating_count', ascending=False)
-            .head(top_k)['MovieID'].tolist()
-        )
-    
-    def recommend(self, user_id=None, user_demographics=None, top_k=10):
+        return self.popular_movies[:top_k]
+
+    def recommend_ids(self, user_demographics=None, top_k=10):
+        """Recommended MovieIDs that the catalog can describe, best first"""
         if user_demographics is None:
             movie_ids = self.get_popular_movies(top_k)
         else:
             movie_ids = self.get_cold_start_user_recommendations(user_demographics, top_k)
-        recommendations = self.movies[
-            self.movies['MovieID'].isin(movie_ids)
-        ].copy()
-        genre_cols = [c for c in self.movies.columns if c not in ['MovieID', 'Title', 'Release_Year']]
-        def get_genres(row):
-            active = [g for g in genre_cols if row[g] == 1]
-            return "|".join(active) if active else "Movie"
-        recommendations['Genres'] = recommendations.apply(get_genres, axis=1)
+        return [m for m in movie_ids if m in self.catalog]
+
+    def recommend_records(self, user_demographics=None, top_k=10):
+        """Recommendations as response dicts (title, release_year, genres, avg_rating, num_ratings)"""
+        return self.catalog.records(self.recommend_ids(user_demographics, top_k))
+
+    def recommend(self, user_id=None, user_demographics=None, top_k=10):
+        movie_ids = self.recommend_ids(user_demographics, top_k)
+        recommendations = self.movies.set_index('MovieID').loc[movie_ids].reset_index()
+        recommendations['Genres'] = self.catalog.genres[movie_ids]
         recommendations = recommendations.merge(
             self.item_stats[['MovieID', 'item_avg_rating', 'item_rating_count']],
             on='MovieID', how='left'
         )
-        recommendations['order'] = recommendations['MovieID'].map(
-            {mid: i for i, mid in enumerate(movie_ids)}
-        )
-        recommendations = recommendations.sort_values('order').drop('order', axis=1)
         return recommendations.head(top_k)
 
 def main():
+    save_cold_start_profiles()
     handler = ColdStartHandler()
     new_user_demo = {'gender': 'F', 'age': 25, 'occupation': 4, 'zipcode': '90210'}
     recs = handler.recommend(user_demographics=new_user_demo, top_k=10)
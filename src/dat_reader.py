@@ -0,0 +1,165 @@
+# src/dat_reader.py
+
+import io
+import csv
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CHUNK_BYTES = 8 * 1024 * 1024
+FIELD_SEP = b"::"
+TEXT_SEP = "\x1f"
+
+RATINGS_SCHEMA = {"UserID": np.int32, "MovieID": np.int32, "Rating": np.int8, "Timestamp": np.int64}
+USERS_SCHEMA = {"UserID": np.int32, "Gender": str, "Age": np.int8, "Occupation": np.int8, "ZipCode": str}
+MOVIES_SCHEMA = {"MovieID": np.int32, "Title": str, "Genres": str}
+
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+# ----------------------------
+# Block reading
+# ----------------------------
+def iter_blocks(path, chunk_bytes=CHUNK_BYTES):
+    """Yield raw byte blocks of a file, always cut on a line boundary"""
+    with open(path, "rb") as f:
+        tail = b""
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data = tail + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                tail = data
+                continue
+            tail = data[cut:]
+            yield data[:cut]
+        if tail.strip():
+            yield tail
+
+# ----------------------------
+# Block parsers
+# ----------------------------
+def _span_values(buf, first, last):
+    """Integer value of each digit span buf[first..last] (inclusive, empty when last < first)"""
+    lengths = last - first + 1
+    values = np.zeros(len(first), dtype=np.int64)
+    max_len = int(lengths.max(initial=0))
+    uniform = max_len == int(lengths.min(initial=0))
+    for j in range(max_len):
+        digits = buf[np.minimum(first + j, len(buf) - 1)].astype(np.int64) - 48
+        if uniform:
+            values = values * 10 + digits
+        else:
+            values = np.where(j < lengths, values * 10 + digits, values)
+    return values
+
+def parse_numeric_block(block, n_cols):
+    """Decode a block of purely numeric '::' rows into an (n_rows, n_cols) array.
+
+    Fields are located with byte masks and accumulated column by column with
+    NumPy, so no per-field Python strings are created. Returns the values and
+    a per-column flag telling whether any field had a decimal part (e.g. the
+    half-star ratings of ML-10M).
+    """
+    buf = np.frombuffer(block, dtype=np.uint8)
+    is_dot = buf == 46
+    in_field = ((buf >= 48) & (buf <= 57)) | is_dot
+    edges = np.diff(in_field.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    if len(starts) % n_cols:
+        raise ValueError(f"Malformed block: {len(starts)} numeric fields is not a multiple of {n_cols} columns")
+
+    dot_idx = np.flatnonzero(is_dot)
+    dot_pos = None
+    if len(dot_idx):
+        dot_pos = ends + 1
+        dot_pos[np.searchsorted(starts, dot_idx, side="right") - 1] = dot_idx
+
+    values = np.empty((len(starts) // n_cols, n_cols), dtype=np.float64)
+    has_frac = np.zeros(n_cols, dtype=bool)
+    for c in range(n_cols):
+        first, last = starts[c::n_cols], ends[c::n_cols]
+        if dot_pos is None or not (dot_pos[c::n_cols] <= last).any():
+            values[:, c] = _span_values(buf, first, last)
+            continue
+        point = dot_pos[c::n_cols]
+        frac_len = np.maximum(last - point, 0)
+        values[:, c] = (
+            _span_values(buf, first, point - 1)
+            + _span_values(buf, point + 1, last) / _POW10[frac_len]
+        )
+        has_frac[c] = True
+
+    return values, has_frac
+
+def parse_text_block(block, names, dtypes):
+    """Decode a block with text fields using the C CSV engine"""
+    return pd.read_csv(
+        io.BytesIO(block.replace(FIELD_SEP, TEXT_SEP.encode())),
+        sep=TEXT_SEP,
+        header=None,
+        names=names,
+        dtype=dtypes,
+        quoting=csv.QUOTE_NONE,
+        encoding="latin-1",
+        engine="c"
+    )
+
+def is_numeric_schema(schema):
+    return all(dtype is not str and np.issubdtype(dtype, np.number) for dtype in schema.values())
+
+def _frame_from_values(values, has_frac, schema):
+    columns = {}
+    for i, (name, dtype) in enumerate(schema.items()):
+        if has_frac[i] and np.issubdtype(dtype, np.integer):
+            dtype = np.float32
+        columns[name] = values[:, i].astype(dtype)
+    return pd.DataFrame(columns)
+
+def _parse_block(block, schema):
+    if is_numeric_schema(schema):
+        values, has_frac = parse_numeric_block(block, len(schema))
+        return _frame_from_values(values, has_frac, schema)
+    return parse_text_block(block, list(schema), schema)
+
+# ----------------------------
+# Public readers
+# ----------------------------
+def iter_dat(path, schema, chunk_bytes=CHUNK_BYTES, n_threads=1):
+    """Stream a '::'-delimited file as typed DataFrame chunks.
+
+    With n_threads > 1 blocks are decoded in a thread pool; at most
+    2 * n_threads blocks are in flight, so memory stays bounded by chunk size.
+    """
+    blocks = iter_blocks(path, chunk_bytes)
+    if n_threads <= 1:
+        for block in blocks:
+            yield _parse_block(block, schema)
+        return
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        pending = deque()
+        for block in blocks:
+            pending.append(pool.submit(_parse_block, block, schema))
+            if len(pending) >= 2 * n_threads:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def read_dat(path, schema, chunk_bytes=CHUNK_BYTES, n_threads=1):
+    """Read a whole '::'-delimited file into one typed DataFrame"""
+    chunks = list(iter_dat(path, schema, chunk_bytes, n_threads))
+    if not chunks:
+        return pd.DataFrame({name: pd.Series(dtype=object if dtype is str else dtype)
+                             for name, dtype in schema.items()})
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks, ignore_index=True)
+    for name in schema:
+        if any(chunk[name].dtype == np.float32 for chunk in chunks):
+            df[name] = df[name].astype(np.float32)
+    return df
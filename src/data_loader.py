@@ -1,48 +1,28 @@
 # src/data_loader.py
 
-import pandas as pd
 import os
 
+from dat_reader import read_dat, RATINGS_SCHEMA, USERS_SCHEMA, MOVIES_SCHEMA
+
 RAW_DIR = "data/raw"
 
 # ----------------------------
 # Data Loading Functions
 # ----------------------------
-def load_ratings(file_name="ratings.dat"):
-    """Load raw ratings dataset as-is"""
+def load_ratings(file_name="ratings.dat", n_threads=1):
+    """Load raw ratings dataset with typed columns"""
     path = os.path.join(RAW_DIR, file_name)
-    df = pd.read_csv(
-        path,
-        sep="::",
-        engine='python',
-        header=None,
-        encoding='latin-1'
-    )
-    return df
+    return read_dat(path, RATINGS_SCHEMA, n_threads=n_threads)
 
 def load_users(file_name="users.dat"):
-    """Load raw users dataset as-is"""
+    """Load raw users dataset with typed columns"""
     path = os.path.join(RAW_DIR, file_name)
-    df = pd.read_csv(
-        path,
-        sep="::",
-        engine='python',
-        header=None,
-        encoding='latin-1'
-    )
-    return df
+    return read_dat(path, USERS_SCHEMA)
 
 def load_movies(file_name="movies.dat"):
-    """Load raw movies dataset as-is"""
+    """Load raw movies dataset with typed columns"""
     path = os.path.join(RAW_DIR, file_name)
-    df = pd.read_csv(
-        path,
-        sep="::",
-        engine='python',
-        header=None,
-        encoding='latin-1'
-    )
-    return df
+    return read_dat(path, MOVIES_SCHEMA)
 
 # ----------------------------
 # Main loader
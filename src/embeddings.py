@@ -0,0 +1,224 @@
+# src/embeddings.py
+
+import os
+import time
+
+import numpy as np
+
+from artifacts import load_table
+from profiler import step
+
+PROCESSED_DIR = "data/processed"
+MODEL_DIR = "models"
+EMBEDDINGS_PATH = os.path.join(MODEL_DIR, "mf_embeddings.npz")
+
+N_FACTORS = 32
+N_ITERATIONS = 10
+REGULARIZATION = 1.0
+# Confidence of an observed rating: 1 + ALPHA * rating (unobserved pairs have confidence 1)
+ALPHA = 2.0
+N_PROBE = 8
+# search() keeps probing clusters until it has scanned at least SCAN_FACTOR * k items
+SCAN_FACTOR = 10
+KMEANS_ITERATIONS = 20
+SEED = 42
+
+# ----------------------------
+# Implicit ALS
+# ----------------------------
+def _csr(rows, cols, values, n_rows):
+    order = np.argsort(rows, kind="stable")
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=offsets[1:])
+    return offsets, cols[order], values[order]
+
+def _als_step(fixed, offsets, cols, confidence, reg):
+    """Solve every row's factors against the fixed side (Hu, Koren & Volinsky 2008).
+
+    x_u = (YᵀY + Y_uᵀ (C_u - I) Y_u + reg·I)⁻¹ Y_uᵀ C_u 1: the shared YᵀY covers
+    all unobserved pairs, so each row only touches its own observations.
+    """
+    n_factors = fixed.shape[1]
+    base = fixed.T @ fixed + reg * np.eye(n_factors)
+    out = np.zeros((len(offsets) - 1, n_factors))
+    for row in range(len(offsets) - 1):
+        start, end = offsets[row], offsets[row + 1]
+        if start == end:
+            continue
+        Y = fixed[cols[start:end]]
+        c = confidence[start:end]
+        A = base + (Y.T * (c - 1)) @ Y
+        out[row] = np.linalg.solve(A, Y.T @ c)
+    return out
+
+def train_implicit_als(ratings, n_factors=N_FACTORS, n_iterations=N_ITERATIONS, reg=REGULARIZATION,
+                       alpha=ALPHA, seed=SEED, verbose=False):
+    """User and item factors whose dot product predicts which movies a user rates.
+
+    Returns (user_ids, user_factors, item_ids, item_factors) as float32
+    arrays; only users and movies present in ratings get factors.
+    """
+    user_ids, user_rows = np.unique(ratings["UserID"].to_numpy(), return_inverse=True)
+    item_ids, item_cols = np.unique(ratings["MovieID"].to_numpy(), return_inverse=True)
+    confidence = 1 + alpha * ratings["Rating"].to_numpy(np.float64)
+    by_user = _csr(user_rows, item_cols, confidence, len(user_ids))
+    by_item = _csr(item_cols, user_rows, confidence, len(item_ids))
+
+    rng = np.random.default_rng(seed)
+    item_factors = rng.normal(0, 0.01, (len(item_ids), n_factors))
+    for iteration in range(n_iterations):
+        start = time.time()
+        user_factors = _als_step(item_factors, *by_user, reg)
+        item_factors = _als_step(user_factors, *by_item, reg)
+        if verbose:
+            print(f"  ALS iteration {iteration + 1}/{n_iterations} ({time.time() - start:.1f}s)")
+    return user_ids, user_factors.astype(np.float32), item_ids, item_factors.astype(np.float32)
+
+# ----------------------------
+# IVF index
+# ----------------------------
+def kmeans(vectors, n_clusters, n_iterations=KMEANS_ITERATIONS, seed=SEED):
+    """Lloyd's k-means; returns (centroids, assignment)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].astype(np.float64)
+    sq_norms = (vectors.astype(np.float64) ** 2).sum(axis=1)
+    for _ in range(n_iterations):
+        distances = sq_norms[:, None] - 2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)
+        assignment = distances.argmin(axis=1)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids.astype(np.float32), assignment
+
+class IVFIndex:
+    """Inverted-file index for maximum inner product search over item vectors.
+
+    Items are clustered with k-means and stored contiguously per cluster.
+    search() scores the query against the centroids, scans the n_probe best
+    clusters (more when they hold fewer than SCAN_FACTOR * k items) and
+    returns the best ids among them, so its cost grows with the scanned
+    clusters rather than with the catalog.
+    """
+
+    ARRAYS = ("ids", "vectors", "centroids", "list_offsets")
+
+    def __init__(self, ids, vectors, centroids, list_offsets, n_probe=N_PROBE):
+        self.ids = ids
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, ids, vectors, n_lists=None, n_probe=N_PROBE, seed=SEED):
+        n_lists = n_lists or max(1, int(round(np.sqrt(len(ids)))))
+        centroids, assignment = kmeans(vectors, min(n_lists, len(ids)), seed=seed)
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(ids[order], np.ascontiguousarray(vectors[order]), centroids, list_offsets, n_probe)
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays, n_probe=N_PROBE):
+        return cls(*(arrays[name] for name in cls.ARRAYS), n_probe=n_probe)
+
+    def probe(self, query, n_probe=None, min_items=0):
+        """Positions of the items in the best-scoring clusters for query.
+
+        At least n_probe clusters, and enough of them to hold min_items items.
+        """
+        lists = np.argsort(-(self.centroids @ query))
+        sizes = np.diff(self.list_offsets)[lists]
+        ends = np.cumsum(sizes)
+        n_lists = max(n_probe or self.n_probe, int(np.searchsorted(ends, min_items)) + 1)
+        lists, sizes, ends = lists[:n_lists], sizes[:n_lists], ends[:n_lists]
+        # Concatenated ranges list_offsets[l]:list_offsets[l + 1] of the chosen clusters
+        return np.arange(ends[-1]) + np.repeat(self.list_offsets[lists] - (ends - sizes), sizes)
+
+    def search(self, query, k, exclude=None, n_probe=None):
+        """(ids, scores) of the k best items by inner product, best first.
+
+        exclude(ids) -> bool mask drops items (e.g. already seen) before the top-k.
+        """
+        positions = self.probe(query, n_probe, SCAN_FACTOR * k)
+        scores = self.vectors[positions] @ query
+        if exclude is not None:
+            scores[exclude(self.ids[positions])] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return self.ids[:0], scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.ids[positions[top]], scores[top]
+
+# ----------------------------
+# Candidate source
+# ----------------------------
+class EmbeddingRetriever:
+    """Collaborative candidate source: the user's factor vector searched in the item IVF index"""
+
+    def __init__(self, user_ids, user_factors, index):
+        self.user_ids = user_ids
+        self.user_factors = user_factors
+        self.index = index
+        self.user_pos = np.full(int(user_ids.max(initial=0)) + 1, -1, dtype=np.int32)
+        self.user_pos[user_ids] = np.arange(len(user_ids), dtype=np.int32)
+
+    def user_vector(self, user_id):
+        if 0 <= user_id < len(self.user_pos) and self.user_pos[user_id] >= 0:
+            return self.user_factors[self.user_pos[user_id]]
+        return None
+
+    def candidates(self, user_id, n, ratings_index=None):
+        """Up to n unseen MovieIDs for user_id, best first ([] for users without factors)"""
+        query = self.user_vector(user_id)
+        if query is None:
+            return []
+        exclude = None
+        if ratings_index is not None:
+            exclude = lambda movie_ids: ratings_index.seen_mask(user_id, movie_ids)
+        return self.index.search(query, n, exclude)[0].tolist()
+
+def save_embeddings(user_ids, user_factors, index, path=EMBEDDINGS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}.npz"
+    np.savez(tmp_path, user_ids=user_ids, user_factors=user_factors,
+             **{f"index_{k}": v for k, v in index.to_arrays().items()})
+    os.replace(tmp_path, path)
+    return path
+
+def load_retriever(path=EMBEDDINGS_PATH, n_probe=N_PROBE):
+    """EmbeddingRetriever from the saved factors and index, or None when they were never built"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        arrays = {k: data[k] for k in data.files}
+    index = IVFIndex.from_arrays(
+        {k[len("index_"):]: v for k, v in arrays.items() if k.startswith("index_")}, n_probe
+    )
+    return EmbeddingRetriever(arrays["user_ids"], arrays["user_factors"], index)
+
+def build_embeddings(path=EMBEDDINGS_PATH, verbose=True):
+    ratings = load_table(PROCESSED_DIR, "ratings_processed", columns=["UserID", "MovieID", "Rating"])
+    with step("als", rows=len(ratings)):
+        user_ids, user_factors, item_ids, item_factors = train_implicit_als(ratings, verbose=verbose)
+    with step("ivf_index", rows=len(item_ids)):
+        index = IVFIndex.build(item_ids, item_factors)
+    save_embeddings(user_ids, user_factors, index, path)
+    return user_ids, user_factors, index
+
+def main():
+    print("="*70)
+    print("MATRIX FACTORIZATION EMBEDDINGS")
+    print("="*70)
+    user_ids, _, index = build_embeddings()
+    print(f"  ✓ {len(user_ids):,} users x {len(index.ids):,} movies, {N_FACTORS} factors, "
+          f"{len(index.centroids)} IVF lists -> {EMBEDDINGS_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# src/evaluation.py
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+EVAL_KS = (5, 10, 20)
+METRICS = ("ndcg", "precision", "recall", "map", "mrr")
+
+def group_metrics(qid, y_true, y_pred, ks=EVAL_KS):
+    """Per-query ranking metrics for every k in one vectorized pass.
+
+    Rows are sorted once with lexsort by (qid, -score); ties keep their
+    input order. Gains are the labels (NDCG); any label > 0 is relevant
+    (precision, recall, MAP, MRR). Returns {f"{metric}@{k}": per-group
+    values} plus a per-k validity mask under f"valid@{k}": groups with at
+    least one relevant row and at least k rows.
+    """
+    qid = np.asarray(qid)
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred = np.asarray(y_pred)
+
+    order = np.lexsort((-y_pred, qid))
+    q = qid[order]
+    gains = y_true[order]
+    relevant = gains > 0
+
+    starts = np.flatnonzero(np.r_[True, q[1:] != q[:-1]]) if len(q) else np.zeros(0, dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(q)])
+    group = np.repeat(np.arange(len(starts)), sizes)
+    pos = np.arange(len(q)) - starts[group]
+    n_groups = len(starts)
+
+    # Ideal order: the same groups sorted by label
+    ideal = y_true[np.lexsort((-y_true, qid))]
+    discount = 1.0 / np.log2(pos + 2)
+
+    n_relevant = np.bincount(group, weights=relevant, minlength=n_groups)
+    label_sum = np.bincount(group, weights=gains, minlength=n_groups)
+    cum_hits = np.cumsum(relevant) - np.repeat(np.cumsum(relevant)[starts] - relevant[starts], sizes)
+    first_hit = np.full(n_groups, np.iinfo(np.int64).max)
+    np.minimum.at(first_hit, group[relevant], pos[relevant])
+
+    results = {}
+    for k in ks:
+        top = pos < k
+        hits = np.bincount(group, weights=relevant & top, minlength=n_groups)
+        dcg = np.bincount(group, weights=gains * discount * top, minlength=n_groups)
+        idcg = np.bincount(group, weights=ideal * discount * top, minlength=n_groups)
+        ap_sum = np.bincount(group, weights=relevant * top * cum_hits / (pos + 1), minlength=n_groups)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            results[f"ndcg@{k}"] = np.where(idcg > 0, dcg / idcg, 0.0)
+            results[f"precision@{k}"] = hits / np.minimum(k, sizes)
+            results[f"recall@{k}"] = np.where(n_relevant > 0, hits / n_relevant, 0.0)
+            results[f"map@{k}"] = np.where(n_relevant > 0, ap_sum / np.minimum(n_relevant, k), 0.0)
+        results[f"mrr@{k}"] = np.where(first_hit < k, 1.0 / (np.minimum(first_hit, k) + 1.0), 0.0)
+        results[f"valid@{k}"] = (label_sum > 0) & (sizes >= k)
+    return results
+
+def _split_groups(qid, n_parts):
+    # Cut points on group boundaries of a qid-grouped array
+    starts = np.flatnonzero(np.r_[True, qid[1:] != qid[:-1]])
+    cuts = starts[np.linspace(0, len(starts), n_parts + 1).astype(int)[1:-1]]
+    return np.split(np.arange(len(qid)), cuts)
+
+def evaluate_ranking(qid, y_true, y_pred, ks=EVAL_KS, n_workers=1):
+    """Mean of every metric over the valid queries, e.g. {"ndcg@10": ...}.
+
+    With n_workers > 1 the queries are split into contiguous blocks scored
+    in a process pool (qid must then be grouped, e.g. sorted).
+    """
+    qid, y_true, y_pred = np.asarray(qid), np.asarray(y_true), np.asarray(y_pred)
+    if n_workers <= 1 or len(qid) == 0:
+        parts = [group_metrics(qid, y_true, y_pred, ks)]
+    else:
+        blocks = _split_groups(qid, n_workers)
+        with ProcessPoolExecutor(n_workers) as pool:
+            parts = list(pool.map(
+                group_metrics,
+                [qid[b] for b in blocks], [y_true[b] for b in blocks], [y_pred[b] for b in blocks],
+                [ks] * len(blocks)
+            ))
+
+    summary = {}
+    for k in ks:
+        valid = np.concatenate([p[f"valid@{k}"] for p in parts])
+        for metric in METRICS:
+            values = np.concatenate([p[f"{metric}@{k}"] for p in parts])[valid]
+            summary[f"{metric}@{k}"] = values.mean() if len(values) else np.nan
+    return summary
@@ -1,16 +1,26 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+import shutil
+import pyarrow as pa
+
+from artifacts import (
+    save_table, load_table, remove_table, iter_table_batches, TableWriter
+)
+from profiler import step
 
 PROCESSED_DIR = "data/processed"
 FEATURE_DIR = "data/features"
+CURRENT_YEAR = 2003
+ROWS_PER_SHARD = 1_000_000
 
 def load_data():
-    ratings = pd.read_csv(os.path.join(PROCESSED_DIR, "ratings_processed.csv"))
-    movies = pd.read_csv(os.path.join(PROCESSED_DIR, "movies_processed.csv"))
-    user_stats = pd.read_csv(os.path.join(PROCESSED_DIR, "user_stats.csv"))
-    item_stats = pd.read_csv(os.path.join(PROCESSED_DIR, "item_stats.csv"))
-    user_genre_prefs = pd.read_csv(os.path.join(PROCESSED_DIR, "user_genre_preferences.csv"))
+    ratings = load_table(PROCESSED_DIR, "ratings_processed")
+    movies = load_table(PROCESSED_DIR, "movies_processed")
+    user_stats = load_table(PROCESSED_DIR, "user_stats")
+    item_stats = load_table(PROCESSED_DIR, "item_stats")
+    user_genre_prefs = load_table(PROCESSED_DIR, "user_genre_preferences")
     return ratings, movies, user_stats, item_stats, user_genre_prefs
 
 def build_training_data(ratings, user_stats, item_stats):
@@ -61,12 +71,15 @@ def add_genre_features(df, user_genre_prefs, movies):
     df = df.drop(columns=genre_cols_actual + user_pref_cols_actual, errors='ignore')
     return df
 
-def add_temporal_features(df):
-    current_year = 2003
-    df["movie_age_years"] = current_year - df["Release_Year"]
-    df["movie_age_years"] = df["movie_age_years"].fillna(df["movie_age_years"].median())
+def add_temporal_features(df, age_median=None, ts_range=None):
+    # age_median / ts_range are dataset-wide values; computed from df when not given
+    df["movie_age_years"] = CURRENT_YEAR - df["Release_Year"]
+    if age_median is None:
+        age_median = df["movie_age_years"].median()
+    df["movie_age_years"] = df["movie_age_years"].fillna(age_median)
     df["is_recent_movie"] = (df["movie_age_years"] <= 5).astype(int)
-    df["rating_recency"] = (df["Timestamp"] - df["Timestamp"].min()) / (df["Timestamp"].max() - df["Timestamp"].min())
+    ts_min, ts_max = ts_range if ts_range is not None else (df["Timestamp"].min(), df["Timestamp"].max())
+    df["rating_recency"] = (df["Timestamp"] - ts_min) / (ts_max - ts_min)
     return df
 
 def add_popularity_features(df):
@@ -89,29 +102,137 @@ def select_features(df):
     col_order = [c for c in col_order if c in df.columns]
     return df[col_order], feature_cols
 
-def main():
+def build_features(ratings, movies, user_stats, item_stats, user_genre_prefs, age_median=None, ts_range=None):
+    df = build_training_data(ratings, user_stats, item_stats)
+    df = add_interaction_features(df, ratings)
+    df = add_genre_features(df, user_genre_prefs, movies)
+    df = add_temporal_features(df, age_median, ts_range)
+    df = add_popularity_features(df)
+    return select_features(df)
+
+# ----------------------------
+# Streaming mode
+# ----------------------------
+def movie_age_median(item_stats):
+    """Median movie age over all rating rows, from per-movie ages weighted by rating count"""
+    ages = (CURRENT_YEAR - item_stats["Release_Year"]).to_numpy(np.float64)
+    weights = item_stats["item_rating_count"].to_numpy(np.int64)
+    valid = ~np.isnan(ages)
+    ages, weights = ages[valid], weights[valid]
+    if weights.sum() == 0:
+        return np.nan
+    order = np.argsort(ages, kind="stable")
+    ages, cum = ages[order], np.cumsum(weights[order])
+    n = cum[-1]
+    lo = ages[np.searchsorted(cum, (n - 1) // 2, side="right")]
+    hi = ages[np.searchsorted(cum, n // 2, side="right")]
+    return (lo + hi) / 2
+
+def plan_user_shards(user_stats, rows_per_shard):
+    """UserID -> shard lookup; shards are contiguous UserID ranges of ~rows_per_shard ratings"""
+    stats = user_stats.sort_values("UserID")
+    user_ids = stats["UserID"].to_numpy()
+    rows_before = np.cumsum(stats["user_rating_count"].to_numpy(np.int64)) - stats["user_rating_count"].to_numpy(np.int64)
+    shard = (rows_before // rows_per_shard).astype(np.int32)
+    lookup = np.zeros(int(user_ids.max(initial=0)) + 1, dtype=np.int32)
+    lookup[user_ids] = shard
+    return lookup, int(shard.max(initial=-1)) + 1
+
+def partition_ratings(shard_lookup, n_shards, spill_dir):
+    """One pass over ratings_processed that routes every row to its shard's spill file.
+
+    Returns the spill paths and the global (min, max) Timestamp.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    paths = [os.path.join(spill_dir, f"ratings-{i:05d}.arrow") for i in range(n_shards)]
+    writers = {}
+    schema = None
+    ts_min, ts_max = None, None
+    try:
+        for batch in iter_table_batches(PROCESSED_DIR, "ratings_processed"):
+            if schema is None:
+                schema = pa.Schema.from_pandas(batch, preserve_index=False)
+            ts_min = batch["Timestamp"].min() if ts_min is None else min(ts_min, batch["Timestamp"].min())
+            ts_max = batch["Timestamp"].max() if ts_max is None else max(ts_max, batch["Timestamp"].max())
+            
+            shard = shard_lookup[batch["UserID"].to_numpy()]
+            order = np.argsort(shard, kind="stable")
+            bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+            for i in np.flatnonzero(np.diff(bounds)):
+                part = batch.iloc[order[bounds[i]:bounds[i + 1]]]
+                if i not in writers:
+                    writers[i] = pa.ipc.new_file(paths[i], schema)
+                writers[i].write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [p if i in writers else None for i, p in enumerate(paths)], (ts_min, ts_max)
+
+def build_features_streaming(movies, user_stats, item_stats, user_genre_prefs, rows_per_shard=None):
+    """Write training_data as user-partitioned shards, holding one shard of ratings at a time.
+
+    Dataset-wide values (Timestamp range, median movie age) are computed
+    up front, so every shard gets the same features as the in-memory path.
+    """
+    shard_lookup, n_shards = plan_user_shards(user_stats, rows_per_shard or ROWS_PER_SHARD)
+    spill_dir = os.path.join(FEATURE_DIR, "training_data.spill")
+    remove_table(FEATURE_DIR, "training_data")
+    
+    feature_cols, n_rows, n_cols, n_positive = [], 0, 0, 0
+    try:
+        with step("partition"):
+            spill_paths, ts_range = partition_ratings(shard_lookup, n_shards, spill_dir)
+        age_median = movie_age_median(item_stats)
+        # Each shard is written while the next one is built; at most one waits in memory
+        with TableWriter(max_pending=1) as writer:
+            for i, path in enumerate(p for p in spill_paths if p is not None):
+                with step(f"shard_{i}") as record:
+                    with pa.memory_map(path) as source:
+                        ratings = pa.ipc.open_file(source).read_all().to_pandas()
+                    record["rows"] = len(ratings)
+                    df, feature_cols = build_features(
+                        ratings, movies, user_stats, item_stats, user_genre_prefs, age_median, ts_range
+                    )
+                writer.save_shard(df, FEATURE_DIR, "training_data", i)
+                n_rows, n_cols = n_rows + len(df), df.shape[1]
+                n_positive += int(df["Relevance"].sum())
+                print(f"  Shard {i}: {len(df):,} rows")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return feature_cols, n_rows, n_cols, n_positive
+
+def main(streaming=None):
     print("="*70)
     print("FEATURE ENGINEERING")
     print("="*70)
     
-    ratings, movies, user_stats, item_stats, user_genre_prefs = load_data()
+    if streaming is None:
+        streaming = "--stream" in sys.argv
     
-    df = build_training_data(ratings, user_stats, item_stats)
-    df = add_interaction_features(df, ratings)
-    df = add_genre_features(df, user_genre_prefs, movies)
-    df = add_temporal_features(df)
-    df = add_popularity_features(df)
-    df, feature_cols = select_features(df)
+    if streaming:
+        movies = load_table(PROCESSED_DIR, "movies_processed")
+        user_stats = load_table(PROCESSED_DIR, "user_stats")
+        item_stats = load_table(PROCESSED_DIR, "item_stats")
+        user_genre_prefs = load_table(PROCESSED_DIR, "user_genre_preferences")
+        feature_cols, n_rows, n_cols, n_positive = build_features_streaming(
+            movies, user_stats, item_stats, user_genre_prefs
+        )
+    else:
+        ratings, movies, user_stats, item_stats, user_genre_prefs = load_data()
+        with step("build_features", rows=len(ratings)):
+            df, feature_cols = build_features(ratings, movies, user_stats, item_stats, user_genre_prefs)
+        with step("save", rows=len(df)):
+            remove_table(FEATURE_DIR, "training_data")
+            save_table(df, FEATURE_DIR, "training_data")
+        n_rows, n_cols, n_positive = len(df), df.shape[1], int(df["Relevance"].sum())
     
-    os.makedirs(FEATURE_DIR, exist_ok=True)
-    df.to_csv(os.path.join(FEATURE_DIR, "training_data.csv"), index=False)
     pd.DataFrame({"feature": feature_cols}).to_csv(
         os.path.join(FEATURE_DIR, "feature_names.csv"), index=False
     )
     
-    print(f"\n✓ Training data saved: {df.shape}")
+    print(f"\n✓ Training data saved: {(n_rows, n_cols)}")
     print(f"  Features: {len(feature_cols)}")
-    print(f"  Positive samples: {df['Relevance'].sum():,} ({df['Relevance'].mean():.2%})")
+    print(f"  Positive samples: {n_positive:,} ({n_positive / max(n_rows, 1):.2%})")
     print("="*70)
 
 if __name__ == "__main__":
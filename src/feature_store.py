@@ -0,0 +1,205 @@
+# src/feature_store.py
+
+import numpy as np
+
+CURRENT_YEAR = 2003
+DEFAULT_RATING_STD = 0.0
+DEFAULT_RATING_MEDIAN = 3.0
+
+def build_feature_tables(ratings, user_stats, item_stats, user_genre_prefs):
+    """Per-user and per-item serving tables, computed once offline.
+
+    user_features: user_stats + rating std/median + genre preferences.
+    item_features: numeric item_stats columns (stats, Release_Year, genre flags).
+    """
+    history = ratings.groupby("UserID")["Rating"].agg(
+        user_rating_std="std", user_rating_median="median"
+    ).reset_index()
+    user_features = (
+        user_stats.merge(history, on="UserID", how="left")
+        .merge(user_genre_prefs, on="UserID", how="left")
+    )
+    item_features = item_stats.drop(columns=["Title"], errors="ignore")
+    return user_features, item_features
+
+def _id_lookup(ids):
+    # Unknown IDs map to the sentinel row appended after the last real row
+    lookup = np.full(int(ids.max(initial=0)) + 1, len(ids), dtype=np.int32)
+    lookup[ids] = np.arange(len(ids), dtype=np.int32)
+    return lookup
+
+def _with_sentinel(values, fill):
+    return np.concatenate([values, np.full((1,) + values.shape[1:], fill, dtype=values.dtype)])
+
+def _apply_overlay(overlay, rows, gathered):
+    # Overwrite the gathered values (name -> array aligned with rows) of the rows that have an overlay entry
+    if not overlay:
+        return
+    patched = np.intersect1d(rows, np.fromiter(overlay, dtype=np.int64, count=len(overlay)))
+    for row in patched:
+        positions = rows == row
+        for name, value in overlay[row].items():
+            if name in gathered:
+                gathered[name][positions] = value
+
+class FeatureStore:
+    """Dense NumPy feature tables indexed by UserID / MovieID.
+
+    build_matrix() / build_matrix_batch() assemble the ranker input for one
+    or many users and their candidate movies with array gathers, producing
+    the same features as compute_features_for_candidates() in the order
+    given by feature_cols.
+
+    The tables may be memory-mapped and shared between processes, so they
+    are never written to. Online updates go to user_overlay / item_overlay
+    ({row: {name: value}}, names being table columns plus "user_prefs" and
+    "user_pref_norm"), which lookups check first. Both are replaced whole
+    rather than mutated, so a reader never sees a half-applied update.
+    """
+
+    ARRAYS = ("user_ids", "user_pos", "user_prefs", "user_pref_norm",
+              "item_ids", "item_pos", "item_genres", "item_genre_norm")
+
+    def __init__(self, user_features, item_features):
+        pref_cols = [c for c in user_features.columns if c.startswith("user_pref_")]
+        self.genre_cols = [c[len("user_pref_"):] for c in pref_cols
+                           if c[len("user_pref_"):] in item_features.columns]
+
+        self.user_ids = user_features["UserID"].to_numpy()
+        self.user_pos = _id_lookup(self.user_ids)
+        self.user_columns = {}
+        for col in user_features.columns:
+            if col == "UserID" or col in pref_cols:
+                continue
+            fill = {"user_rating_std": DEFAULT_RATING_STD,
+                    "user_rating_median": DEFAULT_RATING_MEDIAN}.get(col, np.nan)
+            self.user_columns[col] = _with_sentinel(user_features[col].to_numpy(np.float64), fill)
+        prefs = user_features[[f"user_pref_{g}" for g in self.genre_cols]].fillna(0).to_numpy(np.float64)
+        self.user_prefs = _with_sentinel(prefs, 0.0)
+        self.user_pref_norm = np.linalg.norm(self.user_prefs, axis=1)
+
+        self.item_ids = item_features["MovieID"].to_numpy()
+        self.item_pos = _id_lookup(self.item_ids)
+        self.item_columns = {}
+        for col in item_features.columns:
+            if col == "MovieID" or col in self.genre_cols:
+                continue
+            self.item_columns[col] = _with_sentinel(item_features[col].to_numpy(np.float64), np.nan)
+        genres = item_features[self.genre_cols].fillna(0).to_numpy(np.float64)
+        self.item_genres = _with_sentinel(genres, 0.0)
+        self.item_genre_norm = np.linalg.norm(self.item_genres, axis=1)
+
+        count, avg = self.item_columns["item_rating_count"], self.item_columns["item_avg_rating"]
+        self.item_columns["item_rating_count_log"] = np.log1p(count)
+        self.item_columns["item_popularity_score"] = count * avg
+        self.item_columns["item_popularity_score_log"] = np.log1p(count * avg)
+        self.item_columns["movie_age_years"] = CURRENT_YEAR - self.item_columns["Release_Year"]
+        self.user_columns["user_rating_count_log"] = np.log1p(self.user_columns["user_rating_count"])
+        self.user_overlay, self.item_overlay = {}, {}
+
+    def to_arrays(self):
+        """(arrays by name, metadata) for from_arrays()"""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays.update({f"user:{col}": values for col, values in self.user_columns.items()})
+        arrays.update({f"item:{col}": values for col, values in self.item_columns.items()})
+        return arrays, {"genre_cols": self.genre_cols}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Rebuild from to_arrays() output without recomputing any table"""
+        store = cls.__new__(cls)
+        store.genre_cols = list(meta["genre_cols"])
+        for name in cls.ARRAYS:
+            setattr(store, name, arrays[name])
+        store.user_columns = {k[len("user:"):]: v for k, v in arrays.items() if k.startswith("user:")}
+        store.item_columns = {k[len("item:"):]: v for k, v in arrays.items() if k.startswith("item:")}
+        store.user_overlay, store.item_overlay = {}, {}
+        return store
+
+    def user_values(self, row):
+        """{name: value} of one user row, overlay included (a new dict, safe to modify)"""
+        values = self.user_overlay.get(row)
+        if values is None:
+            values = {col: table[row] for col, table in self.user_columns.items()}
+            values["user_prefs"] = self.user_prefs[row]
+            values["user_pref_norm"] = self.user_pref_norm[row]
+        return dict(values)
+
+    def item_values(self, row):
+        """{name: value} of one item row, overlay included (a new dict, safe to modify)"""
+        values = self.item_overlay.get(row)
+        if values is None:
+            values = {col: table[row] for col, table in self.item_columns.items()}
+        return dict(values)
+
+    def __contains__(self, user_id):
+        return 0 <= user_id < len(self.user_pos) and self.user_pos[user_id] < len(self.user_ids)
+
+    def user_rows(self, user_ids):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        in_range = (user_ids >= 0) & (user_ids < len(self.user_pos))
+        return np.where(in_range, self.user_pos[np.where(in_range, user_ids, 0)], len(self.user_ids))
+
+    def item_rows(self, movie_ids):
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        in_range = (movie_ids >= 0) & (movie_ids < len(self.item_pos))
+        return np.where(in_range, self.item_pos[np.where(in_range, movie_ids, 0)], len(self.item_ids))
+
+    def item_column(self, col, movie_ids):
+        rows = self.item_rows(movie_ids)
+        values = {col: self.item_columns[col][rows]}
+        _apply_overlay(self.item_overlay, rows, values)
+        return values[col]
+
+    def build_matrix(self, user_id, movie_ids, feature_cols):
+        """Feature matrix (len(movie_ids) x len(feature_cols)) for one user"""
+        return self.build_matrix_batch([user_id], movie_ids, [0, len(movie_ids)], feature_cols)
+
+    def build_matrix_batch(self, user_ids, movie_ids, offsets, feature_cols, out=None):
+        """Stacked feature matrix where rows offsets[i]:offsets[i + 1] belong to user_ids[i].
+
+        out: optional preallocated (n_rows x len(feature_cols)) array to fill, e.g. RankerScorer.buffer()
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        users = np.repeat(self.user_rows(user_ids), np.diff(offsets))
+        rows = self.item_rows(movie_ids)
+        n = len(rows)
+
+        user_features = {col: values[users] for col, values in self.user_columns.items()}
+        user_features["user_prefs"] = self.user_prefs[users]
+        user_features["user_pref_norm"] = self.user_pref_norm[users]
+        _apply_overlay(self.user_overlay, users, user_features)
+        item_features = {col: values[rows] for col, values in self.item_columns.items()}
+        _apply_overlay(self.item_overlay, rows, item_features)
+        user_vectors = user_features.pop("user_prefs")
+        user_norms = user_features.pop("user_pref_norm")
+        features = {**user_features, **item_features}
+
+        features["rating_deviation_from_user_avg"] = features["item_avg_rating"] - features["user_avg_rating"]
+
+        item_vectors = self.item_genres[rows]
+        dot_product = np.sum(user_vectors * item_vectors, axis=1)
+        norms = user_norms * self.item_genre_norm[rows]
+        features["genre_cosine_similarity"] = np.divide(
+            dot_product, norms, out=np.zeros_like(dot_product), where=norms != 0
+        )
+        features["genre_overlap_count"] = ((user_vectors > 0) & (item_vectors > 0)).sum(axis=1)
+
+        # Missing release years are filled with the median over each user's own candidates
+        movie_age = features["movie_age_years"].copy()
+        missing = np.isnan(movie_age)
+        if missing.any():
+            groups = np.searchsorted(offsets, np.flatnonzero(missing), side="right") - 1
+            for g in np.unique(groups):
+                ages = movie_age[offsets[g]:offsets[g + 1]]
+                known = ~np.isnan(ages)
+                if known.any():
+                    ages[~known] = np.median(ages[known])
+        features["movie_age_years"] = movie_age
+        features["is_recent_movie"] = (movie_age <= 5).astype(np.float64)
+        features["rating_recency"] = np.full(n, 0.5)
+
+        X = np.zeros((n, len(feature_cols)), dtype=np.float64) if out is None else out
+        for j, col in enumerate(feature_cols):
+            X[:, j] = features[col] if col in features else 0
+        return X
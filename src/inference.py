@@ -3,8 +3,20 @@ import numpy as np
 import pickle
 import os
 
+from artifacts import load_table, fingerprint
+from ratings_index import RatingsIndex
+from feature_store import FeatureStore
+from model_registry import ServingModel
+from item_neighbors import recent_liked
+
 MODEL_DIR = "models"
 PROCESSED_DIR = "data/processed"
+# Extra candidates per user from the MF embedding retriever / item neighbors, when used
+N_EMBEDDING = 100
+N_NEIGHBOR = 100
+RECOMMENDATION_COLUMNS = [
+    'UserID', 'MovieID', 'Title', 'Release_Year', 'score', 'item_avg_rating', 'item_rating_count'
+]
 
 def load_model(model_name="ranker_model.pkl"):
     with open(os.path.join(MODEL_DIR, model_name), "rb") as f:
@@ -12,43 +24,101 @@ def load_model(model_name="ranker_model.pkl"):
     feature_cols = pd.read_csv(os.path.join(MODEL_DIR, "feature_names.csv"))["feature"].tolist()
     return model, feature_cols
 
-def load_inference_data():
-    ratings = pd.read_csv(os.path.join(PROCESSED_DIR, "ratings_processed.csv"))
-    movies = pd.read_csv(os.path.join(PROCESSED_DIR, "movies_processed.csv"))
-    user_stats = pd.read_csv(os.path.join(PROCESSED_DIR, "user_stats.csv"))
-    item_stats = pd.read_csv(os.path.join(PROCESSED_DIR, "item_stats.csv"))
-    user_genre_prefs = pd.read_csv(os.path.join(PROCESSED_DIR, "user_genre_preferences.csv"))
+def load_serving_model(version=None):
+    """ServingModel for the registry's active (or given) version, else the pickled ranker"""
+    serving = ServingModel.load(version)
+    if serving is None:
+        model, feature_cols = load_model("ranker_model.pkl")
+        paths = [os.path.join(MODEL_DIR, name) for name in ["ranker_model.pkl", "feature_names.csv"]]
+        serving = ServingModel(model, feature_cols, "pickle-" + fingerprint(paths))
+    return serving
+
+def load_inference_data(with_ratings=True):
+    # Serving from a prebuilt RatingsIndex never needs the ratings frame itself
+    ratings = None
+    if with_ratings:
+        ratings = load_table(
+            PROCESSED_DIR, "ratings_processed", columns=["UserID", "MovieID", "Rating", "Timestamp"]
+        )
+    movies = load_table(PROCESSED_DIR, "movies_processed")
+    user_stats = load_table(PROCESSED_DIR, "user_stats")
+    item_stats = load_table(PROCESSED_DIR, "item_stats")
+    user_genre_prefs = load_table(PROCESSED_DIR, "user_genre_preferences")
     return ratings, movies, user_stats, item_stats, user_genre_prefs
 
-def generate_candidates_for_user(user_id, ratings, movies, item_stats, user_genre_prefs, n_candidates=200):
-    user_history = set(ratings[ratings['UserID'] == user_id]['MovieID'])
+def load_feature_store():
+    return FeatureStore(
+        load_table(PROCESSED_DIR, "user_features"),
+        load_table(PROCESSED_DIR, "item_features")
+    )
+
+def user_ratings_index(user_id, ratings, ratings_index=None):
+    # Without a prebuilt index, fall back to one scan that indexes just this user
+    if ratings_index is not None:
+        return ratings_index
+    return RatingsIndex.from_ratings(ratings[ratings['UserID'] == user_id], bitset_max_bytes=0)
+
+def generate_candidates_for_user(user_id, ratings, movies, item_stats, user_genre_prefs, n_candidates=200,
+                                 ratings_index=None, retriever=None, item_neighbors=None):
+    ratings_index = user_ratings_index(user_id, ratings, ratings_index)
+    return generate_candidates_for_users(
+        [user_id], ratings, movies, item_stats, user_genre_prefs, n_candidates, ratings_index, retriever,
+        item_neighbors
+    )[0]
+
+def generate_candidates_for_users(user_ids, ratings, movies, item_stats, user_genre_prefs, n_candidates=200,
+                                  ratings_index=None, retriever=None, item_neighbors=None):
+    """Unseen candidate MovieIDs per user: popularity + genre match (at most n_candidates),
+    followed by up to N_EMBEDDING more from the embedding retriever and up to
+    N_NEIGHBOR neighbors of the user's recent liked movies, when those are given.
+    """
+    if ratings_index is None:
+        ratings_index = RatingsIndex.from_ratings(ratings[ratings['UserID'].isin(user_ids)], bitset_max_bytes=0)
     
     # Popular candidates
     popular = item_stats.nlargest(100, 'item_rating_count')['MovieID'].tolist()
     
     # Genre-based candidates
     genre_cols = [c for c in movies.columns if c not in ["MovieID", "Title", "Release_Year"]]
-    user_prefs = user_genre_prefs[user_genre_prefs['UserID'] == user_id]
+    user_pref_cols = [c for c in user_genre_prefs.columns if c.startswith("user_pref_")]
+    movie_ids = movies['MovieID'].values
+    genre_matrix = movies[genre_cols].to_numpy(np.float64)
+    pref_rows = pd.Index(user_genre_prefs['UserID']).get_indexer(user_ids)
+    pref_values = np.ascontiguousarray(user_genre_prefs[user_pref_cols].to_numpy(np.float64))
     
-    genre_candidates = []
-    if not user_prefs.empty:
-        user_pref_cols = [c for c in user_prefs.columns if c.startswith("user_pref_")]
-        genre_profile = user_prefs[user_pref_cols].values[0]
+    candidates = []
+    for user_id, pref_row in zip(user_ids, pref_rows):
+        genre_candidates = []
+        if pref_row >= 0:
+            genre_score = np.dot(genre_matrix, pref_values[pref_row])
+            unseen = np.flatnonzero(~ratings_index.seen_mask(user_id, movie_ids))
+            # Stable sort keeps nlargest(keep='first') tie-breaking
+            top = unseen[np.argsort(-genre_score[unseen], kind='stable')[:150]]
+            genre_candidates = movie_ids[top].tolist()
         
-        movies_temp = movies.copy()
-        movies_temp['genre_score'] = movies_temp[genre_cols].dot(genre_profile)
-        genre_candidates = (
-            movies_temp[~movies_temp['MovieID'].isin(user_history)]
-            .nlargest(150, 'genre_score')['MovieID'].tolist()
-        )
-    
-    # Combine and filter
-    candidates = list(set(popular + genre_candidates))
-    candidates = [m for m in candidates if m not in user_history]
-    return candidates[:n_candidates]
+        # Combine and filter
+        user_candidates = list(set(popular + genre_candidates))
+        seen = ratings_index.seen_mask(user_id, user_candidates)
+        user_candidates = [m for m, s in zip(user_candidates, seen) if not s][:n_candidates]
+
+        # Collaborative candidates (already unseen): MF embeddings via ANN search, and the
+        # item-item neighbors of the movies the user liked most recently
+        extra = []
+        if retriever is not None:
+            extra += retriever.candidates(user_id, N_EMBEDDING, ratings_index)
+        if item_neighbors is not None:
+            extra += item_neighbors.expand(
+                recent_liked(ratings_index, user_id), N_NEIGHBOR,
+                lambda movie_ids: ratings_index.seen_mask(user_id, movie_ids)
+            )
+        if extra:
+            known = set(user_candidates)
+            user_candidates += [m for m in dict.fromkeys(extra) if m not in known]
+        candidates.append(user_candidates)
+    return candidates
 
 def compute_features_for_candidates(user_id, candidate_movie_ids, ratings, movies, 
-                                    user_stats, item_stats, user_genre_prefs):
+                                    user_stats, item_stats, user_genre_prefs, ratings_index=None):
     # Base dataframe
     candidates_df = pd.DataFrame({
         'UserID': [user_id] * len(candidate_movie_ids),
@@ -61,10 +131,11 @@ def compute_features_for_candidates(user_id, candidate_movie_ids, ratings, movie
     candidates_df = candidates_df.loc[:, ~candidates_df.columns.duplicated()]
     
     # User interaction features
-    user_history = ratings[ratings['UserID'] == user_id]
-    if not user_history.empty:
-        candidates_df['user_rating_std'] = user_history['Rating'].std()
-        candidates_df['user_rating_median'] = user_history['Rating'].median()
+    ratings_index = user_ratings_index(user_id, ratings, ratings_index)
+    user_ratings = pd.Series(ratings_index.history(user_id)[1])
+    if not user_ratings.empty:
+        candidates_df['user_rating_std'] = user_ratings.std()
+        candidates_df['user_rating_median'] = user_ratings.median()
     else:
         candidates_df['user_rating_std'] = 0
         candidates_df['user_rating_median'] = 3.0
@@ -73,9 +144,8 @@ def compute_features_for_candidates(user_id, candidate_movie_ids, ratings, movie
         candidates_df['item_avg_rating'] - candidates_df['user_avg_rating']
     )
     
-    # Genre features
+    # Genre features (genre flags already came in with item_stats)
     genre_cols = [c for c in movies.columns if c not in ["MovieID", "Title", "Release_Year"]]
-    candidates_df = candidates_df.merge(movies[['MovieID'] + genre_cols], on='MovieID', how='left')
     candidates_df = candidates_df.merge(user_genre_prefs, on='UserID', how='left')
     candidates_df = candidates_df.loc[:, ~candidates_df.columns.duplicated()]
     
@@ -125,46 +195,104 @@ def compute_features_for_candidates(user_id, candidate_movie_ids, ratings, movie
     
     return candidates_df
 
+def top_k_per_group(scores, offsets, top_k):
+    """Positions of the top_k scores of every group (rows offsets[i]:offsets[i + 1]),
+    best first; lexsort is stable, so ties keep candidate order like nlargest"""
+    group = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    order = np.lexsort((-scores, group))
+    rank = np.arange(len(order)) - offsets[group[order]]
+    return order[rank < top_k]
+
 def recommend_for_user(user_id, model, feature_cols, ratings, movies, 
-                      user_stats, item_stats, user_genre_prefs, top_k=10):
-    # Generate candidates
-    candidates = generate_candidates_for_user(
-        user_id, ratings, movies, item_stats, user_genre_prefs
+                      user_stats, item_stats, user_genre_prefs, top_k=10, ratings_index=None,
+                      feature_store=None, scorer=None, retriever=None, item_neighbors=None):
+    ratings_index = user_ratings_index(user_id, ratings, ratings_index)
+    recs = recommend_for_users(
+        [user_id], model, feature_cols, ratings, movies, user_stats, item_stats, user_genre_prefs,
+        top_k=top_k, ratings_index=ratings_index, feature_store=feature_store, scorer=scorer,
+        retriever=retriever, item_neighbors=item_neighbors
     )
-    
-    if not candidates:
+    if recs.empty:
         return None
+    return recs.drop(columns=['UserID'])
+
+def recommend_for_users(user_ids, model, feature_cols, ratings, movies,
+                        user_stats, item_stats, user_genre_prefs, top_k=10, ratings_index=None,
+                        feature_store=None, scorer=None, retriever=None, item_neighbors=None):
+    """Top-K for many users: one stacked feature matrix and a single model call.
+
+    With a RankerScorer the features are written straight into its float32
+    buffer and scored without the scikit-learn wrapper. A retriever (see
+    embeddings.load_retriever()) and item_neighbors (see ItemNeighbors.load())
+    add collaborative candidates.
+
+    Returns one long DataFrame (UserID, MovieID, Title, Release_Year, score,
+    item_avg_rating, item_rating_count), best first within each user; users
+    without candidates are absent.
+    """
+    user_ids = list(user_ids)
+    if ratings_index is None:
+        ratings_index = RatingsIndex.from_ratings(ratings[ratings['UserID'].isin(user_ids)], bitset_max_bytes=0)
     
-    # Compute features
-    candidates_df = compute_features_for_candidates(
-        user_id, candidates, ratings, movies, user_stats, item_stats, user_genre_prefs
+    # Generate candidates
+    candidates = generate_candidates_for_users(
+        user_ids, ratings, movies, item_stats, user_genre_prefs, ratings_index=ratings_index,
+        retriever=retriever, item_neighbors=item_neighbors
     )
+    counts = np.array([len(c) for c in candidates], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    movie_ids = np.array([m for c in candidates for m in c], dtype=np.int64)
     
-    # Ensure all features exist
-    for f in feature_cols:
-        if f not in candidates_df.columns:
-            candidates_df[f] = 0
-    
-    # Score candidates
-    X = candidates_df[feature_cols].values
-    scores = model.predict_proba(X)[:, 1] if hasattr(model, 'predict_proba') else model.predict(X)
-    candidates_df['score'] = scores
-    
-    # FIXED: Merge with movies to get Title and Release_Year
-    candidates_df = candidates_df.merge(
-        movies[['MovieID', 'Title', 'Release_Year']], 
-        on='MovieID', 
-        how='left',
-        suffixes=('', '_movie')
-    )
+    if len(movie_ids) == 0:
+        return pd.DataFrame(columns=RECOMMENDATION_COLUMNS)
+    
+    # Compute features
+    if feature_store is not None:
+        out = scorer.buffer(len(movie_ids)) if scorer is not None else None
+        X = feature_store.build_matrix_batch(user_ids, movie_ids, offsets, feature_cols, out=out)
+        item_avg_rating = feature_store.item_column('item_avg_rating', movie_ids)
+        item_rating_count = feature_store.item_column('item_rating_count', movie_ids)
+    else:
+        candidates_df = pd.concat([
+            compute_features_for_candidates(
+                user_id, user_candidates, ratings, movies, user_stats, item_stats, user_genre_prefs,
+                ratings_index=ratings_index
+            )
+            for user_id, user_candidates in zip(user_ids, candidates) if user_candidates
+        ], ignore_index=True)
+        
+        # Ensure all features exist
+        for f in feature_cols:
+            if f not in candidates_df.columns:
+                candidates_df[f] = 0
+        X = candidates_df[feature_cols].values
+        item_avg_rating = candidates_df['item_avg_rating'].values
+        item_rating_count = candidates_df['item_rating_count'].values
     
-    # Return top-K with all necessary fields
-    recs = candidates_df.nlargest(top_k, 'score')
+    # Score all candidates in one call
+    if scorer is not None:
+        scores = scorer(X)
+    else:
+        scores = model.predict_proba(X)[:, 1] if hasattr(model, 'predict_proba') else model.predict(X)
     
-    return recs[[
-        'MovieID', 'Title', 'Release_Year', 'score', 
-        'item_avg_rating', 'item_rating_count'
-    ]].reset_index(drop=True)
+    # Top-K per user
+    keep = top_k_per_group(scores, offsets, top_k)
+    return recommendations_frame(
+        np.repeat(user_ids, counts)[keep], movie_ids[keep], scores[keep],
+        item_avg_rating[keep], item_rating_count[keep], movies
+    )
+
+def recommendations_frame(user_ids, movie_ids, scores, item_avg_rating, item_rating_count, movies):
+    """Long recommendation frame in RECOMMENDATION_COLUMNS order, one row per (user, movie)"""
+    recs = pd.DataFrame({
+        'UserID': user_ids,
+        'MovieID': movie_ids,
+        'score': scores,
+        'item_avg_rating': item_avg_rating,
+        'item_rating_count': item_rating_count
+    })
+    recs = recs.merge(movies[['MovieID', 'Title', 'Release_Year']], on='MovieID', how='left')
+    return recs[RECOMMENDATION_COLUMNS]
 
 def main():
     print("="*70)
@@ -174,12 +302,15 @@ def main():
     print("\nLoading model and data...")
     model, feature_cols = load_model("ranker_model.pkl")
     ratings, movies, user_stats, item_stats, user_genre_prefs = load_inference_data()
+    ratings_index = RatingsIndex.from_ratings(ratings)
+    feature_store = load_feature_store()
     
     print(f"Model loaded: {len(feature_cols)} features")
     
     print("\nGenerating recommendations for User 1...")
     recs = recommend_for_user(1, model, feature_cols, ratings, movies, 
-                             user_stats, item_stats, user_genre_prefs, top_k=10)
+                             user_stats, item_stats, user_genre_prefs, top_k=10,
+                             ratings_index=ratings_index, feature_store=feature_store)
     
     if recs is not None:
         print(f"\nTop-10 Recommendations:")
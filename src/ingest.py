@@ -0,0 +1,257 @@
+# src/ingest.py
+
+import os
+import json
+import time
+import fcntl
+import threading
+
+import numpy as np
+import pandas as pd
+
+INGEST_DIR = "data/ingest"
+LOG_PATH = os.path.join(INGEST_DIR, "ratings.jsonl")
+# Log position already folded into the processed tables by the last preprocessing run
+OFFSET_PATH = os.path.join("data/processed", "ingested_offset.json")
+LOG_COLUMNS = ["UserID", "MovieID", "Rating", "Timestamp"]
+MIN_RATING, MAX_RATING = 1, 5
+LIKED_RATING = 4
+POLL_SECONDS = 1.0
+
+# ----------------------------
+# Ratings log
+# ----------------------------
+def parse_rating(event):
+    """(UserID, MovieID, Rating, Timestamp) from a {"user_id", "movie_id", "rating", "timestamp"} dict.
+
+    The timestamp is required: the recency features are relative to the
+    rating times the ranker was trained on, so the server clock is no
+    stand-in. Raises ValueError for a malformed event.
+    """
+    if not isinstance(event, dict):
+        raise ValueError("rating must be an object")
+    try:
+        user_id, movie_id, rating, timestamp = (
+            int(event[k]) for k in ("user_id", "movie_id", "rating", "timestamp")
+        )
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("rating needs integer user_id, movie_id, rating and timestamp")
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f"rating must be between {MIN_RATING} and {MAX_RATING}")
+    return user_id, movie_id, rating, timestamp
+
+def append_ratings(events, path=LOG_PATH):
+    """Append parsed events to the log in one locked write, so concurrent writers never interleave"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = "".join(json.dumps(dict(zip(LOG_COLUMNS, event))) + "\n" for event in events)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(lines)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_ratings(path=LOG_PATH, offset=0):
+    """(events, new offset): the complete lines written after byte offset"""
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    events = [tuple(json.loads(line)[c] for c in LOG_COLUMNS) for line in data[:end].splitlines() if line]
+    return events, offset + end
+
+def read_ratings_log(path=LOG_PATH):
+    """(ratings frame, offset) of the whole log, for folding it into the processed tables"""
+    events, offset = read_ratings(path)
+    return pd.DataFrame(events, columns=LOG_COLUMNS), offset
+
+def save_ingested_offset(offset, path=OFFSET_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"offset": int(offset)}, f)
+    os.replace(path + ".tmp", path)
+
+def ingested_offset(path=OFFSET_PATH):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)["offset"]
+
+# ----------------------------
+# Online aggregates
+# ----------------------------
+class OnlineStats:
+    """Applies new ratings to the serving tables in O(1) per event.
+
+    Updated rows go to the FeatureStore overlays, so the shared (memory-
+    mapped) tables stay read-only: count, mean and positive rate update
+    incrementally, the standard deviation with Welford's recurrence
+    (M2 = std² · (n - 1)), first/last timestamps with min/max, the median
+    from a per-user histogram of the 1-5 ratings and the genre preferences
+    from their rating-weighted sums (preference · rating sum). A movie the
+    user already rated is a replacement: its old rating is taken out of
+    every aggregate before the new one goes in, as preprocessing keeps only
+    the last rating of each (UserID, MovieID). Ratings of users or movies
+    without a row in the store are recorded in the ratings index only; they
+    reach the tables at the next preprocessing run.
+    """
+
+    def __init__(self, feature_store, ratings_index, catalog=None):
+        self.store = feature_store
+        self.ratings_index = ratings_index
+        self.catalog = catalog
+        self._histograms = None
+        self._lock = threading.Lock()
+
+    def _rating_histograms(self):
+        # Counts of each rating value per store user row, built once from the ratings index
+        index, store = self.ratings_index, self.store
+        rows = store.user_rows(np.repeat(index.user_ids, np.diff(index.offsets)))
+        ratings = np.clip(np.asarray(index.ratings, dtype=np.int64), 0, MAX_RATING)
+        return np.bincount(
+            rows * (MAX_RATING + 1) + ratings, minlength=(len(store.user_ids) + 1) * (MAX_RATING + 1)
+        ).reshape(-1, MAX_RATING + 1)
+
+    def apply(self, events):
+        """Apply (UserID, MovieID, Rating, Timestamp) events; returns the set of affected users"""
+        with self._lock:
+            if self._histograms is None:
+                self._histograms = self._rating_histograms()
+            # Work on copies and publish them at the end, so readers see all of the events or none
+            user_overlay, item_overlay = dict(self.store.user_overlay), dict(self.store.item_overlay)
+            users = set()
+            for user_id, movie_id, rating, timestamp in events:
+                previous = self.ratings_index.rating(user_id, movie_id)
+                self._update_user(user_overlay, user_id, movie_id, rating, previous, timestamp)
+                self._update_item(item_overlay, movie_id, rating, previous, timestamp)
+                self.ratings_index.add_rating(user_id, movie_id, rating)
+                users.add(user_id)
+            self.store.user_overlay, self.store.item_overlay = user_overlay, item_overlay
+            return users
+
+    def _update_user(self, overlay, user_id, movie_id, rating, previous, timestamp):
+        store = self.store
+        row = store.user_rows([user_id])[0]
+        if row == len(store.user_ids):
+            return
+        values = dict(overlay[row]) if row in overlay else store.user_values(row)
+        n0, mean0 = values["user_rating_count"], values["user_avg_rating"]
+        std0 = values["user_rating_std"]
+        m2 = std0 ** 2 * (n0 - 1) if n0 > 1 and not np.isnan(std0) else 0.0
+        positives = values["user_positive_rate"] * n0
+        rating_sum = mean0 * n0
+        item_genres = store.item_genres[store.item_rows([movie_id])[0]]
+        genre_sums = values["user_prefs"] * rating_sum
+        histogram = self._histograms[row]
+
+        if previous is not None:
+            # Welford in reverse: take the old rating out
+            n0 -= 1
+            mean = (rating_sum - previous) / n0 if n0 else 0.0
+            m2 = max(m2 - (previous - mean0) * (previous - mean), 0.0) if n0 else 0.0
+            mean0 = mean
+            positives -= previous >= LIKED_RATING
+            rating_sum -= previous
+            genre_sums = genre_sums - previous * item_genres
+            histogram[previous] -= 1
+
+        n = n0 + 1
+        delta = rating - mean0
+        mean = mean0 + delta / n
+        m2 += delta * (rating - mean)
+        rating_sum += rating
+
+        values["user_rating_count"] = n
+        values["user_avg_rating"] = mean
+        values["user_positive_rate"] = (positives + (rating >= LIKED_RATING)) / n
+        values["user_rating_std"] = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+        values["user_first_ts"] = min(values["user_first_ts"], timestamp)
+        values["user_last_ts"] = max(values["user_last_ts"], timestamp)
+        values["user_tenure_days"] = (values["user_last_ts"] - values["user_first_ts"]) / 86400
+        values["user_rating_count_log"] = np.log1p(n)
+
+        histogram[rating] += 1
+        cumulative = np.cumsum(histogram)
+        # Median of n integer ratings: mean of the values at sorted positions (n - 1) // 2 and n // 2
+        lower, upper = np.searchsorted(cumulative, [(n - 1) // 2 + 1, n // 2 + 1])
+        values["user_rating_median"] = (lower + upper) / 2
+
+        # Preferences are rating-weighted genre sums over the user's rating sum
+        values["user_prefs"] = (genre_sums + rating * item_genres) / rating_sum
+        values["user_pref_norm"] = np.linalg.norm(values["user_prefs"])
+        overlay[row] = values
+
+    def _update_item(self, overlay, movie_id, rating, previous, timestamp):
+        store = self.store
+        row = store.item_rows([movie_id])[0]
+        if row == len(store.item_ids):
+            return
+        values = dict(overlay[row]) if row in overlay else store.item_values(row)
+        n0, mean0 = values["item_rating_count"], values["item_avg_rating"]
+        rating_sum = mean0 * n0
+        positives = values["item_positive_rate"] * n0
+        if previous is not None:
+            n0 -= 1
+            rating_sum -= previous
+            positives -= previous >= LIKED_RATING
+        n = n0 + 1
+        mean = (rating_sum + rating) / n
+
+        values["item_rating_count"] = n
+        values["item_avg_rating"] = mean
+        values["item_positive_rate"] = (positives + (rating >= LIKED_RATING)) / n
+        values["item_first_ts"] = min(values["item_first_ts"], timestamp)
+        values["item_last_ts"] = max(values["item_last_ts"], timestamp)
+        values["item_tenure_days"] = (values["item_last_ts"] - values["item_first_ts"]) / 86400
+        values["item_rating_count_log"] = np.log1p(n)
+        values["item_popularity_score"] = n * mean
+        values["item_popularity_score_log"] = np.log1p(n * mean)
+        overlay[row] = values
+        if self.catalog is not None:
+            self.catalog.update_stats(movie_id, mean, n)
+
+class RatingsTailer:
+    """Follows the ratings log from offset and hands new events to apply(events).
+
+    Every serving process runs one, so a rating posted to any worker reaches
+    all of them within POLL_SECONDS. poll() is also called right after a
+    local append, so the worker that took the request sees it at once.
+    """
+
+    def __init__(self, apply, path=LOG_PATH, offset=None):
+        self.apply = apply
+        self.path = path
+        self.offset = ingested_offset() if offset is None else offset
+        self.applied = 0
+        self._lock = threading.Lock()
+
+    def poll(self):
+        with self._lock:
+            events, self.offset = read_ratings(self.path, self.offset)
+            if events:
+                self.apply(events)
+                self.applied += len(events)
+            return len(events)
+
+    def restart(self, switch, offset=None):
+        """Run switch() (e.g. install tables rebuilt from the log) and follow the log from offset.
+
+        No poll runs in between, so every event after offset is applied to
+        the new tables exactly once. offset defaults to the one saved with
+        the processed tables.
+        """
+        with self._lock:
+            switch()
+            self.offset = ingested_offset() if offset is None else offset
+
+    def run(self, interval=POLL_SECONDS):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            time.sleep(interval)
@@ -0,0 +1,172 @@
+# src/item_neighbors.py
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from artifacts import save_table, load_table, artifact_path
+from profiler import step
+
+PROCESSED_DIR = "data/processed"
+NEIGHBORS_NAME = "item_neighbors"
+
+N_NEIGHBORS = 50
+# Added to the cosine denominator so pairs with few common raters rank lower
+SHRINKAGE = 10.0
+# Dense co-rating block (item rows x all items) computed per step
+BLOCK_BYTES = 64 * 1024 * 1024
+LIKED_RATING = 4
+# Most recent liked movies a user's neighbor candidates are expanded from
+N_RECENT_LIKED = 20
+
+# ----------------------------
+# Offline build
+# ----------------------------
+def _top_n_rows(sim, n):
+    """(rows, cols, values) of each row's n largest positive entries, best first within each row"""
+    n = min(n, sim.shape[1])
+    top = np.argpartition(-sim, n - 1, axis=1)[:, :n]
+    values = np.take_along_axis(sim, top, axis=1)
+    order = np.lexsort((top, -values), axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    keep = values > 0
+    rows = np.repeat(np.arange(sim.shape[0]), keep.sum(axis=1))
+    return rows, top[keep], values[keep]
+
+def build_item_neighbors(ratings, n_neighbors=N_NEIGHBORS, shrinkage=SHRINKAGE, block_bytes=BLOCK_BYTES):
+    """Top-n co-rating neighbors per movie as a long (MovieID, NeighborID, similarity) frame.
+
+    similarity = |raters(i) ∩ raters(j)| / (sqrt(|raters(i)| * |raters(j)|) + shrinkage),
+    computed from the sparse user x item matrix X one block of item rows at a
+    time (X[:, block]ᵀ X), so memory stays at block_bytes however many items
+    there are. Rows are grouped by MovieID, most similar first.
+    """
+    user_ids, rows = np.unique(ratings["UserID"].to_numpy(), return_inverse=True)
+    item_ids, cols = np.unique(ratings["MovieID"].to_numpy(), return_inverse=True)
+    X = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(user_ids), len(item_ids))
+    )
+    XT = X.T.tocsr()
+    norms = np.sqrt(np.diff(XT.indptr).astype(np.float64))
+
+    block = max(1, block_bytes // (8 * len(item_ids)))
+    out_rows, out_cols, out_values = [], [], []
+    for b0 in range(0, len(item_ids), block):
+        b1 = min(b0 + block, len(item_ids))
+        co = (XT[b0:b1] @ X).toarray().astype(np.float64)
+        sim = co / (norms[b0:b1, None] * norms[None, :] + shrinkage)
+        sim[np.arange(b1 - b0), np.arange(b0, b1)] = 0
+        r, c, v = _top_n_rows(sim, n_neighbors)
+        out_rows.append(r + b0)
+        out_cols.append(c)
+        out_values.append(v)
+
+    return pd.DataFrame({
+        "MovieID": item_ids[np.concatenate(out_rows)].astype(np.int32),
+        "NeighborID": item_ids[np.concatenate(out_cols)].astype(np.int32),
+        "similarity": np.concatenate(out_values).astype(np.float32)
+    })
+
+def save_item_neighbors(directory=PROCESSED_DIR):
+    ratings = load_table(directory, "ratings_processed", columns=["UserID", "MovieID"])
+    with step("cosine_top_n", rows=len(ratings)):
+        neighbors = build_item_neighbors(ratings)
+    save_table(neighbors, directory, NEIGHBORS_NAME, export_csv=False)
+    return neighbors
+
+# ----------------------------
+# Serving
+# ----------------------------
+class ItemNeighbors:
+    """Precomputed item-item neighbors in CSR form, indexed by MovieID.
+
+    The neighbors of the movie at row r are neighbor_ids[offsets[r]:offsets[r + 1]]
+    (with their similarities), most similar first, so a lookup is two array
+    reads and a slice.
+    """
+
+    def __init__(self, item_ids, offsets, neighbor_ids, similarities):
+        self.item_ids = item_ids
+        self.offsets = offsets
+        self.neighbor_ids = neighbor_ids
+        self.similarities = similarities
+        self.item_pos = np.full(int(item_ids.max(initial=0)) + 1, -1, dtype=np.int32)
+        self.item_pos[item_ids] = np.arange(len(item_ids), dtype=np.int32)
+
+    @classmethod
+    def from_frame(cls, neighbors):
+        movie_ids = neighbors["MovieID"].to_numpy()
+        item_ids, counts = np.unique(movie_ids, return_counts=True)
+        offsets = np.zeros(len(item_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        order = np.argsort(movie_ids, kind="stable")
+        return cls(
+            item_ids.astype(np.int32), offsets,
+            neighbors["NeighborID"].to_numpy(np.int32)[order],
+            neighbors["similarity"].to_numpy(np.float32)[order]
+        )
+
+    @classmethod
+    def load(cls, directory=PROCESSED_DIR):
+        """Index from the saved item_neighbors artifact, or None when it was never built"""
+        if not os.path.exists(artifact_path(directory, NEIGHBORS_NAME)):
+            return None
+        return cls.from_frame(load_table(directory, NEIGHBORS_NAME))
+
+    def _row(self, movie_id):
+        if 0 <= movie_id < len(self.item_pos) and self.item_pos[movie_id] >= 0:
+            return self.item_pos[movie_id]
+        return None
+
+    def __contains__(self, movie_id):
+        return self._row(movie_id) is not None
+
+    def neighbors(self, movie_id, n=None):
+        """(neighbor MovieIDs, similarities) of movie_id, most similar first"""
+        row = self._row(movie_id)
+        if row is None:
+            return self.neighbor_ids[:0], self.similarities[:0]
+        start = self.offsets[row]
+        end = self.offsets[row + 1] if n is None else min(start + n, self.offsets[row + 1])
+        return self.neighbor_ids[start:end], self.similarities[start:end]
+
+    def expand(self, seed_ids, n, exclude=None):
+        """Up to n MovieIDs most similar to the seeds overall (similarities summed), best first.
+
+        exclude(ids) -> bool mask drops candidates, e.g. movies the user has seen.
+        """
+        rows = [self._row(m) for m in seed_ids]
+        rows = np.array([r for r in rows if r is not None], dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        counts = self.offsets[rows + 1] - self.offsets[rows]
+        ends = np.cumsum(counts)
+        positions = np.arange(ends[-1]) + np.repeat(self.offsets[rows] - (ends - counts), counts)
+        ids, inverse = np.unique(self.neighbor_ids[positions], return_inverse=True)
+        scores = np.bincount(inverse, weights=self.similarities[positions], minlength=len(ids))
+        keep = ~np.isin(ids, seed_ids)
+        if exclude is not None:
+            keep &= ~exclude(ids)
+        ids, scores = ids[keep], scores[keep]
+        top = np.lexsort((ids, -scores))[:n]
+        return ids[top].tolist()
+
+def recent_liked(ratings_index, user_id, n=N_RECENT_LIKED, liked_rating=LIKED_RATING):
+    """The user's n most recently rated movies with a rating >= liked_rating"""
+    movie_ids, ratings = ratings_index.history(user_id)
+    return movie_ids[ratings >= liked_rating][-n:]
+
+def main():
+    print("="*70)
+    print("ITEM-ITEM NEIGHBORS")
+    print("="*70)
+    neighbors = save_item_neighbors()
+    n_movies = neighbors["MovieID"].nunique()
+    print(f"  ✓ {n_movies:,} movies, {len(neighbors):,} neighbor pairs "
+          f"(top-{N_NEIGHBORS}) -> {artifact_path(PROCESSED_DIR, NEIGHBORS_NAME)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# src/materialize.py
+
+import os
+import json
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from inference import (
+    MODEL_DIR, PROCESSED_DIR, load_serving_model, load_inference_data, load_feature_store, recommend_for_users
+)
+from artifacts import fingerprint
+from ratings_index import RatingsIndex
+from model_registry import REGISTRY_DIR, CURRENT_NAME
+from embeddings import EMBEDDINGS_PATH, load_retriever
+from item_neighbors import ItemNeighbors
+from profiler import step
+
+MATERIALIZED_DIR = "data/materialized"
+MANIFEST_NAME = "manifest.json"
+MATERIALIZED_K = 50
+USERS_PER_TASK = 500
+N_WORKERS = os.cpu_count() or 1
+
+TOPK_DTYPE = np.dtype([("MovieID", np.int32), ("score", np.float32)])
+
+# Artifacts whose change invalidates the materialized lists
+MODEL_INPUTS = [
+    os.path.join(MODEL_DIR, "ranker_model.pkl"),
+    os.path.join(MODEL_DIR, "feature_names.csv"),
+    os.path.join(REGISTRY_DIR, CURRENT_NAME),
+    EMBEDDINGS_PATH,
+]
+DATA_INPUTS = [
+    os.path.join(PROCESSED_DIR, name + ".arrow")
+    for name in ["ratings_processed", "movies_processed", "users_processed", "user_stats", "item_stats",
+                 "user_genre_preferences", "user_features", "item_features", "item_neighbors"]
+]
+VERSION_INPUTS = MODEL_INPUTS + DATA_INPUTS
+
+def artifact_version(paths=VERSION_INPUTS):
+    """Short hash of the size and mtime of the model and data artifacts"""
+    return fingerprint(paths)
+
+# ----------------------------
+# Offline scoring
+# ----------------------------
+_WORKER = {}
+
+def _init_worker(n_threads=None):
+    serving = load_serving_model()
+    if n_threads is not None:
+        serving.model.set_params(n_jobs=n_threads)
+    ratings, movies, user_stats, item_stats, user_genre_prefs = load_inference_data()
+    _WORKER.update(
+        model=serving.model, scorer=serving.scorer, feature_cols=serving.feature_cols, movies=movies,
+        user_stats=user_stats, item_stats=item_stats, user_genre_prefs=user_genre_prefs,
+        ratings_index=RatingsIndex.from_ratings(ratings), feature_store=load_feature_store(),
+        retriever=load_retriever(), item_neighbors=ItemNeighbors.load()
+    )
+
+def _score_users(user_ids, k):
+    w = _WORKER
+    recs = recommend_for_users(
+        user_ids, w["model"], w["feature_cols"], None, w["movies"], w["user_stats"], w["item_stats"],
+        w["user_genre_prefs"], top_k=k, ratings_index=w["ratings_index"], feature_store=w["feature_store"],
+        scorer=w["scorer"], retriever=w["retriever"], item_neighbors=w["item_neighbors"]
+    )
+    return recs["UserID"].to_numpy(), recs["MovieID"].to_numpy(), recs["score"].to_numpy()
+
+def _fill_table(table, user_ids, movie_ids, scores):
+    # recs are grouped by user, best first, so the rank is the offset inside each run
+    if len(user_ids) == 0:
+        return
+    starts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+    rank = np.arange(len(user_ids)) - np.repeat(starts, np.diff(np.r_[starts, len(user_ids)]))
+    table["MovieID"][user_ids, rank] = movie_ids
+    table["score"][user_ids, rank] = scores
+
+def materialize_all(k=MATERIALIZED_K, n_workers=N_WORKERS, directory=MATERIALIZED_DIR):
+    """Score every known user and write the top-k lists as an ID-indexed table.
+
+    Row u of the (max UserID + 1, k) table holds user u's ranked (MovieID,
+    score) pairs, padded with MovieID -1. Users are scored in chunks of
+    USERS_PER_TASK across n_workers processes. Returns the new version.
+    """
+    version = artifact_version()
+    if n_workers <= 1:
+        _init_worker()
+        user_ids = _WORKER["ratings_index"].user_ids
+    else:
+        user_ids = RatingsIndex.from_ratings(load_inference_data()[0], bitset_max_bytes=0).user_ids
+
+    table = np.zeros((int(user_ids.max(initial=0)) + 1, k), dtype=TOPK_DTYPE)
+    table["MovieID"] = -1
+    chunks = [user_ids[i:i + USERS_PER_TASK].tolist() for i in range(0, len(user_ids), USERS_PER_TASK)]
+
+    with step("score_users", rows=len(user_ids)):
+        if n_workers <= 1:
+            for chunk in chunks:
+                _fill_table(table, *_score_users(chunk, k))
+        else:
+            # spawn: safe to start from a process that already runs threads (the API server)
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(1,)) as pool:
+                for result in pool.map(_score_users, chunks, [k] * len(chunks)):
+                    _fill_table(table, *result)
+
+    save_materialized(table, version, directory)
+    return version
+
+def save_materialized(table, version, directory=MATERIALIZED_DIR):
+    """Write topk_<version>.npy, then atomically point the manifest at it"""
+    os.makedirs(directory, exist_ok=True)
+    file_name = f"topk_{version}.npy"
+    path = os.path.join(directory, file_name)
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, table)
+    os.replace(path + ".tmp", path)
+
+    manifest = {
+        "version": version,
+        "file": file_name,
+        "k": int(table.shape[1]),
+        "num_users": int((table["MovieID"][:, 0] >= 0).sum()),
+        "created_at": datetime.now().isoformat(timespec="seconds")
+    }
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Readers keep their mapping of a replaced file, so older versions can go
+    for old in os.listdir(directory):
+        if old.startswith("topk_") and old != file_name:
+            os.remove(os.path.join(directory, old))
+    return path
+
+# ----------------------------
+# Serving
+# ----------------------------
+class MaterializedTopK:
+    """Memory-mapped top-k table written by materialize_all()"""
+
+    def __init__(self, table, version):
+        self.table = table
+        self.version = version
+        self.k = table.shape[1]
+
+    @classmethod
+    def load(cls, directory=MATERIALIZED_DIR):
+        """Map the current table, or None when nothing has been materialized yet"""
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        table = np.load(os.path.join(directory, manifest["file"]), mmap_mode="r")
+        return cls(table, manifest["version"])
+
+    def lookup(self, user_ids, top_k):
+        """Materialized recommendations for the covered users.
+
+        Returns (covered, rows): covered masks user_ids that have a stored
+        list and top_k <= k; rows holds their UserID / MovieID / score
+        arrays, best first within each user.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not 0 < top_k <= self.k:
+            empty = np.zeros(0, dtype=np.int64)
+            return np.zeros(len(user_ids), dtype=bool), {"UserID": empty, "MovieID": empty, "score": empty}
+
+        in_range = (user_ids >= 0) & (user_ids < len(self.table))
+        lists = self.table[np.where(in_range, user_ids, 0), :top_k]
+        covered = in_range & (lists["MovieID"][:, 0] >= 0)
+
+        lists = lists[covered]
+        keep = lists["MovieID"] >= 0
+        rows = {
+            "UserID": np.repeat(user_ids[covered], keep.sum(axis=1)),
+            "MovieID": lists["MovieID"][keep].astype(np.int64),
+            "score": lists["score"][keep]
+        }
+        return covered, rows
+
+def main():
+    print("="*70)
+    print("MATERIALIZING TOP-K RECOMMENDATIONS")
+    print("="*70)
+    version = materialize_all()
+    top = MaterializedTopK.load()
+    print(f"  ✓ {(top.table['MovieID'][:, 0] >= 0).sum():,} users × top-{top.k} (version {version})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# src/micro_batcher.py
+
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 5.0
+# Recent per-request / per-batch timings kept for the percentile metrics
+METRIC_WINDOW = 10000
+
+class MicroBatcher:
+    """Coalesces concurrent asyncio requests into batched calls of process_batch.
+
+    submit(item) queues an item and awaits its result. A collector task
+    takes the first queued item, then keeps collecting until it holds
+    max_batch_size items or the first one has waited max_wait_ms, and runs
+    process_batch(items) -> results (same order) in a worker thread while
+    the event loop keeps accepting requests. Items that arrive during a
+    batch form the next one, so under load batches grow on their own
+    while the wait stays bounded.
+    """
+
+    def __init__(self, process_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 executor=None):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="microbatch")
+        self._queue = None
+        self._arrived = None
+        self._task = None
+        self.batches = 0
+        self.items = 0
+        self.size_histogram = {}
+        self.queue_waits = deque(maxlen=METRIC_WINDOW)
+        self.batch_times = deque(maxlen=METRIC_WINDOW)
+
+    async def submit(self, item):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._arrived = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._collect())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.monotonic()))
+        self._arrived.set()
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                # Waiting on an event rather than queue.get() can never drop an item on timeout
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            start = time.monotonic()
+            self.queue_waits.extend(start - enqueued for _, _, enqueued in batch)
+            try:
+                items = [item for item, _, _ in batch]
+                results = await loop.run_in_executor(self.executor, self.process_batch, items)
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batch_times.append(time.monotonic() - start)
+            self._record(len(batch))
+
+    def _record(self, size):
+        self.batches += 1
+        self.items += size
+        # Power-of-two buckets: "1", "2-3", "4-7", ...
+        low = 1 << (size.bit_length() - 1)
+        bucket = str(low) if low == 1 else f"{low}-{2 * low - 1}"
+        self.size_histogram[bucket] = self.size_histogram.get(bucket, 0) + 1
+
+    def stats(self):
+        def percentiles_ms(values):
+            if not values:
+                return None
+            p50, p90, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 90, 99]) * 1000
+            return {"p50": round(p50, 3), "p90": round(p90, 3), "p99": round(p99, 3)}
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+            "batch_size_histogram": dict(
+                sorted(self.size_histogram.items(), key=lambda kv: int(kv[0].split("-")[0]))
+            ),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_wait_ms": percentiles_ms(self.queue_waits),
+            "batch_ms": percentiles_ms(self.batch_times)
+        }
@@ -0,0 +1,136 @@
+# src/model_registry.py
+
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+from xgboost import XGBClassifier, XGBRanker
+
+from scorer import RankerScorer
+
+REGISTRY_DIR = "models/registry"
+CURRENT_NAME = "current.json"
+MANIFEST_NAME = "manifest.json"
+MODEL_FILE = "model.ubj"
+# Registered versions kept on disk besides the active one
+REGISTRY_KEEP = 5
+
+MODEL_CLASSES = {"XGBRanker": XGBRanker, "XGBClassifier": XGBClassifier}
+
+def _write_json(path, payload):
+    # Readers only ever see the old or the new file, never a partial one
+    with open(path + ".tmp", "w") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+# ----------------------------
+# Registration
+# ----------------------------
+def register_model(model, feature_cols, metrics=None, data_hash=None, activate=True,
+                   registry_dir=REGISTRY_DIR, parent_version=None, trained_through=None):
+    """Save model in XGBoost's native UBJSON format under a new version.
+
+    <registry_dir>/<version>/ holds model.ubj and a manifest with the
+    features, evaluation metrics, the hash of the training data, the
+    version it was warm-started from (if any) and the newest rating
+    timestamp it was trained on. The version is the creation time plus a
+    hash of the model bytes. With activate, current.json is pointed at the
+    new version. Returns it.
+    """
+    raw = model.get_booster().save_raw("ubj")
+    created_at = datetime.now()
+    version = f"{created_at:%Y%m%d-%H%M%S}-{hashlib.sha1(raw).hexdigest()[:8]}"
+
+    version_dir = os.path.join(registry_dir, version)
+    tmp_dir = version_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    model.save_model(os.path.join(tmp_dir, MODEL_FILE))
+    _write_json(os.path.join(tmp_dir, MANIFEST_NAME), {
+        "version": version,
+        "model_class": type(model).__name__,
+        "objective": model.get_params().get("objective"),
+        "file": MODEL_FILE,
+        "features": list(feature_cols),
+        "metrics": {name: float(value) for name, value in (metrics or {}).items()},
+        "data_hash": data_hash,
+        "parent_version": parent_version,
+        "trained_through": int(trained_through) if trained_through is not None else None,
+        "created_at": created_at.isoformat(timespec="seconds")
+    })
+    os.replace(tmp_dir, version_dir)
+
+    if activate:
+        activate_version(version, registry_dir)
+    return version
+
+def activate_version(version, registry_dir=REGISTRY_DIR):
+    """Atomically make version the one served, then prune old versions"""
+    if not os.path.exists(os.path.join(registry_dir, version, MANIFEST_NAME)):
+        raise ValueError(f"Unknown model version: {version}")
+    _write_json(os.path.join(registry_dir, CURRENT_NAME), {
+        "version": version,
+        "activated_at": datetime.now().isoformat(timespec="seconds")
+    })
+    prune_versions(registry_dir)
+
+def prune_versions(registry_dir=REGISTRY_DIR, keep=REGISTRY_KEEP):
+    """Delete all but the newest keep versions, never the active one"""
+    active = current_version(registry_dir)
+    for version in list_versions(registry_dir)[:-keep or None]:
+        if version != active:
+            shutil.rmtree(os.path.join(registry_dir, version), ignore_errors=True)
+
+# ----------------------------
+# Lookup / loading
+# ----------------------------
+def list_versions(registry_dir=REGISTRY_DIR):
+    """Registered versions, oldest first"""
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(registry_dir)
+        if os.path.exists(os.path.join(registry_dir, name, MANIFEST_NAME))
+    )
+
+def current_version(registry_dir=REGISTRY_DIR):
+    """Active version, or None when nothing has been registered"""
+    path = os.path.join(registry_dir, CURRENT_NAME)
+    if not os.path.exists(path):
+        return None
+    return _read_json(path)["version"]
+
+def load_manifest(version, registry_dir=REGISTRY_DIR):
+    return _read_json(os.path.join(registry_dir, version, MANIFEST_NAME))
+
+class ServingModel:
+    """One loaded model version: the estimator, its features and its scorer.
+
+    Swapped as a whole, so a request that picked it up keeps a consistent
+    model / feature list / scorer even if a newer version is activated
+    meanwhile.
+    """
+
+    def __init__(self, model, feature_cols, version, manifest=None):
+        self.model = model
+        self.feature_cols = feature_cols
+        self.version = version
+        self.manifest = manifest or {}
+        self.scorer = RankerScorer(model)
+
+    @classmethod
+    def load(cls, version=None, registry_dir=REGISTRY_DIR):
+        """Load version (default: the active one), or None when nothing is registered"""
+        version = version or current_version(registry_dir)
+        if version is None:
+            return None
+        manifest = load_manifest(version, registry_dir)
+        model = MODEL_CLASSES[manifest["model_class"]]()
+        model.load_model(os.path.join(registry_dir, version, manifest["file"]))
+        return cls(model, manifest["features"], version, manifest)
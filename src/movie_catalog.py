@@ -0,0 +1,119 @@
+# src/movie_catalog.py
+
+import json
+
+import numpy as np
+
+NON_GENRE_COLUMNS = ["MovieID", "Title", "Release_Year"]
+
+def genre_strings(movies):
+    """Pipe-joined active genres per movie row ("Movie" when none is set)"""
+    genre_cols = np.asarray([c for c in movies.columns if c not in NON_GENRE_COLUMNS])
+    flags = movies[genre_cols].to_numpy() == 1
+    return ["|".join(genre_cols[row]) or "Movie" for row in flags]
+
+def _object_array(values, size, positions):
+    array = np.empty(size, dtype=object)
+    array[positions] = values
+    return array
+
+class MovieCatalog:
+    """Response fields of every movie in MovieID-indexed arrays, built once.
+
+    Title, release year ("N/A" when unknown), pipe-joined genres, average
+    rating and rating count are stored as ready Python values, together with
+    their pre-encoded JSON text. records() gathers them for a list of
+    MovieIDs; to_json() concatenates the JSON text directly, so a response
+    needs no per-row DataFrame work. With scores the records carry movie_id
+    and score (existing users); without, they are the cold-start records.
+    MovieIDs missing from the catalog are skipped.
+    """
+
+    def __init__(self, movies, item_stats):
+        movies = movies[NON_GENRE_COLUMNS].assign(Genres=genre_strings(movies)).merge(
+            item_stats[["MovieID", "item_avg_rating", "item_rating_count"]], on="MovieID", how="left"
+        )
+        movie_ids = movies["MovieID"].to_numpy(np.int64)
+        size = int(movie_ids.max(initial=0)) + 1
+        self.known = np.zeros(size, dtype=bool)
+        self.known[movie_ids] = True
+
+        year = movies["Release_Year"].to_numpy(np.float64)
+        avg = movies["item_avg_rating"].to_numpy(np.float64)
+        count = movies["item_rating_count"].to_numpy(np.float64)
+        titles = movies["Title"].tolist()
+        genres = movies["Genres"].tolist()
+        years = [int(y) if not np.isnan(y) else "N/A" for y in year]
+        avg_ratings = [round(float(a), 2) if not np.isnan(a) else 0.0 for a in avg]
+        num_ratings = [int(c) if not np.isnan(c) else 0 for c in count]
+
+        self.title = _object_array(titles, size, movie_ids)
+        self.release_year = _object_array(years, size, movie_ids)
+        self.genres = _object_array(genres, size, movie_ids)
+        self.avg_rating = _object_array(avg_ratings, size, movie_ids)
+        self.num_ratings = _object_array(num_ratings, size, movie_ids)
+
+        # JSON text around the score, in the same key order as records()
+        dumps = json.dumps
+        self._json_head = _object_array([
+            f'"title": {dumps(t)}, "release_year": {dumps(y)}, "genres": {dumps(g)}'
+            for t, y, g in zip(titles, years, genres)
+        ], size, movie_ids)
+        self._json_tail = _object_array([
+            f'"avg_rating": {dumps(a)}, "num_ratings": {n}}}' for a, n in zip(avg_ratings, num_ratings)
+        ], size, movie_ids)
+
+    def update_stats(self, movie_id, avg_rating, num_ratings):
+        """Refresh one movie's rating fields (and their JSON text), e.g. after new ratings"""
+        if movie_id not in self:
+            return
+        avg, count = round(float(avg_rating), 2), int(num_ratings)
+        self.avg_rating[movie_id] = avg
+        self.num_ratings[movie_id] = count
+        self._json_tail[movie_id] = f'"avg_rating": {json.dumps(avg)}, "num_ratings": {count}}}'
+
+    def __contains__(self, movie_id):
+        return 0 <= movie_id < len(self.known) and bool(self.known[movie_id])
+
+    def _known_ids(self, movie_ids, scores):
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        mask = (movie_ids >= 0) & (movie_ids < len(self.known))
+        mask[mask] = self.known[movie_ids[mask]]
+        if scores is not None:
+            scores = [round(s, 4) for s in np.asarray(scores, dtype=np.float64)[mask].tolist()]
+        return movie_ids[mask], scores
+
+    def records(self, movie_ids, scores=None):
+        """Response dicts for movie_ids, in order"""
+        movie_ids, scores = self._known_ids(movie_ids, scores)
+        columns = (self.title[movie_ids], self.release_year[movie_ids], self.genres[movie_ids],
+                   self.avg_rating[movie_ids], self.num_ratings[movie_ids])
+        if scores is None:
+            return [
+                {"title": t, "release_year": y, "genres": g, "avg_rating": a, "num_ratings": n}
+                for t, y, g, a, n in zip(*columns)
+            ]
+        return [
+            {"movie_id": m, "title": t, "release_year": y, "genres": g, "score": s,
+             "avg_rating": a, "num_ratings": n}
+            for m, s, t, y, g, a, n in zip(movie_ids.tolist(), scores, *columns)
+        ]
+
+    def to_json(self, movie_ids, scores=None):
+        """JSON array text of records(movie_ids, scores), built from the pre-encoded fields"""
+        movie_ids, scores = self._known_ids(movie_ids, scores)
+        heads, tails = self._json_head[movie_ids], self._json_tail[movie_ids]
+        if scores is None:
+            items = [f"{{{h}, {t}" for h, t in zip(heads, tails)]
+        else:
+            items = [
+                f'{{"movie_id": {m}, {h}, "score": {s!r}, {t}'
+                for m, s, h, t in zip(movie_ids.tolist(), scores, heads, tails)
+            ]
+        return "[" + ", ".join(items) + "]"
+
+def encode_json(payload, **encoded):
+    """JSON text of payload plus fields whose values are already JSON text (e.g. to_json())"""
+    parts = [json.dumps(payload)[1:-1]] if payload else []
+    parts += [f"{json.dumps(key)}: {value}" for key, value in encoded.items()]
+    return "{" + ", ".join(parts) + "}"
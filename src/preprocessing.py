@@ -1,108 +1,155 @@
 import pandas as pd
+import numpy as np
 import os
+from scipy import sparse
+
+from dat_reader import read_dat, RATINGS_SCHEMA, USERS_SCHEMA, MOVIES_SCHEMA
+from artifacts import save_table, load_table, TableWriter
+from feature_store import build_feature_tables
+from ingest import read_ratings_log, save_ingested_offset
+from profiler import step
 
 RAW_DIR = "data/raw"
 PROCESSED_DIR = "data/processed"
 
-def save_processed(df, file_name):
-    os.makedirs(PROCESSED_DIR, exist_ok=True)
-    df.to_csv(os.path.join(PROCESSED_DIR, file_name), index=False)
+def save_processed(df, name, writer=None):
+    """Write a processed table now, or queue it on writer (a TableWriter)"""
+    if writer is None:
+        save_table(df, PROCESSED_DIR, name)
+    else:
+        writer.save(df, PROCESSED_DIR, name)
 
-def preprocess_users(file_name="users.dat"):
-    df = pd.read_csv(
-        os.path.join(RAW_DIR, file_name),
-        sep="::", engine="python", header=None, encoding="latin-1"
-    )
-    df.columns = ["UserID", "Gender", "Age", "Occupation", "ZipCode"]
-    df["UserID"] = pd.to_numeric(df["UserID"], errors="coerce")
-    df["Age"] = pd.to_numeric(df["Age"], errors="coerce")
+def preprocess_users(file_name="users.dat", writer=None):
+    df = read_dat(os.path.join(RAW_DIR, file_name), USERS_SCHEMA)
     df["Occupation"] = df["Occupation"].astype("category")
-    save_processed(df, "users_processed.csv")
+    save_processed(df, "users_processed", writer)
     return df
 
-def preprocess_movies(file_name="movies.dat"):
-    df = pd.read_csv(
-        os.path.join(RAW_DIR, file_name),
-        sep="::", engine="python", header=None, encoding="latin-1"
-    )
-    df.columns = ["MovieID", "Title", "Genres"]
-    df["MovieID"] = pd.to_numeric(df["MovieID"], errors="coerce")
+def preprocess_movies(file_name="movies.dat", writer=None):
+    df = read_dat(os.path.join(RAW_DIR, file_name), MOVIES_SCHEMA)
     df["Release_Year"] = pd.to_numeric(df["Title"].str.extract(r"\((\d{4})\)")[0], errors="coerce")
     df["Title"] = df["Title"].str.replace(r"\(\d{4}\)", "", regex=True).str.strip()
     
     genre_dummies = df["Genres"].str.get_dummies(sep="|")
     df = pd.concat([df.drop(columns=["Genres"]), genre_dummies], axis=1)
-    save_processed(df, "movies_processed.csv")
+    save_processed(df, "movies_processed", writer)
     return df
 
-def preprocess_ratings(file_name="ratings.dat"):
-    df = pd.read_csv(
-        os.path.join(RAW_DIR, file_name),
-        sep="::", engine="python", header=None, encoding="latin-1"
-    )
-    df.columns = ["UserID", "MovieID", "Rating", "Timestamp"]
-    df = df.apply(pd.to_numeric, errors="coerce")
+def preprocess_ratings(file_name="ratings.dat", n_threads=1, writer=None):
+    df = read_dat(os.path.join(RAW_DIR, file_name), RATINGS_SCHEMA, n_threads=n_threads)
+    # Ratings ingested by the API since the raw export; serving replays only what comes after offset
+    ingested, offset = read_ratings_log()
+    if len(ingested):
+        # A re-rated movie keeps only its latest rating, as the serving tables treat it
+        df = pd.concat([df, ingested.astype(RATINGS_SCHEMA)], ignore_index=True)
+        df = df.drop_duplicates(["UserID", "MovieID"], keep="last", ignore_index=True)
     df["Relevance"] = (df["Rating"] >= 4).astype(int)
-    save_processed(df, "ratings_processed.csv")
+    save_processed(df, "ratings_processed", writer)
+    # Only once the ratings are on disk: serving replays the log from this offset
+    if writer is None:
+        save_ingested_offset(offset)
+    else:
+        writer.call(save_ingested_offset, offset)
     return df
 
-def compute_basic_features():
-    ratings = pd.read_csv(os.path.join(PROCESSED_DIR, "ratings_processed.csv"))
-    movies = pd.read_csv(os.path.join(PROCESSED_DIR, "movies_processed.csv"))
+def compute_user_genre_preferences(ratings, movies):
+    """Rating-weighted genre profile per user: (R @ G) / per-user rating sum.
+
+    R is the sparse user x movie rating matrix and G the movie x genre flag
+    matrix. Ratings of movies missing from movies count towards the rating
+    sum only.
+    """
+    genre_cols = [c for c in movies.columns if c not in ["MovieID", "Title", "Release_Year"]]
+    genre_matrix = sparse.csr_matrix(movies[genre_cols].to_numpy(np.float64))
+    movie_ids = movies["MovieID"].to_numpy()
+    
+    user_ids, user_rows = np.unique(ratings["UserID"].to_numpy(), return_inverse=True)
+    movie_cols = pd.Index(movie_ids).get_indexer(ratings["MovieID"].to_numpy())
+    rating_values = ratings["Rating"].to_numpy(np.float64)
+    known = movie_cols >= 0
+    
+    rating_matrix = sparse.csr_matrix(
+        (rating_values[known], (user_rows[known], movie_cols[known])),
+        shape=(len(user_ids), len(movie_ids))
+    )
+    rating_sums = np.bincount(user_rows, weights=rating_values, minlength=len(user_ids))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prefs = (rating_matrix @ genre_matrix).toarray() / rating_sums[:, None]
+    
+    user_genre_prefs = pd.DataFrame(prefs, columns=[f"user_pref_{g}" for g in genre_cols])
+    user_genre_prefs.insert(0, "UserID", user_ids)
+    return user_genre_prefs
+
+def compute_basic_features(ratings=None, movies=None, writer=None):
+    """Aggregate and serving tables from the processed ratings and movies (read back when not given)"""
+    if ratings is None:
+        ratings = load_table(PROCESSED_DIR, "ratings_processed")
+    if movies is None:
+        movies = load_table(PROCESSED_DIR, "movies_processed")
     
     # User stats
-    user_stats = ratings.groupby("UserID").agg(
-        user_avg_rating=("Rating", "mean"),
-        user_rating_count=("Rating", "count"),
-        user_positive_rate=("Relevance", "mean"),
-        user_first_ts=("Timestamp", "min"),
-        user_last_ts=("Timestamp", "max")
-    ).reset_index()
-    user_stats["user_tenure_days"] = (user_stats["user_last_ts"] - user_stats["user_first_ts"]) / 86400
-    save_processed(user_stats, "user_stats.csv")
+    with step("user_stats", rows=len(ratings)):
+        user_stats = ratings.groupby("UserID").agg(
+            user_avg_rating=("Rating", "mean"),
+            user_rating_count=("Rating", "count"),
+            user_positive_rate=("Relevance", "mean"),
+            user_first_ts=("Timestamp", "min"),
+            user_last_ts=("Timestamp", "max")
+        ).reset_index()
+        user_stats["user_tenure_days"] = (user_stats["user_last_ts"] - user_stats["user_first_ts"]) / 86400
+    save_processed(user_stats, "user_stats", writer)
     
     # Item stats
-    item_stats = ratings.groupby("MovieID").agg(
-        item_avg_rating=("Rating", "mean"),
-        item_rating_count=("Rating", "count"),
-        item_positive_rate=("Relevance", "mean"),
-        item_first_ts=("Timestamp", "min"),
-        item_last_ts=("Timestamp", "max")
-    ).reset_index()
-    item_stats["item_tenure_days"] = (item_stats["item_last_ts"] - item_stats["item_first_ts"]) / 86400
-    item_stats = item_stats.merge(movies, on="MovieID", how="left")
-    save_processed(item_stats, "item_stats.csv")
+    with step("item_stats", rows=len(ratings)):
+        item_stats = ratings.groupby("MovieID").agg(
+            item_avg_rating=("Rating", "mean"),
+            item_rating_count=("Rating", "count"),
+            item_positive_rate=("Relevance", "mean"),
+            item_first_ts=("Timestamp", "min"),
+            item_last_ts=("Timestamp", "max")
+        ).reset_index()
+        item_stats["item_tenure_days"] = (item_stats["item_last_ts"] - item_stats["item_first_ts"]) / 86400
+        item_stats = item_stats.merge(movies, on="MovieID", how="left")
+    save_processed(item_stats, "item_stats", writer)
     
     # User genre preferences
-    genre_cols = [c for c in movies.columns if c not in ["MovieID", "Title", "Release_Year"]]
-    ratings_with_genres = ratings.merge(movies[["MovieID"] + genre_cols], on="MovieID", how="left")
+    with step("genre_preferences", rows=len(ratings)):
+        user_genre_prefs = compute_user_genre_preferences(ratings, movies)
+    save_processed(user_genre_prefs, "user_genre_preferences", writer)
     
-    user_genre_prefs = []
-    for user_id, group in ratings_with_genres.groupby("UserID"):
-        weighted_genres = (group[genre_cols].T * group["Rating"]).T.sum() / group["Rating"].sum()
-        genre_dict = {"UserID": user_id}
-        for genre in genre_cols:
-            genre_dict[f"user_pref_{genre}"] = weighted_genres[genre]
-        user_genre_prefs.append(genre_dict)
-    
-    save_processed(pd.DataFrame(user_genre_prefs), "user_genre_preferences.csv")
+    # Serving feature tables
+    with step("feature_tables", rows=len(ratings)):
+        user_features, item_features = build_feature_tables(ratings, user_stats, item_stats, user_genre_prefs)
+    save_processed(user_features, "user_features", writer)
+    save_processed(item_features, "item_features", writer)
 
 def main():
     print("="*60)
     print("PREPROCESSING PIPELINE")
     print("="*60)
     
-    print("\n[1/4] Preprocessing users...")
-    preprocess_users()
-    
-    print("[2/4] Preprocessing movies...")
-    preprocess_movies()
-    
-    print("[3/4] Preprocessing ratings...")
-    preprocess_ratings()
-    
-    print("[4/4] Computing aggregate features...")
-    compute_basic_features()
+    # Tables are handed on in memory and written in the background
+    with TableWriter() as writer:
+        print("\n[1/4] Preprocessing users...")
+        with step("users") as record:
+            record["rows"] = len(preprocess_users(writer=writer))
+        
+        print("[2/4] Preprocessing movies...")
+        with step("movies") as record:
+            movies = preprocess_movies(writer=writer)
+            record["rows"] = len(movies)
+        
+        print("[3/4] Preprocessing ratings...")
+        with step("ratings") as record:
+            ratings = preprocess_ratings(writer=writer)
+            record["rows"] = len(ratings)
+        
+        print("[4/4] Computing aggregate features...")
+        with step("aggregates", rows=len(ratings)):
+            compute_basic_features(ratings, movies, writer)
+        
+        with step("flush_writes"):
+            writer.wait()
     
     print("\n"+"="*60)
     print("✓ Preprocessing complete!")
@@ -0,0 +1,104 @@
+# src/profiler.py
+
+import sys
+import time
+import resource
+from collections import deque
+from contextlib import contextmanager
+
+# Steps recorded in this process, in completion order (bounded for long-running servers)
+STEPS = deque(maxlen=10000)
+_STACK = []
+
+def _maxrss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _hwm_mb():
+    """Peak RSS since the last _reset_hwm() (VmHWM), else the process peak"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _maxrss_mb()
+
+def _reset_hwm():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux only)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _io():
+    """(bytes read, bytes written) through read/write calls so far, or (None, None) without /proc"""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def snapshot():
+    """Cumulative counters of this process and its finished children"""
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    read, written = _io()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": sum(u.ru_utime + u.ru_stime for u in usage),
+        "major_faults": sum(u.ru_majflt for u in usage),
+        "read": read,
+        "written": written
+    }
+
+def usage_since(start, peak_rss_mb, rows=None):
+    """Report fields for the interval since snapshot() start"""
+    end = snapshot()
+    wall = end["wall"] - start["wall"]
+    delta = lambda key: end[key] - start[key] if start[key] is not None and end[key] is not None else None
+    return {
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(end["cpu"] - start["cpu"], 3),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "bytes_read": delta("read"),
+        "bytes_written": delta("written"),
+        "major_page_faults": delta("major_faults"),
+        "rows": rows,
+        "rows_per_second": round(rows / wall) if rows and wall > 0 else None
+    }
+
+@contextmanager
+def step(name, rows=None):
+    """Record wall and CPU time, peak RSS, I/O and rows/second of the enclosed block in STEPS.
+
+    Nested steps are named "outer/inner". Peak RSS is the block's own
+    high-water mark where Linux lets it be reset, else the process peak so
+    far. Bytes read/written count read()/write() calls of the whole process
+    (background writes included); memory-mapped reads show up as major
+    page faults instead. rows may also be set on the
+    yielded record once known: record["rows"] = n.
+    """
+    peak = _hwm_mb()
+    for frame in _STACK:
+        frame["peak"] = max(frame["peak"], peak)
+    _reset_hwm()
+    if _STACK:
+        name = f"{_STACK[-1]['name']}/{name}"
+    record = {"name": name, "rows": rows, "peak": 0.0}
+    record["start"] = snapshot()
+    _STACK.append(record)
+    try:
+        yield record
+    finally:
+        _STACK.pop()
+        peak = max(record["peak"], _hwm_mb())
+        for frame in _STACK:
+            frame["peak"] = max(frame["peak"], peak)
+        STEPS.append({"name": record["name"], **usage_since(record["start"], peak, record["rows"])})
+
+def children_peak_rss_mb():
+    """Largest peak RSS among finished child processes (e.g. worker pools)"""
+    return round(_maxrss_mb(resource.RUSAGE_CHILDREN), 1)
@@ -1,140 +1,327 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+import time
 import pickle
-from sklearn.model_selection import train_test_split
+import resource
+from datetime import datetime
+import xgboost as xgb
 from xgboost import XGBClassifier, XGBRanker
 import warnings
+
+from artifacts import load_table, list_shards, iter_table_shards, table_files, fingerprint
+from evaluation import EVAL_KS, METRICS, evaluate_ranking
+from model_registry import register_model, ServingModel
+from profiler import step
 warnings.filterwarnings('ignore')
 
 FEATURE_DIR = "data/features"
+PROCESSED_DIR = "data/processed"
 MODEL_DIR = "models"
+# Boosting rounds a warm-start run adds to the active ranker
+WARM_START_ROUNDS = 20
+# A warm-started ranker is registered only if this held-out metric does not drop
+GATE_METRIC = "ndcg@10"
 
-def load_training_data():
-    df = pd.read_csv(os.path.join(FEATURE_DIR, "training_data.csv"))
-    feature_names = pd.read_csv(os.path.join(FEATURE_DIR, "feature_names.csv"))
-    return df, feature_names["feature"].tolist()
+BASELINE_PARAMS = dict(
+    n_estimators=100, max_depth=6, learning_rate=0.1,
+    objective='binary:logistic', random_state=42, eval_metric='logloss'
+)
+RANKER_PARAMS = dict(
+    n_estimators=100, max_depth=6, learning_rate=0.1,
+    objective='rank:ndcg', random_state=42
+)
 
-def split_by_users(df, test_size=0.2, random_state=42):
-    users = df["UserID"].unique()
+def choose_test_users(users, test_size=0.2, random_state=42):
     np.random.seed(random_state)
-    test_users = np.random.choice(users, size=int(len(users) * test_size), replace=False)
-    train_users = np.setdiff1d(users, test_users)
+    return np.random.choice(users, size=int(len(users) * test_size), replace=False)
+
+# ----------------------------
+# Shared quantized training data
+# ----------------------------
+class ShardIterator(xgb.DataIter):
+    """Feeds one feature shard at a time (rows of the selected users only) to QuantileDMatrix.
+
+    Shards hold ascending UserID ranges, so sorting each one keeps qid sorted overall.
+    """
+    
+    def __init__(self, feature_cols, users):
+        self.feature_cols = feature_cols
+        self.users = users
+        self._shards = None
+        super().__init__()
+    
+    def next(self, input_data):
+        if self._shards is None:
+            self._shards = iter_table_shards(
+                FEATURE_DIR, "training_data", columns=["UserID"] + self.feature_cols + ["Relevance"]
+            )
+        shard = next(self._shards, None)
+        if shard is None:
+            return False
+        keep = np.isin(shard["UserID"].to_numpy(), self.users)
+        uid, X, y = _sorted_by_user(
+            shard["UserID"].to_numpy()[keep],
+            shard[self.feature_cols].to_numpy(np.float32)[keep],
+            shard["Relevance"].to_numpy()[keep]
+        )
+        input_data(data=X, label=y, qid=uid)
+        return True
     
-    train_df = df[df["UserID"].isin(train_users)].copy()
-    test_df = df[df["UserID"].isin(test_users)].copy()
-    return train_df, test_df
+    def reset(self):
+        self._shards = None
 
-def prepare_model_data(df, feature_cols):
-    return df[feature_cols].values, df["Relevance"].values, df["UserID"].values
+def _sorted_by_user(uid, *arrays):
+    # Ranking objectives need rows grouped by non-decreasing qid
+    if len(uid) == 0 or np.all(uid[1:] >= uid[:-1]):
+        return (uid,) + arrays
+    order = np.argsort(uid, kind="stable")
+    return (uid[order],) + tuple(a[order] for a in arrays)
 
-def train_baseline(X_train, y_train, X_test, y_test):
-    model = XGBClassifier(
-        n_estimators=100, max_depth=6, learning_rate=0.1,
-        objective='binary:logistic', random_state=42, eval_metric='logloss'
-    )
-    model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
-    return model
+def training_users():
+    """Users of the training table in order of first appearance, as choose_test_users samples them"""
+    return pd.unique(np.concatenate([
+        pd.unique(shard["UserID"].to_numpy())
+        for shard in iter_table_shards(FEATURE_DIR, "training_data", columns=["UserID"])
+    ]))
+
+def _test_labels(dtest):
+    # Labels and query-group numbers of the test rows, for evaluate_ranking
+    y_test = dtest.get_label().astype(np.int64)
+    group_ptr = dtest.get_uint_info("group_ptr")
+    qid_test = np.repeat(np.arange(len(group_ptr) - 1), np.diff(group_ptr))
+    return y_test, qid_test
 
-def train_ranker(X_train, y_train, qid_train, X_test, y_test, qid_test):
-    model = XGBRanker(
-        n_estimators=100, max_depth=6, learning_rate=0.1,
-        objective='rank:ndcg', random_state=42
+def build_quantile_matrices(feature_cols, test_size=0.2, random_state=42):
+    """Quantized train/test DMatrix objects shared by the baseline and the ranker.
+    
+    A sharded training table is streamed through ShardIterator, so only the
+    quantized matrix and one shard are in memory; a single table is
+    quantized from float32 arrays. Returns (dtrain, dtest, y_test, qid_test),
+    where qid_test numbers the test query groups.
+    """
+    if list_shards(FEATURE_DIR, "training_data"):
+        users = training_users()
+        test_users = choose_test_users(users, test_size, random_state)
+        train_users = np.setdiff1d(users, test_users)
+        dtrain = xgb.QuantileDMatrix(ShardIterator(feature_cols, train_users))
+        dtest = xgb.QuantileDMatrix(ShardIterator(feature_cols, np.sort(test_users)), ref=dtrain)
+    else:
+        df = load_table(FEATURE_DIR, "training_data", columns=["UserID"] + feature_cols + ["Relevance"])
+        # Same user split as the sharded path: users in order of first appearance
+        test_users = choose_test_users(df["UserID"].unique(), test_size, random_state)
+        uid, X, y = _sorted_by_user(
+            df["UserID"].to_numpy(), df[feature_cols].to_numpy(np.float32), df["Relevance"].to_numpy()
+        )
+        del df
+        is_test = np.isin(uid, test_users)
+        dtrain = xgb.QuantileDMatrix(X[~is_test], y[~is_test], qid=uid[~is_test])
+        dtest = xgb.QuantileDMatrix(X[is_test], y[is_test], qid=uid[is_test], ref=dtrain)
+    
+    return (dtrain, dtest) + _test_labels(dtest)
+
+def load_user_rows(feature_cols, users):
+    """Raw float32 features, labels and UserIDs of the given users' rows, grouped by user"""
+    parts = []
+    for shard in iter_table_shards(FEATURE_DIR, "training_data",
+                                   columns=["UserID"] + feature_cols + ["Relevance"]):
+        keep = np.isin(shard["UserID"].to_numpy(), users)
+        parts.append(_sorted_by_user(
+            shard["UserID"].to_numpy()[keep],
+            shard[feature_cols].to_numpy(np.float32)[keep],
+            shard["Relevance"].to_numpy()[keep]
+        ))
+    if not parts:
+        return np.empty((0, len(feature_cols)), np.float32), np.empty(0, np.int64), np.empty(0, np.int64)
+    uid, X, y = (np.concatenate(a) for a in zip(*parts))
+    return X, y.astype(np.int64), uid
+
+def build_update_matrices(feature_cols, update_users, test_size=0.2, random_state=42):
+    """Data for continuing a model: (dtrain, X_test, y_test, qid_test).
+
+    dtrain is a QuantileDMatrix of the training rows of update_users (None
+    when there are none). Their whole candidate lists are used, not only
+    the new ratings, since a query group needs its negatives to rank
+    against. The test rows are the held-out users of
+    build_quantile_matrices as raw float32 features: a QuantileDMatrix
+    would bin them with cuts other than those of the trees being compared.
+    """
+    users = training_users()
+    test_users = choose_test_users(users, test_size, random_state)
+    train_users = np.intersect1d(np.setdiff1d(users, test_users), update_users)
+    X_test, y_test, qid_test = load_user_rows(feature_cols, np.sort(test_users))
+    dtrain = None
+    if len(train_users):
+        dtrain = xgb.QuantileDMatrix(ShardIterator(feature_cols, train_users))
+    return dtrain, X_test, y_test, qid_test
+
+def fit_on_dmatrix(model, dtrain, dtest, init_model=None, num_boost_round=None):
+    """Train a scikit-learn XGBoost model on prebuilt DMatrix objects, keeping its hyperparameters.
+
+    With init_model, num_boost_round trees are added to a copy of its
+    booster instead of training model.n_estimators from scratch. dtest may
+    be None (it must be quantized with dtrain as reference otherwise).
+    """
+    params = {k: v for k, v in model.get_xgb_params().items() if v is not None}
+    booster = xgb.train(
+        params, dtrain, num_boost_round=num_boost_round or model.n_estimators,
+        evals=[(dtest, "test")] if dtest is not None else [], verbose_eval=False,
+        xgb_model=init_model.get_booster() if init_model is not None else None
     )
-    model.fit(X_train, y_train, qid=qid_train, 
-              eval_set=[(X_test, y_test)], eval_qid=[qid_test], verbose=False)
+    model.load_model(bytearray(booster.save_raw("ubj")))
     return model
 
-def dcg_at_k(y_true, y_scores, k=10):
-    k = min(k, len(y_true))
-    order = np.argsort(y_scores)[::-1][:k]
-    gains = y_true[order]
-    discounts = np.log2(np.arange(2, len(gains) + 2))
-    return (gains / discounts).sum()
-
-def ndcg_at_k(y_true, y_pred, k=10):
-    dcg = dcg_at_k(y_true, y_pred, k)
-    k = min(k, len(y_true))
-    ideal_order = np.argsort(y_true)[::-1][:k]
-    ideal_gains = y_true[ideal_order]
-    ideal_discounts = np.log2(np.arange(2, len(ideal_gains) + 2))
-    idcg = (ideal_gains / ideal_discounts).sum()
-    return (dcg / idcg) if idcg > 0 else 0.0
-
-def precision_at_k(y_true, y_pred, k=10):
-    k = min(k, len(y_true))
-    top_k_idx = np.argsort(y_pred)[::-1][:k]
-    return y_true[top_k_idx].sum() / k if len(y_true) > 0 else 0
-
-def recall_at_k(y_true, y_pred, k=10):
-    n_relevant = y_true.sum()
-    if n_relevant == 0:
-        return 0
-    k = min(k, len(y_true))
-    top_k_idx = np.argsort(y_pred)[::-1][:k]
-    return y_true[top_k_idx].sum() / n_relevant
-
-def evaluate_model(model, X_test, y_test, qid_test, k=10):
-    y_pred = model.predict_proba(X_test)[:, 1] if isinstance(model, XGBClassifier) else model.predict(X_test)
-    
-    test_df = pd.DataFrame({'UserID': qid_test, 'y_true': y_test, 'y_pred': y_pred})
-    metrics = []
-    
-    for user_id, group in test_df.groupby('UserID'):
-        y_true, y_pred = group['y_true'].values, group['y_pred'].values
-        if y_true.sum() == 0 or len(y_true) < k:
-            continue
-        metrics.append({
-            'precision': precision_at_k(y_true, y_pred, k),
-            'recall': recall_at_k(y_true, y_pred, k),
-            'ndcg': ndcg_at_k(y_true, y_pred, k)
-        })
-    
-    metrics_df = pd.DataFrame(metrics)
-    return {
-        'precision@10': metrics_df['precision'].mean(),
-        'recall@10': metrics_df['recall'].mean(),
-        'ndcg@10': metrics_df['ndcg'].mean()
-    }
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
 
-def save_models(baseline, ranker, feature_cols):
+def evaluate_model(model, dtest, y_test, qid_test, ks=EVAL_KS, n_workers=1):
+    # Booster output: positive-class probability for the classifier, ranking score for the ranker
+    y_pred = model.get_booster().predict(dtest)
+    return evaluate_ranking(qid_test, y_test, y_pred, ks, n_workers)
+
+def evaluate_raw(model, X_test, y_test, qid_test, ks=EVAL_KS, n_workers=1):
+    # Scores as serving computes them, from unbinned float32 features
+    y_pred = model.get_booster().inplace_predict(X_test, predict_type="value", validate_features=False)
+    return evaluate_ranking(qid_test, y_test, y_pred, ks, n_workers)
+
+def save_ranker(ranker, feature_cols):
     os.makedirs(MODEL_DIR, exist_ok=True)
-    with open(os.path.join(MODEL_DIR, "baseline_model.pkl"), "wb") as f:
-        pickle.dump(baseline, f)
     with open(os.path.join(MODEL_DIR, "ranker_model.pkl"), "wb") as f:
         pickle.dump(ranker, f)
     pd.DataFrame({"feature": feature_cols}).to_csv(
         os.path.join(MODEL_DIR, "feature_names.csv"), index=False
     )
 
-def main():
+def save_models(baseline, ranker, feature_cols):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with open(os.path.join(MODEL_DIR, "baseline_model.pkl"), "wb") as f:
+        pickle.dump(baseline, f)
+    save_ranker(ranker, feature_cols)
+
+def training_data_hash():
+    return fingerprint(
+        table_files(FEATURE_DIR, "training_data") + [os.path.join(FEATURE_DIR, "feature_names.csv")]
+    )
+
+def ratings_through(directory=PROCESSED_DIR):
+    """Newest rating timestamp in the processed ratings (what a model trained now has seen)"""
+    timestamps = load_table(directory, "ratings_processed", columns=["Timestamp"])["Timestamp"]
+    return int(timestamps.max()) if len(timestamps) else 0
+
+def users_rated_since(since, directory=PROCESSED_DIR):
+    ratings = load_table(directory, "ratings_processed", columns=["UserID", "Timestamp"])
+    return np.unique(ratings["UserID"].to_numpy()[ratings["Timestamp"].to_numpy() > since])
+
+# ----------------------------
+# Warm start
+# ----------------------------
+def warm_start_ranker(base, feature_cols, rounds=WARM_START_ROUNDS):
+    """Add rounds trees to the active ranker, trained on the users who rated since it was trained.
+
+    The continued model and the active one are evaluated on the same
+    held-out users; the continued model is saved and registered only if
+    GATE_METRIC does not drop. Returns the new version, or None.
+    """
+    since = base.manifest.get("trained_through")
+    if since is None:
+        since = datetime.fromisoformat(base.manifest["created_at"]).timestamp()
+    update_users = users_rated_since(since)
+    print(f"\nActive ranker {base.version}: {len(update_users):,} users rated since "
+          f"{datetime.fromtimestamp(since):%Y-%m-%d %H:%M:%S}")
+    
+    start = time.time()
+    with step("quantize"):
+        dtrain, X_test, y_test, qid_test = build_update_matrices(feature_cols, update_users)
+    if dtrain is None:
+        print("  No new training interactions, keeping the active ranker")
+        return None
+    print(f"Quantized data: {dtrain.num_row():,} update / {len(X_test):,} test rows "
+          f"({time.time() - start:.1f}s)")
+    
+    print(f"Adding {rounds} boosting rounds...")
+    start = time.time()
+    with step("warm_start", rows=dtrain.num_row()):
+        ranker = fit_on_dmatrix(XGBRanker(**RANKER_PARAMS), dtrain, None, init_model=base.model,
+                                num_boost_round=rounds)
+    print(f"  Trained in {time.time() - start:.1f}s")
+    
+    with step("evaluate", rows=2 * len(X_test)):
+        base_results = evaluate_raw(base.model, X_test, y_test, qid_test)
+        ranker_results = evaluate_raw(ranker, X_test, y_test, qid_test)
+    print(f"\nActive      - {GATE_METRIC}: {base_results[GATE_METRIC]:.4f}")
+    print(f"Warm-start  - {GATE_METRIC}: {ranker_results[GATE_METRIC]:.4f}")
+    if ranker_results[GATE_METRIC] < base_results[GATE_METRIC]:
+        print(f"\n✗ {GATE_METRIC} regressed, keeping the active ranker")
+        return None
+    
+    save_ranker(ranker, feature_cols)
+    return register_model(
+        ranker, feature_cols, metrics=ranker_results, data_hash=training_data_hash(),
+        parent_version=base.version, trained_through=ratings_through()
+    )
+
+def main(warm_start=None, rounds=WARM_START_ROUNDS):
     print("="*70)
     print("RANKING MODEL TRAINING")
     print("="*70)
     
-    df, feature_cols = load_training_data()
-    train_df, test_df = split_by_users(df)
+    if warm_start is None:
+        warm_start = "--warm-start" in sys.argv
+    feature_cols = pd.read_csv(os.path.join(FEATURE_DIR, "feature_names.csv"))["feature"].tolist()
     
-    X_train, y_train, qid_train = prepare_model_data(train_df, feature_cols)
-    X_test, y_test, qid_test = prepare_model_data(test_df, feature_cols)
+    if warm_start:
+        base = ServingModel.load()
+        if base is not None and isinstance(base.model, XGBRanker) and base.feature_cols == feature_cols:
+            version = warm_start_ranker(base, feature_cols, rounds)
+            if version is not None:
+                print(f"\n✓ Registered warm-started ranker version {version}")
+            print(f"  Peak RSS: {peak_rss_mb():,.0f} MB")
+            print("="*70)
+            return
+        print("\nNo active ranker with the current features, training from scratch")
+    
+    start = time.time()
+    with step("quantize") as record:
+        dtrain, dtest, y_test, qid_test = build_quantile_matrices(feature_cols)
+        record["rows"] = dtrain.num_row() + dtest.num_row()
+    print(f"\nQuantized data: {dtrain.num_row():,} train / {dtest.num_row():,} test rows "
+          f"({time.time() - start:.1f}s)")
     
     print("\nTraining baseline...")
-    baseline = train_baseline(X_train, y_train, X_test, y_test)
+    start = time.time()
+    with step("train_baseline", rows=dtrain.num_row()):
+        baseline = fit_on_dmatrix(XGBClassifier(**BASELINE_PARAMS), dtrain, dtest)
+    print(f"  Trained in {time.time() - start:.1f}s")
     
     print("Training ranker...")
-    ranker = train_ranker(X_train, y_train, qid_train, X_test, y_test, qid_test)
+    start = time.time()
+    with step("train_ranker", rows=dtrain.num_row()):
+        ranker = fit_on_dmatrix(XGBRanker(**RANKER_PARAMS), dtrain, dtest)
+    print(f"  Trained in {time.time() - start:.1f}s")
     
     print("\nEvaluating models...")
-    baseline_results = evaluate_model(baseline, X_test, y_test, qid_test)
-    ranker_results = evaluate_model(ranker, X_test, y_test, qid_test)
+    with step("evaluate", rows=2 * dtest.num_row()):
+        baseline_results = evaluate_model(baseline, dtest, y_test, qid_test)
+        ranker_results = evaluate_model(ranker, dtest, y_test, qid_test)
     
     print(f"\nBaseline - NDCG@10: {baseline_results['ndcg@10']:.4f}, "
           f"Precision@10: {baseline_results['precision@10']:.4f}")
     print(f"Ranker   - NDCG@10: {ranker_results['ndcg@10']:.4f}, "
           f"Precision@10: {ranker_results['precision@10']:.4f}")
+    print("\n" + pd.DataFrame(
+        {"baseline": baseline_results, "ranker": ranker_results}
+    ).reindex([f"{m}@{k}" for m in METRICS for k in EVAL_KS]).round(4).to_string())
     
     save_models(baseline, ranker, feature_cols)
+    version = register_model(
+        ranker, feature_cols, metrics=ranker_results, data_hash=training_data_hash(),
+        trained_through=ratings_through()
+    )
     print("\n✓ Models saved!")
+    print(f"  Registered ranker version {version}")
+    print(f"  Peak RSS: {peak_rss_mb():,.0f} MB")
     print("="*70)
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+# src/ratings_index.py
+
+import numpy as np
+
+BITSET_MAX_BYTES = 256 * 1024 * 1024
+
+class RatingsIndex:
+    """User-sorted (CSR) view of the ratings table.
+
+    The history of the user at row r lives in movie_ids[offsets[r]:offsets[r + 1]]
+    (and the matching slice of ratings), so a lookup costs O(history) instead
+    of a boolean scan over every rating. When the ratings carry a Timestamp
+    each history is in rating order, oldest first. A packed per-user seen-item
+    bitset is built as well when it fits in bitset_max_bytes.
+
+    Ratings ingested after the build are kept per user by add_rating() and
+    appended to history() / seen_mask(), so the (possibly memory-mapped,
+    read-only) arrays never change.
+    """
+
+    ARRAYS = ("user_ids", "offsets", "movie_ids", "ratings", "seen_bits", "item_ids", "user_pos", "item_pos")
+
+    def __init__(self, user_ids, offsets, movie_ids, ratings, seen_bits=None, item_ids=None,
+                 user_pos=None, item_pos=None):
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.movie_ids = movie_ids
+        self.ratings = ratings
+        self.seen_bits = seen_bits
+        self.item_ids = item_ids
+
+        if user_pos is None:
+            user_pos = np.full(int(user_ids.max(initial=0)) + 1, -1, dtype=np.int32)
+            user_pos[user_ids] = np.arange(len(user_ids), dtype=np.int32)
+        if item_pos is None and item_ids is not None:
+            item_pos = np.full(int(item_ids.max(initial=0)) + 1, -1, dtype=np.int32)
+            item_pos[item_ids] = np.arange(len(item_ids), dtype=np.int32)
+        self.user_pos = user_pos
+        self.item_pos = item_pos
+        self.added = {}
+
+    def to_arrays(self):
+        """All index arrays by name (None entries omitted), for from_arrays()"""
+        return {name: getattr(self, name) for name in self.ARRAYS if getattr(self, name) is not None}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild from to_arrays() output, e.g. memory-mapped arrays shared between processes"""
+        return cls(**{name: arrays.get(name) for name in cls.ARRAYS})
+
+    @classmethod
+    def from_ratings(cls, ratings, bitset_max_bytes=BITSET_MAX_BYTES):
+        users = ratings["UserID"].to_numpy()
+        if "Timestamp" in ratings.columns:
+            order = np.lexsort((ratings["Timestamp"].to_numpy(), users))
+        else:
+            order = np.argsort(users, kind="stable")
+        user_ids, counts = np.unique(users[order], return_counts=True)
+        offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        movie_ids = ratings["MovieID"].to_numpy()[order].astype(np.int32)
+        rating_values = ratings["Rating"].to_numpy()[order]
+
+        item_ids = np.unique(movie_ids)
+        row_bytes = (len(item_ids) + 7) // 8
+        if bitset_max_bytes <= 0 or len(user_ids) * row_bytes > bitset_max_bytes:
+            return cls(user_ids.astype(np.int32), offsets, movie_ids, rating_values)
+
+        cols = np.searchsorted(item_ids, movie_ids)
+        rows = np.repeat(np.arange(len(user_ids)), counts)
+        seen_bits = np.zeros((len(user_ids), row_bytes), dtype=np.uint8)
+        np.bitwise_or.at(seen_bits, (rows, cols >> 3), (128 >> (cols & 7)).astype(np.uint8))
+        return cls(user_ids.astype(np.int32), offsets, movie_ids, rating_values, seen_bits, item_ids)
+
+    def _row(self, user_id):
+        if 0 <= user_id < len(self.user_pos):
+            row = self.user_pos[user_id]
+            if row >= 0:
+                return row
+        return None
+
+    def __contains__(self, user_id):
+        return self._row(user_id) is not None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def add_rating(self, user_id, movie_id, rating):
+        """Record a rating made after the index was built; a re-rated movie keeps only the new rating.
+
+        The user's {movie_id: rating} dict is copied and swapped in whole, so
+        readers on other threads always see a complete one.
+        """
+        added = dict(self.added.get(user_id, {}))
+        added.pop(movie_id, None)
+        added[movie_id] = rating
+        self.added[user_id] = added
+
+    def rating(self, user_id, movie_id):
+        """Current rating of movie_id by user_id, or None"""
+        added = self.added.get(user_id)
+        if added is not None and movie_id in added:
+            return added[movie_id]
+        row = self._row(user_id)
+        if row is None:
+            return None
+        start, end = self.offsets[row], self.offsets[row + 1]
+        hits = np.flatnonzero(self.movie_ids[start:end] == movie_id)
+        return self.ratings[start + hits[-1]].item() if len(hits) else None
+
+    def history(self, user_id):
+        """(movie_ids, ratings) rated by user_id, as views into the index (copies once ratings were added)"""
+        row = self._row(user_id)
+        if row is None:
+            movie_ids, ratings = self.movie_ids[:0], self.ratings[:0]
+        else:
+            start, end = self.offsets[row], self.offsets[row + 1]
+            movie_ids, ratings = self.movie_ids[start:end], self.ratings[start:end]
+        added = self.added.get(user_id)
+        if added is not None:
+            added_movies = np.fromiter(added.keys(), dtype=movie_ids.dtype, count=len(added))
+            added_ratings = np.fromiter(added.values(), dtype=ratings.dtype, count=len(added))
+            # Re-rated movies move to the end with their new rating
+            kept = ~np.isin(movie_ids, added_movies)
+            movie_ids = np.concatenate([movie_ids[kept], added_movies])
+            ratings = np.concatenate([ratings[kept], added_ratings])
+        return movie_ids, ratings
+
+    def seen_mask(self, user_id, movie_ids):
+        """Boolean mask over movie_ids marking the movies user_id has already rated"""
+        mask = self._seen_mask(user_id, movie_ids)
+        added = self.added.get(user_id)
+        if added is not None:
+            mask |= np.isin(movie_ids, np.fromiter(added.keys(), dtype=np.int64, count=len(added)))
+        return mask
+
+    def _seen_mask(self, user_id, movie_ids):
+        movie_ids = np.asarray(movie_ids)
+        row = self._row(user_id)
+        if row is None or len(movie_ids) == 0:
+            return np.zeros(len(movie_ids), dtype=bool)
+        if self.seen_bits is None:
+            return np.isin(movie_ids, self.history(user_id)[0])
+
+        in_range = (movie_ids >= 0) & (movie_ids < len(self.item_pos))
+        cols = np.where(in_range, self.item_pos[np.where(in_range, movie_ids, 0)], -1)
+        known = cols >= 0
+        cols = np.where(known, cols, 0)
+        bits = self.seen_bits[row, cols >> 3] & (128 >> (cols & 7))
+        return known & (bits != 0)
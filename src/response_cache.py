@@ -0,0 +1,126 @@
+# src/response_cache.py
+
+import time
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = 10000
+RESPONSE_CACHE_TTL = 600
+
+class _Call:
+    """One in-flight computation that concurrent callers of the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ResponseCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL.
+
+    get_or_compute() coalesces concurrent misses on the same key: the first
+    caller computes, the others wait for its result. Memory is bounded by
+    maxsize entries; the least recently used entry is evicted first.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key, accept):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        if accept is not None and not accept(value):
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, accept=None):
+        with self._lock:
+            entry = self._lookup(key, accept)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, accept=None):
+        """Cached value for key, or compute() it once for all concurrent callers.
+
+        accept(value) can reject a cached value (e.g. one computed for a
+        smaller top_k), which then counts as a miss. None results are
+        returned but not cached.
+        """
+        with self._lock:
+            entry = self._lookup(key, accept)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            call = self._inflight.get(key)
+            owner = call is None
+            if owner:
+                call = self._inflight[key] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if accept is None or call.value is None or accept(call.value):
+                return call.value
+            return self.get_or_compute(key, compute, accept)
+
+        try:
+            call.value = compute()
+            if call.value is not None:
+                self.put(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None
+            }
@@ -0,0 +1,131 @@
+# src/scorer.py
+
+import json
+import threading
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+SMALL_BATCH_ROWS = 32
+PROBE_ROWS = 2048
+# Objectives whose "value" prediction is the raw margin, so the flat path needs no transform
+FLAT_OBJECTIVES = {"rank:ndcg", "rank:map", "rank:pairwise", "reg:squarederror"}
+
+def _flat_trees(booster):
+    """Flatten all trees into global node arrays (leaf values live in cond, left == -1 marks a leaf)"""
+    model = json.loads(booster.save_raw("json"))
+    learner = model["learner"]
+    trees = learner["gradient_booster"]["model"]["trees"]
+    sizes = np.array([len(t["left_children"]) for t in trees], dtype=np.int64)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+
+    def children(key):
+        return np.concatenate([
+            np.where(np.array(t[key]) < 0, -1, np.array(t[key]) + root) for t, root in zip(trees, roots)
+        ]).astype(np.int32)
+
+    base_score = np.float32(float(learner["learner_model_param"]["base_score"].strip("[]")))
+    return {
+        "objective": learner["objective"]["name"],
+        "is_categorical": any(any(t["split_type"]) for t in trees),
+        "roots": roots,
+        "left": children("left_children"),
+        "right": children("right_children"),
+        "feature": np.concatenate([t["split_indices"] for t in trees]).astype(np.int32),
+        "cond": np.concatenate([t["split_conditions"] for t in trees]).astype(np.float32),
+        "default_left": np.concatenate([t["default_left"] for t in trees]).astype(np.bool_),
+        "base_score": base_score,
+    }
+
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def _predict_flat(X, roots, left, right, feature, cond, default_left, base_score, out):
+        # Same float32 accumulation as XGBoost: base score, then each tree's leaf in tree order
+        for i in range(X.shape[0]):
+            acc = base_score
+            for t in range(roots.shape[0]):
+                node = roots[t]
+                while left[node] >= 0:
+                    x = X[i, feature[node]]
+                    if np.isnan(x):
+                        node = left[node] if default_left[node] else right[node]
+                    elif x < cond[node]:
+                        node = left[node]
+                    else:
+                        node = right[node]
+                acc += cond[node]
+            out[i] = acc
+        return out
+
+class RankerScorer:
+    """Serving-time scorer for the booster inside a pickled XGBoost model.
+
+    Batches of at most small_batch_rows go through a Numba traversal of the
+    flattened trees (no DMatrix, no wrapper overhead); larger batches use
+    booster.inplace_predict. The flat path is only enabled after it
+    reproduces inplace_predict bit for bit on a probe matrix built around
+    the model's split thresholds. buffer(n) hands out a per-thread float32
+    matrix that callers can fill in place.
+    """
+
+    def __init__(self, model, small_batch_rows=SMALL_BATCH_ROWS):
+        self.booster = model.get_booster() if hasattr(model, "get_booster") else model
+        self.n_features = self.booster.num_features()
+        self.small_batch_rows = small_batch_rows
+        self._local = threading.local()
+        self.flat = None
+        if numba is not None and small_batch_rows > 0:
+            flat = _flat_trees(self.booster)
+            if flat["objective"] in FLAT_OBJECTIVES and not flat["is_categorical"]:
+                self.flat = flat
+                if not self.validate():
+                    print("  ⚠️  Flat tree scorer disagrees with XGBoost; using inplace_predict only")
+                    self.flat = None
+
+    def buffer(self, n_rows):
+        """Per-thread preallocated float32 (n_rows x n_features) input matrix"""
+        buf = getattr(self._local, "buf", None)
+        if buf is None or len(buf) < n_rows:
+            buf = self._local.buf = np.empty((max(n_rows, 256), self.n_features), dtype=np.float32)
+        return buf[:n_rows]
+
+    def predict_flat(self, X):
+        f = self.flat
+        return _predict_flat(
+            X, f["roots"], f["left"], f["right"], f["feature"], f["cond"], f["default_left"],
+            f["base_score"], np.empty(len(X), dtype=np.float32)
+        )
+
+    def predict_inplace(self, X):
+        return self.booster.inplace_predict(X, predict_type="value", validate_features=False)
+
+    def __call__(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if self.flat is not None and len(X) <= self.small_batch_rows:
+            return self.predict_flat(X)
+        return self.predict_inplace(X)
+
+    def probe_matrix(self, n_rows=PROBE_ROWS, seed=0):
+        """Rows whose values sit on, just below and around the split thresholds, with some NaNs"""
+        rng = np.random.default_rng(seed)
+        f = self.flat
+        X = rng.normal(size=(n_rows, self.n_features)).astype(np.float32)
+        split = f["left"] >= 0
+        for j in range(self.n_features):
+            thresholds = f["cond"][split & (f["feature"] == j)]
+            if len(thresholds):
+                values = np.concatenate([thresholds, np.nextafter(thresholds, np.float32(-np.inf))])
+                X[:, j] = rng.choice(values, n_rows)
+        X[rng.random(X.shape) < 0.05] = np.nan
+        return X
+
+    def validate(self, X=None):
+        """True when the flat path reproduces inplace_predict exactly"""
+        if self.flat is None:
+            return True
+        X = self.probe_matrix() if X is None else np.ascontiguousarray(X, dtype=np.float32)
+        return np.array_equal(self.predict_flat(X), self.predict_inplace(X))
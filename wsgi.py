@@ -0,0 +1,9 @@
+# WSGI entry point for multi-worker serving, e.g. `gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app`
+#
+# Each worker runs init_app() itself (no --preload): the ratings index and
+# feature tables are memory-mapped from data/arena, so extra workers share
+# those pages instead of loading their own copies.
+
+from app import app, init_app
+
+init_app()